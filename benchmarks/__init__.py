@@ -0,0 +1 @@
+"""ローカルの API スタンドインと合成データを使ったベンチマーク"""
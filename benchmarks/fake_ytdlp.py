@@ -0,0 +1,144 @@
+"""
+ネットワークを使わずに合成データを書き出す yt-dlp の代わり
+
+`patch` はプロセス内で使う `YoutubeDL` を、`on_path` はリモートへのストリーミングで
+サブプロセスとして起動する yt-dlp コマンドを差し替えます。
+"""
+import os
+import stat
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+DEFAULT_SIZE = 8 << 20
+CHUNK_SIZE = 1 << 16
+
+
+def _chunks(size: int, rate: Callable[[], float | None]) -> Iterator[bytes]:
+    """
+    `size` バイトの合成データを返します。
+    `rate()` が値を返す間は、チャンクごとにその速度（バイト/秒）に合わせて待ちます。
+    """
+    chunk = bytes(range(256)) * (CHUNK_SIZE // 256)
+    due = time.perf_counter()
+    sent = 0
+    while sent < size:
+        data = chunk[: min(CHUNK_SIZE, size - sent)]
+        sent += len(data)
+        limit = rate()
+        if limit:
+            due = max(due, time.perf_counter()) + len(data) / limit
+            ahead = due - time.perf_counter()
+            if ahead > 0:
+                time.sleep(ahead)
+        yield data
+
+
+class FakeYoutubeDL:
+    """
+    `yt_dlp.YoutubeDL` の代わりに outtmpl へ合成データを書き込むクラス
+
+    `params["ratelimit"]` はダウンロード中にも参照するため、`BandwidthPool` による配分も再現できます。
+    """
+
+    size = DEFAULT_SIZE
+    ext = "mp4"
+
+    def __init__(self, params: dict[str, Any] | None = None) -> None:
+        self.params = dict(params or {})
+
+    def __enter__(self) -> "FakeYoutubeDL":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+    def download(self, urls: list[str]) -> int:
+        for _ in urls:
+            file = Path(self.params["outtmpl"].replace("%(ext)s", self.ext))
+            file.parent.mkdir(parents=True, exist_ok=True)
+            started_at = time.perf_counter()
+            downloaded = 0
+            with open(file, "wb") as f:
+                for data in _chunks(self.size, lambda: self.params.get("ratelimit")):
+                    f.write(data)
+                    downloaded += len(data)
+                    elapsed = time.perf_counter() - started_at
+                    speed = downloaded / elapsed if elapsed > 0 else None
+                    for hook in self.params.get("progress_hooks", []):
+                        hook(
+                            {
+                                "status": "downloading",
+                                "downloaded_bytes": downloaded,
+                                "total_bytes": self.size,
+                                "speed": speed,
+                                "eta": int((self.size - downloaded) / speed)
+                                if speed
+                                else None,
+                            }
+                        )
+            for hook in self.params.get("progress_hooks", []):
+                hook({"status": "finished", "filename": str(file)})
+        return 0
+
+
+@contextmanager
+def patch(size: int = DEFAULT_SIZE) -> Iterator[type[FakeYoutubeDL]]:
+    """`downloader.YoutubeDL` を `size` バイトを書き出す `FakeYoutubeDL` に差し替えます。"""
+    from src.yt_interactive_downloader.backend import downloader
+
+    fake = type("FakeYoutubeDL", (FakeYoutubeDL,), {"size": size})
+    original = downloader.YoutubeDL
+    downloader.YoutubeDL = fake  # type: ignore[misc]
+    try:
+        yield fake
+    finally:
+        downloader.YoutubeDL = original  # type: ignore[misc]
+
+
+@contextmanager
+def on_path(size: int = DEFAULT_SIZE) -> Iterator[Path]:
+    """このモジュールを yt-dlp コマンドとして呼ぶスクリプトを PATH の先頭に置きます。"""
+    root = Path(__file__).resolve().parent.parent
+    with tempfile.TemporaryDirectory() as bin:
+        script = Path(bin) / "yt-dlp"
+        script.write_text(
+            f"#!/bin/sh\ncd {root} && exec {sys.executable} -m benchmarks.fake_ytdlp"
+            f' --size {size} "$@"\n'
+        )
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+        path = os.environ.get("PATH", "")
+        os.environ["PATH"] = f"{bin}{os.pathsep}{path}"
+        try:
+            yield script
+        finally:
+            os.environ["PATH"] = path
+
+
+def main(argv: list[str] | None = None) -> None:
+    """yt-dlp の `-o -` と `--limit-rate` だけを解釈し、合成データを標準出力に書き出します。"""
+    args = list(sys.argv[1:] if argv is None else argv)
+    size = DEFAULT_SIZE
+    rate = None
+    if "--size" in args:
+        size = int(args[args.index("--size") + 1])
+    if "--limit-rate" in args:
+        rate = float(args[args.index("--limit-rate") + 1])
+    out = sys.stdout.buffer
+    sent = 0
+    for data in _chunks(size, lambda: rate):
+        out.write(data)
+        sent += len(data)
+        print(
+            f"[download] {100 * sent / size:5.1f}% of {size / (1 << 20):.2f}MiB",
+            file=sys.stderr,
+            flush=True,
+        )
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+YouTube Data API v3 の search / playlistItems / videos を真似るローカルサーバー
+
+ページング、クォータ、遅延、エラーの注入に対応しており、ベンチマークや負荷試験で
+本物の API の代わりに使います。単体でも起動できます。
+
+    python -m benchmarks.mock_api --port 8090 --latency 0.05
+
+アプリを向ける場合は YOUTUBE_API_BASE_URL=http://127.0.0.1:8090 を指定します。
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+COSTS = {"search": 100, "playlistItems": 1, "videos": 1}
+
+
+class MockYouTubeAPI:
+    """
+    YouTube Data API のスタンドイン
+
+    Parameters
+    ----------
+    total_results : int, default=500
+        検索や再生リストが返すアイテムの総数です。
+    latency : float, default=0.0
+        レスポンスを返す前に待つ時間（秒）です。
+    jitter : float, default=0.0
+        `latency` に加える 0 から `jitter` 秒のランダムな待ち時間です。
+    error_rate : float, default=0.0
+        500 / 503 を返す確率です。503 には Retry-After: 0 を付けます。
+    daily_quota : int, optional
+        消費できるクォータのユニット数です。使い切ると 403 quotaExceeded を返します。
+    seed : int, default=0
+        エラー注入と遅延の乱数のシードです。
+    host : str, default="127.0.0.1"
+    port : int, default=0
+        0 の場合は空いているポートを使います。
+    """
+
+    def __init__(
+        self,
+        total_results: int = 500,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        daily_quota: int | None = None,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.total_results = total_results
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.daily_quota = daily_quota
+        self.quota_used = 0
+        self.requests: dict[str, int] = {}
+        self.errors = 0
+        self.host = host
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), self._handler())
+        self.__server.daemon_threads = True
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.__server.server_port}"
+
+    def start(self) -> "MockYouTubeAPI":
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever, name="mock-youtube-api", daemon=True
+        )
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __enter__(self) -> "MockYouTubeAPI":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.quota_used = 0
+            self.requests = {}
+            self.errors = 0
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # ヘッダーとボディを別々に送るため、Nagle と遅延 ACK で 40ms 待たされないようにする
+            disable_nagle_algorithm = True
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                status, body, headers = api.handle(
+                    url.path.rsplit("/", 1)[-1],
+                    params,
+                    self.headers.get("If-None-Match"),
+                )
+                data = b"" if body is None else json.dumps(body).encode()
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def handle(
+        self, endpoint: str, params: dict[str, str], etag: str | None = None
+    ) -> tuple[int, dict[str, Any] | None, dict[str, str]]:
+        """1 回のリクエストに対する (ステータスコード, ボディ, ヘッダー) を返します。"""
+        with self.__lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            delay = self.latency + self.__random.uniform(0, self.jitter)
+            fail = self.__random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            cost = COSTS.get(endpoint)
+            exhausted = (
+                self.daily_quota is not None
+                and cost is not None
+                and self.quota_used + cost > self.daily_quota
+            )
+            if not (fail or exhausted) and cost is not None:
+                self.quota_used += cost
+        if delay > 0:
+            time.sleep(delay)
+        if endpoint not in COSTS:
+            return 404, _error(404, "notFound", f"unknown endpoint: {endpoint}"), {}
+        if exhausted:
+            return 403, _error(403, "quotaExceeded", "quota exceeded"), {}
+        if fail:
+            if self.__random.random() < 0.5:
+                return (
+                    503,
+                    _error(503, "backendError", "unavailable"),
+                    {"Retry-After": "0"},
+                )
+            return 500, _error(500, "backendError", "backend error"), {}
+        if "key" not in params:
+            return 400, _error(400, "keyInvalid", "API key not valid"), {}
+        if endpoint == "videos" and "id" in params:
+            ids = params["id"].split(",")
+            return 200, self._page("videos", [_video(id) for id in ids], None), {}
+        start = int(params.get("pageToken") or 0)
+        size = min(max(int(params.get("maxResults", 5)), 0), 50)
+        stop = min(start + size, self.total_results)
+        if endpoint == "search":
+            items = [_search_item(params.get("q", ""), i) for i in range(start, stop)]
+        elif endpoint == "playlistItems":
+            playlistId = params.get("playlistId", "")
+            items = [_playlist_item(playlistId, i) for i in range(start, stop)]
+        else:
+            items = [_video(f"popular{i}") for i in range(start, stop)]
+        body = self._page(
+            endpoint, items, str(stop) if stop < self.total_results else None
+        )
+        if etag is not None and etag == body["etag"]:
+            return 304, None, {"ETag": body["etag"]}
+        return 200, body, {"ETag": body["etag"]}
+
+    def _page(
+        self, endpoint: str, items: list[dict[str, Any]], nextPageToken: str | None
+    ) -> dict[str, Any]:
+        body: dict[str, Any] = {
+            "kind": f"youtube#{endpoint}ListResponse",
+            "pageInfo": {
+                "totalResults": self.total_results,
+                "resultsPerPage": len(items),
+            },
+            "items": items,
+        }
+        if nextPageToken is not None:
+            body["nextPageToken"] = nextPageToken
+        body["etag"] = hashlib.sha1(json.dumps(body).encode()).hexdigest()
+        return body
+
+
+def _error(code: int, reason: str, message: str) -> dict[str, Any]:
+    return {
+        "error": {
+            "code": code,
+            "message": message,
+            "errors": [{"reason": reason, "message": message}],
+        }
+    }
+
+
+def _snippet(title: str, i: int) -> dict[str, Any]:
+    published = f"2023-{i % 12 + 1:02d}-{i % 28 + 1:02d}T00:00:00Z"
+    return {
+        "publishedAt": published,
+        "publishTime": published,
+        "channelId": f"UC{i % 7:022d}",
+        "channelTitle": f"channel {i % 7}",
+        "title": title,
+        "description": f"description of {title} " * 4,
+    }
+
+
+def _search_item(q: str, i: int) -> dict[str, Any]:
+    videoId = hashlib.sha1(f"{q}:{i}".encode()).hexdigest()[:11]
+    return {
+        "kind": "youtube#searchResult",
+        "id": {"kind": "youtube#video", "videoId": videoId},
+        "snippet": _snippet(f"{q} #{i}", i),
+    }
+
+
+def _playlist_item(playlistId: str, i: int) -> dict[str, Any]:
+    videoId = hashlib.sha1(f"{playlistId}:{i}".encode()).hexdigest()[:11]
+    snippet = _snippet(f"{playlistId} #{i}", i)
+    snippet["resourceId"] = {"kind": "youtube#video", "videoId": videoId}
+    snippet["position"] = i
+    return {
+        "kind": "youtube#playlistItem",
+        "id": f"{playlistId}-{i}",
+        "snippet": snippet,
+        "contentDetails": {
+            "videoId": videoId,
+            "videoPublishedAt": snippet["publishedAt"],
+        },
+    }
+
+
+def _video(videoId: str) -> dict[str, Any]:
+    n = int(hashlib.sha1(videoId.encode()).hexdigest()[:8], 16)
+    return {
+        "kind": "youtube#video",
+        "id": videoId,
+        "snippet": _snippet(f"video {videoId}", n),
+        "contentDetails": {
+            "duration": f"PT{n % 60}M{n % 59}S",
+            "definition": "hd" if n % 2 else "sd",
+        },
+        "statistics": {"viewCount": str(n % 1000000), "likeCount": str(n % 10000)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--total-results", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--daily-quota", type=int, default=None)
+    args = parser.parse_args()
+    api = MockYouTubeAPI(
+        total_results=args.total_results,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        daily_quota=args.daily_quota,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"serving on {api.base_url}")
+    with api:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+ベンチマークと負荷試験
+
+本物の API やネットワークを使わず、`mock_api.MockYouTubeAPI` と `fake_ytdlp` を相手に
+ページングのスループット、キャッシュのレイテンシ、ジョブキューのスループット、
+Flask のエンドポイントの p50 / p99 を計測します。
+
+    python -m benchmarks.run                     # すべて実行して結果を保存し、baseline.json と比較する
+    python -m benchmarks.run paging cache        # 一部だけ実行する
+    python -m benchmarks.run --save-baseline     # 今回の結果を baseline.json にする
+    python -m benchmarks.run --no-compare        # baseline.json と比較しない
+
+結果は benchmarks/results/ に JSON で保存します。メトリクス名が _per_s で終わるものは大きいほど、
+_ms / _s で終わるものは小さいほど良い値として、`--threshold` を超えて悪化したものを回帰として報告します。
+計測値は環境に依存するため baseline.json はリポジトリに含めません。
+比較する環境で一度 `--save-baseline` を実行してください。baseline.json がない場合はステータス 2 で終了します。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+from .mock_api import MockYouTubeAPI
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+BASELINE = RESULTS_DIR / "baseline.json"
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """秒単位の `samples` からミリ秒単位の p50 / p95 / p99 / 平均を返します。"""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def at(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+
+    return {
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "mean_ms": statistics.fmean(samples) * 1000,
+    }
+
+
+def _client(api: MockYouTubeAPI, **kwargs: Any) -> Any:
+    from src.yt_interactive_downloader.backend import RateLimiter, YouTube
+
+    # クライアント自体の性能を測るため、リミッターでは待たせない
+    return YouTube(
+        "benchmark",
+        rate_limiter=RateLimiter(rate=1e9, burst=10**9, daily_quota=10**12),
+        base_url=api.base_url,
+        backoff_factor=0.0,
+        **kwargs,
+    )
+
+
+def bench_paging(args: argparse.Namespace) -> dict[str, Any]:
+    """search と playlistItems の全ページ取得、fetch_many の並行取得のスループット"""
+    results: dict[str, Any] = {}
+    for latency in (0.0, args.latency):
+        with MockYouTubeAPI(total_results=args.items, latency=latency) as api:
+            youtube = _client(api)
+            started_at = time.perf_counter()
+            count = sum(1 for _ in youtube.iter_search(q="benchmark", maxResults=-1))
+            elapsed = time.perf_counter() - started_at
+            results[f"search_latency_{latency * 1000:g}ms"] = {
+                "items": count,
+                "pages": api.requests.get("search", 0),
+                "items_per_s": count / elapsed,
+                "pages_per_s": api.requests.get("search", 0) / elapsed,
+            }
+            api.reset()
+            playlistIds = [f"PL{i}" for i in range(args.playlists)]
+            started_at = time.perf_counter()
+            fetched = youtube.fetch_many(playlistIds=playlistIds, max_workers=8)
+            elapsed = time.perf_counter() - started_at
+            results[f"fetch_many_latency_{latency * 1000:g}ms"] = {
+                "playlists": len(playlistIds),
+                "items": len(fetched["items"]),
+                "items_per_s": len(fetched["items"]) / elapsed,
+                "elapsed_s": elapsed,
+            }
+            youtube.close()
+    with MockYouTubeAPI(total_results=args.items, error_rate=args.error_rate) as api:
+        youtube = _client(api, max_retries=10)
+        started_at = time.perf_counter()
+        count = sum(
+            1 for _ in youtube.iter_playlist_items(playlistId="PL", maxResults=-1)
+        )
+        elapsed = time.perf_counter() - started_at
+        results[f"playlist_error_rate_{args.error_rate:g}"] = {
+            "items": count,
+            "injected_errors": api.errors,
+            "items_per_s": count / elapsed,
+        }
+        youtube.close()
+    return results
+
+
+def bench_cache(args: argparse.Namespace) -> dict[str, Any]:
+    """ResponseCache の読み書きと、キャッシュの有無による API 呼び出しのレイテンシ"""
+    from src.yt_interactive_downloader.backend import ResponseCache
+
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as temp:
+        cache = ResponseCache(Path(temp) / "cache.sqlite3", max_entries=args.requests)
+        value = {
+            "items": [{"id": i, "snippet": {"title": "x" * 100}} for i in range(50)]
+        }
+        params = [{"q": f"query {i}", "pageToken": None} for i in range(args.requests)]
+        writes = []
+        for p in params:
+            started_at = time.perf_counter()
+            cache.set("search", p, value)
+            writes.append(time.perf_counter() - started_at)
+        hits = []
+        for p in params:
+            started_at = time.perf_counter()
+            cache.get("search", p)
+            hits.append(time.perf_counter() - started_at)
+        misses = []
+        for i in range(args.requests):
+            started_at = time.perf_counter()
+            cache.get("search", {"q": f"missing {i}"})
+            misses.append(time.perf_counter() - started_at)
+        results["set"] = percentiles(writes)
+        results["hit"] = percentiles(hits)
+        results["miss"] = percentiles(misses)
+
+        with MockYouTubeAPI(latency=args.latency) as api:
+            youtube = _client(api, cache=cache)
+            cache.clear()
+            for name in ("uncached", "cached"):
+                samples = []
+                for i in range(50):
+                    started_at = time.perf_counter()
+                    youtube.fetch_videos(id=f"v{i}", part="contentDetails")
+                    samples.append(time.perf_counter() - started_at)
+                results[f"fetch_videos_{name}"] = percentiles(samples)
+            youtube.close()
+        cache.close()
+    return results
+
+
+def _noop(job: Any, videoId: str) -> None:
+    """キュー自体のオーバーヘッドを測るための何もしないタスク"""
+
+
+def bench_jobs(args: argparse.Namespace) -> dict[str, Any]:
+    """JobQueue のオーバーヘッドと、合成データのダウンロードのスループット"""
+    from src.yt_interactive_downloader.backend import Job, JobQueue
+    from src.yt_interactive_downloader.backend.downloader import (
+        _stream_ytdlp,
+        download_video,
+    )
+
+    from .fake_ytdlp import on_path, patch
+
+    results: dict[str, Any] = {}
+    for workers in (1, 4):
+        queue = JobQueue(max_workers=workers)
+        started_at = time.perf_counter()
+        submitted = [queue.submit(_noop, f"v{i}") for i in range(args.jobs)]
+        _wait(lambda: queue.counts()["finished"] == len(submitted))
+        elapsed = time.perf_counter() - started_at
+        finished = [queue.get(job.id) for job in submitted]
+        results[f"noop_workers_{workers}"] = {
+            "jobs": args.jobs,
+            "jobs_per_s": args.jobs / elapsed,
+            "latency": percentiles(
+                [job.finished_at - job.created_at for job in finished if job]  # type: ignore[operator]
+            ),
+        }
+        queue.shutdown()
+
+    size = args.download_size
+    with tempfile.TemporaryDirectory() as temp, patch(size=size):
+        for workers in (1, 4):
+            queue = JobQueue(max_workers=workers)
+            count = workers * 4
+            started_at = time.perf_counter()
+            batch = queue.submit_batch(
+                download_video,
+                [f"w{workers}v{i}" for i in range(count)],
+                concurrency=workers,
+                path_to_download=temp,
+            )
+            _wait(lambda: batch.to_dict()["status"] != "running")
+            elapsed = time.perf_counter() - started_at
+            status = batch.to_dict()
+            results[f"download_workers_{workers}"] = {
+                "downloads": count,
+                "failed": status["counts"]["failed"],
+                "downloads_per_s": count / elapsed,
+                "mib_per_s": count * size / elapsed / (1 << 20),
+            }
+            queue.shutdown()
+
+    with on_path(size=size):
+        job = Job("stream")
+        started_at = time.perf_counter()
+        streamed = sum(len(chunk) for chunk in _stream_ytdlp(job, ["stream"]))
+        elapsed = time.perf_counter() - started_at
+        results["stream"] = {
+            "bytes": streamed,
+            "mib_per_s": streamed / elapsed / (1 << 20),
+        }
+    return results
+
+
+def _wait(done: Callable[[], bool], timeout: float = 300) -> None:
+    deadline = time.monotonic() + timeout
+    while not done():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark did not finish in time")
+        time.sleep(0.001)
+
+
+def bench_endpoints(args: argparse.Namespace) -> dict[str, Any]:
+    """Flask のエンドポイントに `--concurrency` 本の接続で負荷をかけたときのレイテンシ"""
+    import requests
+    from werkzeug.serving import make_server
+
+    results: dict[str, Any] = {}
+    with MockYouTubeAPI(
+        latency=args.latency
+    ) as api, tempfile.TemporaryDirectory() as temp:
+        os.environ["DATA_DIR"] = temp
+        os.environ["YOUTUBE_API"] = "benchmark"
+        os.environ["YOUTUBE_API_BASE_URL"] = api.base_url
+        os.environ["YOUTUBE_DAILY_QUOTA"] = str(10**12)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        from src.yt_interactive_downloader.frontend.app import create_app
+
+        app = create_app()
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        form = {"query": "benchmark", "maxResults": "30", "topic": "any"}
+        scenarios: dict[str, Callable[[requests.Session], requests.Response]] = {
+            "index": lambda s: s.get(f"{base}/"),
+            "search_first_page": lambda s: s.post(f"{base}/", data=form),
+            "search_next_page": lambda s: s.get(
+                f"{base}/search", params={**form, "loaded": "20"}
+            ),
+            "jobs": lambda s: s.get(f"{base}/jobs"),
+            "quota": lambda s: s.get(f"{base}/quota"),
+        }
+        try:
+            for name, request in scenarios.items():
+                results[name] = _load(request, args.concurrency, args.requests)
+        finally:
+            server.shutdown()
+            app.extensions["yt_interactive_downloader"].close()
+    return results
+
+
+def _load(
+    request: Callable[[Any], Any], concurrency: int, total: int
+) -> dict[str, Any]:
+    import requests
+
+    def worker(n: int) -> tuple[list[float], int]:
+        samples = []
+        errors = 0
+        with requests.Session() as session:
+            request(session)  # 接続とキャッシュを温める
+            for _ in range(n):
+                started_at = time.perf_counter()
+                res = request(session)
+                samples.append(time.perf_counter() - started_at)
+                errors += res.status_code >= 400
+        return samples, errors
+
+    per_worker = max(1, total // concurrency)
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(worker, [per_worker] * concurrency))
+    elapsed = time.perf_counter() - started_at
+    samples = [sample for worker_samples, _ in outcomes for sample in worker_samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(errors for _, errors in outcomes),
+        "requests_per_s": len(samples) / elapsed,
+        **percentiles(samples),
+    }
+
+
+BENCHMARKS: dict[str, Callable[[argparse.Namespace], dict[str, Any]]] = {
+    "paging": bench_paging,
+    "cache": bench_cache,
+    "jobs": bench_jobs,
+    "endpoints": bench_endpoints,
+}
+
+
+def flatten(results: dict[str, Any], prefix: str = "") -> dict[str, float]:
+    flat: dict[str, float] = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(
+    current: dict[str, Any], baseline: dict[str, Any], threshold: float
+) -> list[str]:
+    """`threshold` の割合を超えて悪化したメトリクスを説明する文字列を返します。"""
+    regressions = []
+    old = flatten(baseline["results"])
+    for name, value in flatten(current["results"]).items():
+        if name not in old or old[name] == 0:
+            continue
+        if name.endswith("_per_s"):
+            change = (old[name] - value) / old[name]
+        elif name.endswith(("_ms", "_s")):
+            change = (value - old[name]) / old[name]
+        else:
+            continue
+        if change > threshold:
+            regressions.append(
+                f"{name}: {old[name]:.3f} -> {value:.3f} ({change:+.0%})"
+            )
+    return regressions
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="ローカルの API スタンドインを使ったベンチマークと負荷試験",
+    )
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"実行するベンチマーク: {', '.join(BENCHMARKS)}"
+    )
+    parser.add_argument("--items", type=int, default=1000, help="検索や再生リストのアイテム数")
+    parser.add_argument("--playlists", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="API の遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--download-size", type=int, default=4 << 20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--no-compare", action="store_true", help="baseline.json と比較しない"
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = BENCHMARKS[name](args)
+    report = {
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+        },
+        "results": results,
+    }
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    output = args.output or RESULTS_DIR / (
+        datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(json.dumps(results, indent=2))
+    print(f"saved to {output}", file=sys.stderr)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"saved baseline to {args.baseline}", file=sys.stderr)
+        return 0
+    if args.no_compare:
+        return 0
+    if not args.baseline.exists():
+        print(
+            f"error: no baseline at {args.baseline}; run with --save-baseline on this"
+            " machine first, or pass --no-compare",
+            file=sys.stderr,
+        )
+        return 2
+    regressions = compare(report, json.loads(args.baseline.read_text()), args.threshold)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,23 @@
-from .youtube import YouTube
+from .cache import ResponseCache
+from .index import VideoIndex
+from .jobs import Batch, Job, JobCancelled, JobQueue
+from .library import Library
+from .ratelimit import QuotaExceededError, RateLimiter
+from .sync import PlaylistSync
+from .youtube import YouTube, YouTubeAPIError, video_id_of
 
-__all__ = ["YouTube"]
+__all__ = [
+    "Batch",
+    "Job",
+    "JobCancelled",
+    "JobQueue",
+    "Library",
+    "PlaylistSync",
+    "QuotaExceededError",
+    "RateLimiter",
+    "ResponseCache",
+    "VideoIndex",
+    "YouTube",
+    "YouTubeAPIError",
+    "video_id_of",
+]
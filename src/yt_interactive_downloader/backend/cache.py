@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+class ResponseCache:
+    """
+    YouTube Data API のレスポンスを保存する SQLite ベースのキャッシュ
+
+    Parameters
+    ----------
+    path : str or Path, default=":memory:"
+        キャッシュを保存する SQLite ファイルのパスです。再起動後もキャッシュを残したい場合はファイルを指定します。
+    ttl : float, default=86400
+        エントリの有効期間（秒）です。
+    max_entries : int, default=10000
+        保存するエントリの最大数です。超えた場合は最も長く参照されていないものから削除します。
+    """
+
+    IGNORED_PARAMS: tuple[str, ...] = ("key",)
+
+    def __init__(
+        self,
+        path: str | Path = ":memory:",
+        ttl: float = 86400,
+        max_entries: int = 10000,
+    ) -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.__conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at"
+            " ON responses (accessed_at)"
+        )
+        self.__conn.commit()
+
+    @classmethod
+    def make_key(cls, endpoint: str, params: dict[str, Any]) -> str:
+        normalized = {
+            key: str(value)
+            for key, value in params.items()
+            if value is not None and key not in cls.IGNORED_PARAMS
+        }
+        raw = json.dumps([endpoint, normalized], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint: str, params: dict[str, Any]) -> dict[str, Any] | None:
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self.__conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.__conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, endpoint: str, params: dict[str, Any], value: dict[str, Any]) -> None:
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self.__lock:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self.__conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+            )
+            self.__conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self.__conn.commit()
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__conn.execute("DELETE FROM responses")
+            self.__conn.commit()
+
+    def stats(self) -> dict[str, Any]:
+        with self.__lock:
+            (size,) = self.__conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
@@ -0,0 +1,434 @@
+import hashlib
+import logging
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, TypedDict
+
+import ffmpeg
+from yt_dlp import YoutubeDL
+
+from .jobs import Job
+from .metrics import DOWNLOAD_BYTES
+from .sinks import CHUNK_SIZE, LocalSink, Sink, SSHSink, file_chunks
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_PATTERN = re.compile(
+    r"\[download\]\s+(?P<percent>\d+(?:\.\d+)?)%"
+    r"(?:\s+of\s+~?\s*(?P<total>[\d.]+\s*\w+))?"
+    r"(?:\s+at\s+(?P<speed>[\d.]+\s*\w+)/s)?"
+    r"(?:\s+ETA\s+(?P<eta>[\d:]+))?"
+)
+SIZE_UNITS = {
+    "B": 1,
+    "KiB": 1 << 10,
+    "MiB": 1 << 20,
+    "GiB": 1 << 30,
+    "KB": 1000,
+    "MB": 1000**2,
+    "GB": 1000**3,
+}
+EMBED_OPTIONS: dict[str, Any] = {
+    "writesubtitles": True,
+    "subtitleslangs": ["ja"],
+    "writethumbnail": True,
+    "postprocessors": [
+        {"key": "FFmpegEmbedSubtitle", "already_have_subtitle": False},
+        {"key": "FFmpegMetadata", "add_chapters": True, "add_metadata": True},
+        {"key": "EmbedThumbnail", "already_have_thumbnail": False},
+    ],
+}
+
+# ratelimit はプロファイルごとの帯域の上限（バイト/秒）で、全体の上限の配分より優先されます
+PROFILES: dict[str, dict[str, Any]] = {
+    # 単一ファイルの mp4。リモートへはそのままストリーミングできます
+    "mp4": {"format": "mp4", "ext": "mp4", "concurrent_fragment_downloads": 1},
+    # 最高画質の映像と音声を ffmpeg で結合します
+    "best": {
+        "format": "bv*+ba/b",
+        "merge_output_format": "mp4",
+        "ext": "mp4",
+        "concurrent_fragment_downloads": 8,
+    },
+    "1080p": {
+        "format": "bv*[height<=1080]+ba/b[height<=1080]",
+        "merge_output_format": "mp4",
+        "ext": "mp4",
+        "concurrent_fragment_downloads": 8,
+    },
+    "720p": {
+        "format": "bv*[height<=720]+ba/b[height<=720]",
+        "merge_output_format": "mp4",
+        "ext": "mp4",
+        "concurrent_fragment_downloads": 4,
+    },
+    "audio": {
+        "format": "ba[ext=m4a]/ba/b",
+        "ext": "m4a",
+        "concurrent_fragment_downloads": 4,
+        # 音声だけなら 1 MiB/s で十分なため、映像のダウンロードに帯域を残す
+        "ratelimit": 1 << 20,
+        "postprocessors": [
+            {"key": "FFmpegExtractAudio", "preferredcodec": "m4a"},
+        ],
+    },
+}
+
+
+class BandwidthPool:
+    """
+    実行中のダウンロードで帯域の上限を分け合うためのプール
+
+    yt-dlp は ``ratelimit`` をダウンロード中にも参照するため、ダウンロードが増減するたびに
+    登録されているオプションの ``ratelimit`` を配り直します。
+    上限 (`cap`) のあるダウンロードが使い切らない分は、他のダウンロードに均等に配ります。
+    複数のプロセスで上限を分け合う場合は `share_with` を呼びます。
+
+    Parameters
+    ----------
+    limit : float, optional
+        全体の帯域の上限（バイト/秒）です。None の場合は制限しません。
+    """
+
+    def __init__(self, limit: float | None = None) -> None:
+        self.limit = limit
+        self.__members: list[tuple[dict[str, Any], float | None]] = []
+        self.__share: Callable[[], float] | None = None
+        self.__lock = threading.Lock()
+
+    def _rebalance(self) -> None:
+        if self.limit is None:
+            for options, cap in self.__members:
+                options["ratelimit"] = cap
+            return
+        share = 1.0
+        if self.__share is not None and self.__members:
+            # 割合が分からない間は、このプロセスだけで上限を使う
+            share = self.__share() or 1.0
+        remaining = self.limit * share
+        members = sorted(
+            self.__members,
+            key=lambda member: float("inf") if member[1] is None else member[1],
+        )
+        for i, (options, cap) in enumerate(members):
+            share = remaining / (len(members) - i)
+            options["ratelimit"] = share if cap is None else min(share, cap)
+            remaining -= options["ratelimit"]
+
+    def share_with(self, share: Callable[[], float], interval: float = 1.0) -> None:
+        """
+        上限を他のプロセスと分け合います。
+
+        このプロセスには上限に `share()` を掛けた帯域を配ります。
+        他のプロセスのダウンロードの増減も反映するため、`interval` 秒ごとに配り直します。
+        """
+        with self.__lock:
+            started = self.__share is not None
+            self.__share = share
+        if started:
+            return
+
+        def rebalance() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    with self.__lock:
+                        if self.__members:
+                            self._rebalance()
+                except Exception:
+                    logger.exception("failed to rebalance the bandwidth")
+
+        threading.Thread(target=rebalance, name="bandwidth", daemon=True).start()
+
+    @contextmanager
+    def register(
+        self, options: dict[str, Any], cap: float | None = None
+    ) -> Iterator[dict[str, Any]]:
+        member = (options, cap)
+        with self.__lock:
+            self.__members.append(member)
+            self._rebalance()
+        try:
+            yield options
+        finally:
+            with self.__lock:
+                # 同じ内容のオプションを区別するため、同一性で取り除く
+                self.__members = [m for m in self.__members if m is not member]
+                self._rebalance()
+
+
+bandwidth = BandwidthPool()
+
+
+def _profile_options(profile: str) -> dict[str, Any]:
+    if profile not in PROFILES:
+        raise ValueError(f"unknown profile: {profile}")
+    options = {key: value for key, value in PROFILES[profile].items() if key != "ext"}
+    needs_ffmpeg = "merge_output_format" in options or "postprocessors" in options
+    if needs_ffmpeg and shutil.which("ffmpeg") is None:
+        raise RuntimeError(f"ffmpeg is required for the `{profile}` profile")
+    embed = EMBED_OPTIONS
+    if PROFILES[profile]["ext"] != "mp4":
+        # 音声のみのファイルには字幕を埋め込めない
+        embed = {
+            **EMBED_OPTIONS,
+            "writesubtitles": False,
+            "postprocessors": [
+                pp
+                for pp in EMBED_OPTIONS["postprocessors"]
+                if pp["key"] != "FFmpegEmbedSubtitle"
+            ],
+        }
+    return {
+        **embed,
+        **options,
+        "postprocessors": options.get("postprocessors", []) + embed["postprocessors"],
+    }
+
+
+def _verify(file: Path, profile: str) -> None:
+    """結合や変換をしたファイルに必要なストリームが含まれているか ffprobe で確認します。"""
+    if "merge_output_format" not in PROFILES[profile]:
+        return
+    streams = {stream["codec_type"] for stream in ffmpeg.probe(str(file))["streams"]}
+    if not {"video", "audio"} <= streams:
+        raise RuntimeError(f"{file.name} is missing streams: {sorted(streams)}")
+
+
+def _parse_size(string: str | None) -> float | None:
+    if string is None:
+        return None
+    match = re.fullmatch(r"([\d.]+)\s*(\w+)", string)
+    if match is None or match.group(2) not in SIZE_UNITS:
+        return None
+    return float(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def _parse_eta(string: str | None) -> int | None:
+    if string is None:
+        return None
+    seconds = 0
+    for part in string.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def _watch_progress(job: Job, stream: Iterable[str]) -> None:
+    for line in stream:
+        match = PROGRESS_PATTERN.search(line)
+        if match is not None:
+            progress = float(match.group("percent"))
+            total = _parse_size(match.group("total"))
+            job.update(
+                progress=progress,
+                total_bytes=total,
+                downloaded_bytes=None if total is None else total * progress / 100,
+                speed=_parse_size(match.group("speed")),
+                eta=_parse_eta(match.group("eta")),
+            )
+
+
+class _FileProgress(TypedDict):
+    filename: str | None
+    downloaded: int
+
+
+def _progress_hook(job: Job) -> Callable[[dict[str, Any]], None]:
+    # 映像と音声を別々にダウンロードする場合はファイルごとに downloaded_bytes が 0 から始まる
+    last: _FileProgress = {"filename": None, "downloaded": 0}
+
+    def hook(d: dict[str, Any]) -> None:
+        # 例外は yt-dlp を通ってそのまま呼び出し元に伝わる
+        job.check_cancelled()
+        if d["status"] != "downloading":
+            return
+        downloaded = d.get("downloaded_bytes") or 0
+        if d.get("filename") != last["filename"]:
+            last["filename"] = d.get("filename")
+            last["downloaded"] = 0
+        if downloaded > last["downloaded"]:
+            DOWNLOAD_BYTES.inc(downloaded - last["downloaded"])
+            last["downloaded"] = downloaded
+        total = d.get("total_bytes") or d.get("total_bytes_estimate")
+        job.update(
+            progress=100 * downloaded / total if total else job.progress,
+            downloaded_bytes=downloaded,
+            total_bytes=total,
+            speed=d.get("speed"),
+            eta=d.get("eta"),
+        )
+
+    return hook
+
+
+def _run_ytdlp(job: Job, url: str, options: dict[str, Any]) -> None:
+    """yt-dlp をプロセス内で実行し、失敗した場合は例外を送出します。"""
+    options = {
+        "quiet": True,
+        "noprogress": True,
+        "progress_hooks": [_progress_hook(job)],
+        **options,
+    }
+    with YoutubeDL(options) as ydl:
+        with bandwidth.register(ydl.params, options.get("ratelimit")):
+            if ydl.download([url]) != 0:
+                raise RuntimeError(f"yt-dlp failed to download {url}")
+
+
+def _throttle(job: Job, limits: dict[str, Any], size: int, due: float) -> float:
+    """
+    `limits["ratelimit"]` の速度を超えないように待ち、次のチャンクを読み込んでよい時刻を返します。
+    待っている間もキャンセルを確認します。
+    """
+    rate = limits.get("ratelimit")
+    now = time.monotonic()
+    if rate is None:
+        return now
+    due = max(due, now) + size / rate
+    while (delay := due - time.monotonic()) > 0:
+        job.check_cancelled()
+        time.sleep(min(delay, 0.5))
+    return due
+
+
+def _stream_ytdlp(
+    job: Job, args: list[str], cap: float | None = None
+) -> Iterator[bytes]:
+    """
+    yt-dlp の標準出力に書き出された動画データを順に返します。
+
+    プロセス内の yt-dlp はバイト列を直接受け取れないため、ここだけはサブプロセスを使います。
+    サブプロセスの ratelimit は後から変えられないため、ダウンロード中は `bandwidth` に登録し、
+    配分された速度で標準出力を読み込みます。読み込みが遅れるとパイプが詰まり、yt-dlp も同じ速度に落ちます。
+    """
+    proc = subprocess.Popen(
+        ["yt-dlp", "--newline", *args, "-o", "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert proc.stdout is not None and proc.stderr is not None
+    watcher = threading.Thread(
+        target=_watch_progress,
+        args=(job, (line.decode(errors="replace") for line in proc.stderr)),
+        daemon=True,
+    )
+    watcher.start()
+    finished = False
+    try:
+        with bandwidth.register({}, cap) as limits:
+            due = time.monotonic()
+            while chunk := proc.stdout.read(CHUNK_SIZE):
+                job.check_cancelled()
+                DOWNLOAD_BYTES.inc(len(chunk))
+                yield chunk
+                due = _throttle(job, limits, len(chunk), due)
+        finished = True
+    finally:
+        if not finished:
+            proc.kill()
+        proc.stdout.close()
+        watcher.join()
+    if proc.wait() != 0:
+        raise RuntimeError(f"yt-dlp exited with status {proc.returncode}")
+    logger.debug("yt-dlp stream finished", extra={"job": job.id})
+
+
+def download_video(
+    job: Job,
+    videoId: str,
+    server: str = "",
+    path_to_download: str = ".",
+    profile: str = "mp4",
+) -> dict[str, Any]:
+    """
+    動画をダウンロードします。`server` が指定された場合は ssh でリモートに書き込みます。
+
+    "mp4" のリモートへのダウンロードは yt-dlp の出力をそのまま ssh に流すため、ローカルのディスクを使わず、
+    字幕やサムネイルも埋め込みません。映像と音声の結合や変換にはファイルが必要なため、
+    "mp4" 以外のプロファイルの場合はジョブごとの一時ディレクトリにダウンロードしてから転送します。
+
+    Parameters
+    ----------
+    job : Job
+        進捗を報告するジョブです。
+    videoId : str
+        ダウンロードする動画の ID です。
+    server : str, default=""
+        転送先のサーバー名です。空文字列の場合はローカルに保存します。
+    path_to_download : str, default="."
+        保存先のディレクトリです。
+    profile : str, default="mp4"
+        `PROFILES` のいずれかのフォーマット プロファイルです。
+
+    Returns
+    -------
+    dict
+        保存先、ファイル名、サイズ、SHA-256 を持つ辞書です。
+    """
+    if path_to_download == "":
+        path_to_download = "."
+    options = _profile_options(profile)
+    url = f"https://www.youtube.com/watch?v={videoId}"
+    stem = videoId if profile == "mp4" else f"{videoId}-{profile}"
+    name = f"{stem}.{PROFILES[profile]['ext']}"
+    sink: Sink
+    if server == "":
+        sink = LocalSink(path_to_download)
+        sink.path.mkdir(parents=True, exist_ok=True)
+        _run_ytdlp(
+            job,
+            url,
+            {**options, "outtmpl": str(sink.path / f"{stem}.%(ext)s")},
+        )
+        _verify(sink.path / name, profile)
+        size = 0
+        sha256 = hashlib.sha256()
+        for chunk in file_chunks(sink.path / name):
+            sha256.update(chunk)
+            size += len(chunk)
+        digest = sha256.hexdigest()
+    else:
+        sink = SSHSink(server, path_to_download)
+        if profile != "mp4":
+            temp = Path(tempfile.mkdtemp(prefix=f"{job.id}-"))
+            try:
+                _run_ytdlp(
+                    job,
+                    url,
+                    {
+                        **EMBED_OPTIONS,
+                        **options,
+                        "outtmpl": str(temp / f"{stem}.%(ext)s"),
+                    },
+                )
+                _verify(temp / name, profile)
+                job.update(message="uploading")
+                size, digest = sink.write(name, file_chunks(temp / name))
+            finally:
+                shutil.rmtree(temp, ignore_errors=True)
+        else:
+            args = [url, "-f", options["format"]]
+            size, digest = sink.write(
+                name, _stream_ytdlp(job, args, options.get("ratelimit"))
+            )
+    logger.info(
+        "downloaded %s to %s:%s (%d bytes)",
+        name,
+        sink.location,
+        path_to_download,
+        size,
+        extra={"job": job.id, "size": size},
+    )
+    return {
+        "location": sink.location,
+        "path": path_to_download,
+        "name": name,
+        "size": size,
+        "sha256": digest,
+    }
@@ -0,0 +1,434 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Final, Iterable
+
+from .youtube import video_id_of
+
+DURATION_PATTERN = re.compile(r"P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?")
+
+PLAYLIST_ITEM_DETAILS = ("videoId", "videoPublishedAt", "note", "startAt", "endAt")
+
+
+def parse_duration(string: str | None) -> int | None:
+    """ "PT1H2M3S" のような ISO 8601 の再生時間を秒数に変換します。"""
+    if not string:
+        return None
+    match = DURATION_PATTERN.fullmatch(string)
+    if match is None:
+        return None
+    days, hours, minutes, seconds = (int(value or 0) for value in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _int(value: Any) -> int | None:
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalize(item: dict[str, Any], videoId: str) -> dict[str, Any]:
+    """
+    search / playlistItems / videos のリソースを、検索結果と同じ形のアイテムに揃えます。
+    """
+    snippet = dict(item.get("snippet", {}))
+    if item.get("kind") == "youtube#playlistItem":
+        # 再生リストのアイテムの channelTitle は再生リストの所有者なので、動画の所有者に置き換える
+        snippet["channelId"] = snippet.get(
+            "videoOwnerChannelId", snippet.get("channelId")
+        )
+        snippet["channelTitle"] = snippet.get(
+            "videoOwnerChannelTitle", snippet.get("channelTitle")
+        )
+        published = item.get("contentDetails", {}).get("videoPublishedAt")
+        if published is not None:
+            snippet["publishedAt"] = published
+        for key in ("playlistId", "position", "resourceId"):
+            snippet.pop(key, None)
+    snippet.setdefault("publishTime", snippet.get("publishedAt"))
+    normalized: dict[str, Any] = {
+        "kind": "youtube#searchResult",
+        "id": {"kind": "youtube#video", "videoId": videoId},
+        "snippet": snippet,
+    }
+    details = dict(item.get("contentDetails", {}))
+    if item.get("kind") == "youtube#playlistItem":
+        # enrich されていない再生リストのアイテムの contentDetails は動画の情報ではない
+        for key in PLAYLIST_ITEM_DETAILS:
+            details.pop(key, None)
+    if details:
+        normalized["contentDetails"] = details
+    if "statistics" in item:
+        normalized["statistics"] = item["statistics"]
+    return normalized
+
+
+class VideoIndex:
+    """
+    取得済みの動画のメタデータを SQLite FTS5 で全文検索できるようにするローカルインデックス
+
+    search / playlistItems / videos のレスポンスのアイテムを `add` で保存し、
+    API では指定できない再生時間の範囲や概要のキーワードなどの条件を組み合わせて検索し、並べ替えます。
+    `record` で API の検索ごとに取得済みの結果を記録しておくと、同じ検索を `coverage` で確認し、
+    `search(within=...)` で API を呼ばずに返せます。
+
+    全文検索は日本語を分かち書きせずに扱えるよう trigram で索引を作ります。
+    そのため 3 文字未満の語は索引を使わずに部分一致で探します。
+
+    Parameters
+    ----------
+    path : str or Path, default=":memory:"
+        インデックスを保存する SQLite ファイルのパスです。
+    ttl : float, default=86400
+        記録した検索結果を最新とみなす期間（秒）です。
+    """
+
+    # 並べ替えの名前と ORDER BY 句。relevance は API の検索結果の順序か、全文検索のスコア
+    ORDERS: Final[dict[str, str]] = {
+        "date": "videos.published_at DESC",
+        "rating": "videos.like_count DESC",
+        "title": "videos.title COLLATE NOCASE",
+        "viewCount": "videos.view_count DESC",
+        "duration": "videos.duration DESC",
+        "-duration": "videos.duration",
+    }
+
+    def __init__(self, path: str | Path = ":memory:", ttl: float = 86400) -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS videos (
+                rowid INTEGER PRIMARY KEY,
+                video_id TEXT NOT NULL UNIQUE,
+                title TEXT,
+                description TEXT,
+                channel_id TEXT,
+                channel_title TEXT,
+                published_at TEXT,
+                duration INTEGER,
+                view_count INTEGER,
+                like_count INTEGER,
+                caption TEXT,
+                definition TEXT,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS videos_published_at ON videos (published_at);
+            CREATE INDEX IF NOT EXISTS videos_channel_id ON videos (channel_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5 (
+                title,
+                description,
+                channel_title,
+                content='videos',
+                content_rowid='rowid',
+                tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS videos_ai AFTER INSERT ON videos BEGIN
+                INSERT INTO videos_fts (rowid, title, description, channel_title)
+                VALUES (new.rowid, new.title, new.description, new.channel_title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS videos_ad AFTER DELETE ON videos BEGIN
+                INSERT INTO videos_fts (videos_fts, rowid, title, description, channel_title)
+                VALUES ('delete', old.rowid, old.title, old.description, old.channel_title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS videos_au AFTER UPDATE ON videos BEGIN
+                INSERT INTO videos_fts (videos_fts, rowid, title, description, channel_title)
+                VALUES ('delete', old.rowid, old.title, old.description, old.channel_title);
+                INSERT INTO videos_fts (rowid, title, description, channel_title)
+                VALUES (new.rowid, new.title, new.description, new.channel_title);
+            END;
+            CREATE TABLE IF NOT EXISTS searches (
+                key TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                fetched INTEGER NOT NULL,
+                total_results INTEGER,
+                next_page_token TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS search_results (
+                key TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                video_id TEXT NOT NULL,
+                PRIMARY KEY (key, position),
+                UNIQUE (key, video_id)
+            );
+            """
+        )
+        self.__conn.commit()
+
+    def add(self, items: Iterable[dict[str, Any]]) -> int:
+        """
+        アイテムを保存し、保存した動画の数を返します。動画以外のアイテムは無視します。
+
+        既に保存されている動画は、新しいアイテムのプロパティで上書きしたうえで
+        contentDetails と statistics などの他のプロパティを残します。
+        """
+        now = time.time()
+        count = 0
+        with self.__lock:
+            for item in items:
+                videoId = video_id_of(item)
+                if videoId is None:
+                    continue
+                new = _normalize(item, videoId)
+                row = self.__conn.execute(
+                    "SELECT data FROM videos WHERE video_id = ?", (videoId,)
+                ).fetchone()
+                data = new if row is None else {**json.loads(row[0]), **new}
+                snippet = data["snippet"]
+                details = data.get("contentDetails", {})
+                statistics = data.get("statistics", {})
+                self.__conn.execute(
+                    """
+                    INSERT INTO videos (video_id, title, description, channel_id,
+                        channel_title, published_at, duration, view_count, like_count,
+                        caption, definition, data, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (video_id) DO UPDATE SET
+                        title = excluded.title,
+                        description = excluded.description,
+                        channel_id = excluded.channel_id,
+                        channel_title = excluded.channel_title,
+                        published_at = excluded.published_at,
+                        duration = excluded.duration,
+                        view_count = excluded.view_count,
+                        like_count = excluded.like_count,
+                        caption = excluded.caption,
+                        definition = excluded.definition,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                    """,
+                    (
+                        videoId,
+                        snippet.get("title"),
+                        snippet.get("description"),
+                        snippet.get("channelId"),
+                        snippet.get("channelTitle"),
+                        snippet.get("publishedAt"),
+                        parse_duration(details.get("duration")),
+                        _int(statistics.get("viewCount")),
+                        _int(statistics.get("likeCount")),
+                        details.get("caption"),
+                        details.get("definition"),
+                        json.dumps(data, ensure_ascii=False),
+                        now,
+                    ),
+                )
+                count += 1
+            self.__conn.commit()
+        return count
+
+    def record(
+        self,
+        key: str,
+        params: dict[str, Any],
+        res_dict: dict[str, Any],
+        reset: bool = False,
+    ) -> None:
+        """
+        `key` の検索で API から取得した 1 ページを、これまでのページの続きとして記録します。
+        アイテムは `add` でも保存します。`reset=True` の場合は以前の記録を消してから記録します。
+        """
+        self.add(res_dict["items"])
+        with self.__lock:
+            if reset:
+                self.__conn.execute("DELETE FROM search_results WHERE key = ?", (key,))
+            (fetched,) = self.__conn.execute(
+                "SELECT COUNT(*) FROM search_results WHERE key = ?", (key,)
+            ).fetchone()
+            for item in res_dict["items"]:
+                videoId = video_id_of(item)
+                if videoId is None:
+                    continue
+                inserted = self.__conn.execute(
+                    "INSERT OR IGNORE INTO search_results VALUES (?, ?, ?)",
+                    (key, fetched, videoId),
+                ).rowcount
+                fetched += inserted
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    json.dumps(params, ensure_ascii=False),
+                    fetched,
+                    res_dict.get("pageInfo", {}).get("totalResults"),
+                    res_dict.get("nextPageToken"),
+                    time.time(),
+                ),
+            )
+            self.__conn.commit()
+
+    def coverage(self, key: str) -> dict[str, Any] | None:
+        """
+        `key` の検索の取得状況を返します。記録がないか `ttl` より古い場合は None を返します。
+
+        Returns
+        -------
+        dict or None
+            "fetched" に取得済みの動画数、"complete" に最後のページまで取得したかどうか、
+            "nextPageToken" に続きのページのトークン、"totalResults" に API が返した総数を持つ辞書です。
+        """
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT fetched, total_results, next_page_token, updated_at"
+                " FROM searches WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or time.time() - row[3] > self.ttl:
+            return None
+        fetched, total_results, next_page_token, _ = row
+        return {
+            "fetched": fetched,
+            "complete": next_page_token is None,
+            "nextPageToken": next_page_token,
+            "totalResults": total_results,
+        }
+
+    @staticmethod
+    def _match(query: str, column: str | None = None) -> tuple[list[str], list[str]]:
+        """
+        クエリを FTS5 の MATCH 式と、3 文字未満の語の部分一致の条件に分けます。
+        語はすべて含むもの (AND) として扱います。
+        """
+        matches = []
+        likes = []
+        for term in query.split():
+            if len(term) >= 3:
+                phrase = '"' + term.replace('"', '""') + '"'
+                matches.append(phrase if column is None else f"{column} : {phrase}")
+            else:
+                likes.append(term)
+        return matches, likes
+
+    def search(
+        self,
+        q: str | None = None,
+        *,
+        within: str | None = None,
+        depth: int | None = None,
+        channelId: str | None = None,
+        publishedAfter: str | None = None,
+        publishedBefore: str | None = None,
+        minDuration: int | None = None,
+        maxDuration: int | None = None,
+        caption: bool | None = None,
+        description: str | None = None,
+        order: str = "relevance",
+        limit: int = 20,
+        offset: int = 0,
+    ) -> tuple[list[dict[str, Any]], int]:
+        """
+        保存済みの動画を検索し、(アイテムのリスト, 条件に合う動画の総数) を返します。
+
+        Parameters
+        ----------
+        q : str, optional
+            タイトル、概要、チャンネル名に含まれる語です。空白で区切った語はすべて含むものを探します。
+        within : str, optional
+            `record` で記録した検索のキーです。指定した場合はその検索の結果だけを対象にし、
+            "relevance" では API が返した順に並べます。
+        depth : int, optional
+            `within` の検索結果のうち、先頭から何件までを対象にするかです。
+        channelId : str, optional
+        publishedAfter, publishedBefore : str, optional
+            RFC 3339 形式の日時です。
+        minDuration, maxDuration : int, optional
+            再生時間の範囲（秒）です。再生時間が分からない動画は含みません。
+        caption : bool, optional
+            字幕の有無です。
+        description : str, optional
+            概要に含まれる語です。
+        order : str, default="relevance"
+            "relevance" か `ORDERS` のいずれかです。
+        limit : int, default=20
+        offset : int, default=0
+        """
+        if order != "relevance" and order not in self.ORDERS:
+            raise ValueError(f"unknown order: {order}")
+        joins = []
+        conditions: list[str] = []
+        params: list[Any] = []
+        matches: list[str] = []
+        for text, column in ((q, None), (description, "description")):
+            if not text:
+                continue
+            terms, likes = self._match(text, column)
+            matches.extend(terms)
+            for like in likes:
+                columns: tuple[str, ...] = ("title", "description", "channel_title")
+                if column is not None:
+                    columns = (column,)
+                conditions.append(
+                    "(" + " OR ".join(f"videos.{c} LIKE ?" for c in columns) + ")"
+                )
+                params.extend([f"%{like}%"] * len(columns))
+        if within is not None:
+            joins.append(
+                "JOIN search_results ON search_results.video_id = videos.video_id"
+                " AND search_results.key = ?"
+            )
+            params.insert(0, within)
+            if depth is not None:
+                joins[-1] += " AND search_results.position < ?"
+                params.insert(1, depth)
+        if matches:
+            joins.append("JOIN videos_fts ON videos_fts.rowid = videos.rowid")
+            conditions.append("videos_fts MATCH ?")
+            params.append(" AND ".join(matches))
+        for condition, value in (
+            ("videos.channel_id = ?", channelId),
+            ("videos.published_at >= ?", publishedAfter),
+            ("videos.published_at < ?", publishedBefore),
+            ("videos.duration >= ?", minDuration),
+            ("videos.duration <= ?", maxDuration),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if caption is not None:
+            conditions.append("videos.caption = ?")
+            params.append("true" if caption else "false")
+
+        clause = " ".join(joins)
+        if conditions:
+            clause += " WHERE " + " AND ".join(conditions)
+        if order != "relevance":
+            order_by = f"{self.ORDERS[order]} NULLS LAST"
+        elif within is not None:
+            order_by = "search_results.position"
+        elif matches:
+            order_by = "bm25(videos_fts)"
+        else:
+            order_by = "videos.published_at DESC"
+        with self.__lock:
+            (total,) = self.__conn.execute(
+                f"SELECT COUNT(*) FROM videos {clause}", params
+            ).fetchone()
+            rows = self.__conn.execute(
+                f"SELECT videos.data FROM videos {clause}"
+                f" ORDER BY {order_by}, videos.rowid LIMIT ? OFFSET ?",
+                [*params, limit, offset],
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows], total
+
+    def stats(self) -> dict[str, int]:
+        with self.__lock:
+            (videos,) = self.__conn.execute("SELECT COUNT(*) FROM videos").fetchone()
+            (searches,) = self.__conn.execute(
+                "SELECT COUNT(*) FROM searches"
+            ).fetchone()
+        return {"videos": videos, "searches": searches}
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
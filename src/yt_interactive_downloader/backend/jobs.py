@@ -0,0 +1,993 @@
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Literal, Sequence
+
+from .metrics import JOB_SECONDS, JOBS
+from .tracing import current_trace_id, new_trace_id, trace
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "finished", "failed", "cancelled"]
+DONE: tuple[JobStatus, ...] = ("finished", "failed", "cancelled")
+# 終わったジョブを削除する間隔（秒）
+PRUNE_INTERVAL = 60.0
+
+# jobs テーブルのうち Job の属性に対応する列
+JOB_COLUMNS = (
+    "id",
+    "video_id",
+    "priority",
+    "trace_id",
+    "params",
+    "status",
+    "progress",
+    "downloaded_bytes",
+    "total_bytes",
+    "speed",
+    "eta",
+    "message",
+    "error",
+    "result",
+    "cancel_requested",
+    "created_at",
+    "started_at",
+    "finished_at",
+)
+# `Job.update` で変わり、ジョブストアに書き戻す列
+UPDATABLE_COLUMNS = (
+    "status",
+    "progress",
+    "downloaded_bytes",
+    "total_bytes",
+    "speed",
+    "eta",
+    "message",
+    "error",
+    "result",
+    "started_at",
+    "finished_at",
+)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(
+        self,
+        videoId: str,
+        priority: int = 0,
+        trace_id: str | None = None,
+        **params: Any,
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.videoId = videoId
+        self.priority = priority
+        self.trace_id = trace_id or new_trace_id()
+        self.params = params
+        self.status: JobStatus = "queued"
+        self.progress = 0.0
+        self.downloaded_bytes: float | None = None
+        self.total_bytes: float | None = None
+        self.speed: float | None = None
+        self.eta: int | None = None
+        self.message: str | None = None
+        self.error: str | None = None
+        self.result: Any = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.cancel_requested = False
+        self.listeners: list[Callable[["Job", bool], None]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any]) -> "Job":
+        """`JOB_COLUMNS` の順に並んだ jobs テーブルの行からジョブを作ります。"""
+        record = dict(zip(JOB_COLUMNS, row))
+        job = cls(
+            record["video_id"],
+            priority=record["priority"],
+            trace_id=record["trace_id"],
+            **json.loads(record["params"]),
+        )
+        job.id = record["id"]
+        for column in UPDATABLE_COLUMNS:
+            setattr(job, column, record[column])
+        if record["result"] is not None:
+            job.result = json.loads(record["result"])
+        job.cancel_requested = bool(record["cancel_requested"])
+        job.created_at = record["created_at"]
+        return job
+
+    def update(self, **fields: Any) -> None:
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+        for listener in list(self.listeners):
+            listener(self, "status" in fields or "message" in fields)
+
+    def check_cancelled(self) -> None:
+        """キャンセルが要求されていれば `JobCancelled` を送出します。"""
+        if self.cancel_requested:
+            raise JobCancelled(f"job {self.id} was cancelled")
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id,
+                "videoId": self.videoId,
+                "priority": self.priority,
+                "traceId": self.trace_id,
+                "params": self.params,
+                "status": self.status,
+                "progress": self.progress,
+                "downloadedBytes": self.downloaded_bytes,
+                "totalBytes": self.total_bytes,
+                "speed": self.speed,
+                "eta": self.eta,
+                "message": self.message,
+                "error": self.error,
+                "result": self.result,
+                "createdAt": self.created_at,
+                "startedAt": self.started_at,
+                "finishedAt": self.finished_at,
+            }
+
+
+class Batch:
+    """
+    複数の動画をまとめてダウンロードするバッチ
+
+    ジョブは `videoIds` の順に実行され、バッチ内で同時に実行されるのは `concurrency` 件までです。
+    `JobQueue.submit_batch` で作成します。ジョブの状態は毎回ジョブストアから読み直します。
+    """
+
+    def __init__(
+        self,
+        jobs: "JobQueue",
+        id: str,
+        videoIds: Sequence[str],
+        concurrency: int,
+        priority: int,
+        params: dict[str, Any],
+        trace_id: str,
+        created_at: float,
+    ) -> None:
+        self.id = id
+        self.videoIds = list(videoIds)
+        self.concurrency = concurrency
+        self.priority = priority
+        self.params = params
+        self.trace_id = trace_id
+        self.created_at = created_at
+        self.__queue = jobs
+
+    def cancel(self) -> None:
+        """バッチの未完了のジョブをすべてキャンセルします。"""
+        self.__queue.cancel_batch(self.id)
+
+    def jobs(self) -> list[Job]:
+        return self.__queue._batch_jobs(self.id)
+
+    def to_dict(self) -> dict[str, Any]:
+        jobs = self.jobs()
+        counts = {status: 0 for status in ("queued", "running", *DONE)}
+        progress = 0.0
+        for job in jobs:
+            counts[job.status] += 1
+            progress += 100.0 if job.status in DONE else job.progress
+        total = len(jobs)
+        status: JobStatus
+        if counts["queued"] + counts["running"] > 0:
+            status = "running"
+        elif counts["cancelled"] > 0:
+            status = "cancelled"
+        elif counts["failed"] > 0:
+            status = "failed"
+        else:
+            status = "finished"
+        return {
+            "id": self.id,
+            "status": status,
+            "total": total,
+            "counts": counts,
+            "progress": progress / total if total else 100.0,
+            "concurrency": self.concurrency,
+            "priority": self.priority,
+            "traceId": self.trace_id,
+            "params": self.params,
+            "jobs": [job.id for job in jobs],
+            "createdAt": self.created_at,
+        }
+
+
+class JobQueue:
+    """
+    ダウンロードなどの重い処理をバックグラウンドのワーカープールで実行するジョブキュー
+
+    ジョブは SQLite のジョブストアに保存されます。同じファイルを開いた複数のプロセスは
+    1 つのキューを共有し、それぞれのワーカーが待機中のジョブを取り合って実行します。
+    待機中のジョブは `priority` の大きい順、同じ優先度では登録順に実行されます。
+
+    Parameters
+    ----------
+    path : str or Path, default=":memory:"
+        ジョブストアの SQLite ファイルのパスです。":memory:" の場合はこのプロセスだけのキューになります。
+    max_workers : int, default=2
+        このプロセスで同時に実行するジョブの最大数です。
+        0 の場合は登録だけを行い、ジョブは同じストアを開いた他のプロセスが実行します。
+    event_interval : float, default=0.5
+        進捗だけが変わった場合に、同じジョブのイベントを配信する最短の間隔（秒）です。
+        状態やメッセージが変わった場合はすぐに配信します。
+        他のプロセスで起きた変化も、この間隔でジョブストアから読み取って配信します。
+    stale_after : float, default=60
+        実行中のジョブのハートビートがこの秒数より古くなった場合、
+        実行していたプロセスが落ちたものとしてジョブを failed にします。
+    retention : float, optional
+        終わったジョブをストアに残す秒数です。これより前に終わったジョブと、
+        ジョブがすべて終わったバッチは削除されます。None の場合は削除しません。
+    """
+
+    def __init__(
+        self,
+        path: str | Path = ":memory:",
+        max_workers: int = 2,
+        event_interval: float = 0.5,
+        stale_after: float = 60,
+        retention: float | None = 7 * 24 * 60 * 60,
+    ) -> None:
+        if max_workers < 0:
+            raise ValueError("`max_workers` must not be negative")
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.event_interval = event_interval
+        self.stale_after = stale_after
+        self.retention = retention
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.__lock = threading.RLock()
+        self.__conn = sqlite3.connect(
+            str(path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                trace_id TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL,
+                downloaded_bytes REAL,
+                total_bytes REAL,
+                speed REAL,
+                eta INTEGER,
+                message TEXT,
+                error TEXT,
+                result TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                task TEXT NOT NULL,
+                key TEXT,
+                seq INTEGER NOT NULL,
+                worker TEXT,
+                heartbeat_at REAL,
+                version INTEGER NOT NULL,
+                updated_by TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, seq);
+            CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+            CREATE INDEX IF NOT EXISTS jobs_version ON jobs (version);
+            CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                video_ids TEXT NOT NULL,
+                concurrency INTEGER NOT NULL,
+                priority INTEGER NOT NULL,
+                params TEXT NOT NULL,
+                trace_id TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                batch_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                job_id TEXT NOT NULL,
+                PRIMARY KEY (batch_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS batch_jobs_job_id ON batch_jobs (job_id);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters VALUES ('version', 0);
+            -- このプロセスが実行できるタスク。接続ごとの一時テーブルのため、他のプロセスからは見えない
+            CREATE TEMP TABLE tasks (name TEXT PRIMARY KEY);
+            """
+        )
+        self.__version = self.__current_version()
+        self.__tasks: dict[str, Callable[..., Any]] = {}
+        # 名前が重なったためにこのプロセスだけで実行できるタスク
+        self.__local_tasks: set[str] = set()
+        self.__running: dict[str, Job] = {}
+        self.__interrupted: set[str] = set()
+        self.__subscribers: list[queue.Queue[dict[str, Any]]] = []
+        self.__published_at: dict[str, float] = {}
+        self.__persisted_at: dict[str, float] = {}
+        self.__pruned_at = 0.0
+        self.__wakeup = threading.Condition()
+        self.__closed = threading.Event()
+        self.__workers = [
+            threading.Thread(target=self.__work, name=f"job-worker_{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        self.__watcher = threading.Thread(
+            target=self.__watch, name="job-watcher", daemon=True
+        )
+        for worker in self.__workers:
+            worker.start()
+        self.__watcher.start()
+
+    @contextmanager
+    def __write(self) -> Iterator[sqlite3.Connection]:
+        """他のプロセスの書き込みと直列化されたトランザクションを開きます。"""
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.__conn
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+            self.__conn.execute("COMMIT")
+
+    def __current_version(self) -> int:
+        with self.__lock:
+            return self.__conn.execute(
+                "SELECT value FROM counters WHERE name = 'version'"
+            ).fetchone()[0]
+
+    def __next_version(self, conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'version'")
+        return conn.execute(
+            "SELECT value FROM counters WHERE name = 'version'"
+        ).fetchone()[0]
+
+    def __select_jobs(self, clause: str, params: Sequence[Any] = ()) -> list[Job]:
+        columns = ", ".join(f"jobs.{column}" for column in JOB_COLUMNS)
+        with self.__lock:
+            rows = self.__conn.execute(
+                f"SELECT {columns} FROM jobs {clause}", params
+            ).fetchall()
+            running = dict(self.__running)
+        # このプロセスで実行中のジョブは、ストアより新しい手元の状態を返す
+        return [running.get(row[0]) or Job.from_row(row) for row in rows]
+
+    def register(self, func: Callable[..., Any]) -> str:
+        """
+        `func` をこのプロセスのワーカーが実行できるタスクとして登録し、タスク名を返します。
+
+        他のプロセスが登録したジョブを実行するには、そのプロセスでも同じ関数を登録しておきます。
+        ラムダなど名前が重なる別の関数は、このプロセスだけで実行できるタスクになり、
+        待機中と実行中のジョブがなくなった時点で登録から外れます。
+        """
+        name = f"{func.__module__}:{func.__qualname__}"
+        with self.__lock:
+            registered = self.__tasks.setdefault(name, func)
+            if registered != func:
+                name = f"{name}@{self.worker_id}:{id(func)}"
+                self.__tasks[name] = func
+                self.__local_tasks.add(name)
+            self.__conn.execute("INSERT OR IGNORE INTO temp.tasks VALUES (?)", (name,))
+        return name
+
+    def __forget(self, conn: sqlite3.Connection, task: str) -> None:
+        """このプロセスだけのタスクを、待機中と実行中のジョブがなくなったら登録から外します。"""
+        if task not in self.__local_tasks:
+            return
+        pending = conn.execute(
+            "SELECT 1 FROM jobs WHERE task = ? AND status IN ('queued', 'running')"
+            " LIMIT 1",
+            (task,),
+        ).fetchone()
+        if pending is None:
+            del self.__tasks[task]
+            self.__local_tasks.discard(task)
+            conn.execute("DELETE FROM temp.tasks WHERE name = ?", (task,))
+
+    def subscribe(self, maxsize: int = 1000) -> "queue.Queue[dict[str, Any]]":
+        """
+        ジョブとバッチの変化を受け取るキューを返します。
+        キューには {"event": "job" または "batch", "data": `to_dict()` の値} が入ります。
+        受け取りが追いつかずにキューが一杯になった場合、そのイベントは捨てられます。
+        """
+        subscriber: queue.Queue[dict[str, Any]] = queue.Queue(maxsize)
+        with self.__lock:
+            self.__subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: "queue.Queue[dict[str, Any]]") -> None:
+        with self.__lock:
+            self.__subscribers.remove(subscriber)
+
+    def publish(
+        self,
+        event: str,
+        id: str,
+        data: Callable[[], dict[str, Any]],
+        important: bool,
+    ) -> None:
+        """購読者がいて間引かれなかった場合だけ `data()` を呼び、イベントを配信します。"""
+        now = time.monotonic()
+        with self.__lock:
+            if not self.__subscribers:
+                return
+            if (
+                not important
+                and now - self.__published_at.get(id, 0) < self.event_interval
+            ):
+                return
+            self.__published_at[id] = now
+            subscribers = list(self.__subscribers)
+        payload = {"event": event, "data": data()}
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(payload)
+            except queue.Full:
+                pass
+
+    def __publish_job(self, job: Job, important: bool) -> None:
+        self.publish("job", job.id, job.to_dict, important)
+        with self.__lock:
+            if not self.__subscribers:
+                return
+            rows = self.__conn.execute(
+                "SELECT batch_id FROM batch_jobs WHERE job_id = ?", (job.id,)
+            ).fetchall()
+        for (batch_id,) in rows:
+            batch = self.batch(batch_id)
+            if batch is not None:
+                self.publish("batch", batch.id, batch.to_dict, important)
+
+    def __persist(self, job: Job, important: bool) -> None:
+        """実行中のジョブの状態をストアに書き戻し、他のプロセスからのキャンセルを受け取ります。"""
+        now = time.monotonic()
+        if (
+            not important
+            and now - self.__persisted_at.get(job.id, 0) < self.event_interval
+        ):
+            return
+        self.__persisted_at[job.id] = now
+        with job._lock:
+            values = [getattr(job, column) for column in UPDATABLE_COLUMNS]
+        values[UPDATABLE_COLUMNS.index("result")] = (
+            None if job.result is None else json.dumps(job.result)
+        )
+        assignments = ", ".join(f"{column} = ?" for column in UPDATABLE_COLUMNS)
+        with self.__write() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments}, heartbeat_at = ?, version = ?,"
+                " updated_by = ? WHERE id = ?",
+                (
+                    *values,
+                    time.time(),
+                    self.__next_version(conn),
+                    self.worker_id,
+                    job.id,
+                ),
+            )
+            (cancel_requested,) = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job.id,)
+            ).fetchone()
+        if cancel_requested:
+            job.cancel_requested = True
+
+    def __insert(
+        self,
+        conn: sqlite3.Connection,
+        task: str,
+        videoId: str,
+        key: str | None,
+        priority: int,
+        trace_id: str | None,
+        params: dict[str, Any],
+    ) -> tuple[Job, bool]:
+        """ジョブを登録し、(ジョブ, 新しく登録したか) を返します。"""
+        if key is not None:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+                " WHERE key = ? AND status IN ('queued', 'running') LIMIT 1",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                return Job.from_row(row), False
+        job = Job(
+            videoId,
+            priority=priority,
+            trace_id=trace_id or current_trace_id(),
+            **params,
+        )
+        version = self.__next_version(conn)
+        conn.execute(
+            "INSERT INTO jobs (id, video_id, priority, trace_id, params, status,"
+            " progress, created_at, task, key, seq, version, updated_by)"
+            " VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?, ?, ?)",
+            (
+                job.id,
+                videoId,
+                priority,
+                job.trace_id,
+                json.dumps(params),
+                job.created_at,
+                task,
+                key,
+                version,
+                version,
+                self.worker_id,
+            ),
+        )
+        return job, True
+
+    def __notify(self) -> None:
+        with self.__wakeup:
+            self.__wakeup.notify_all()
+
+    def submit(
+        self,
+        func: Callable[..., Any],
+        videoId: str,
+        key: str | None = None,
+        priority: int = 0,
+        trace_id: str | None = None,
+        **params: Any,
+    ) -> Job:
+        """
+        ジョブを登録し、登録した時点の状態をすぐに返します。最新の状態は `get` で取得します。
+
+        `func` はワーカースレッド上で `func(job, videoId, **params)` として呼ばれ、
+        `job.update(progress=...)` で進捗を報告できます。戻り値は `job.result` に保存されます。
+        例外が送出された場合、ジョブは failed になります。
+        時間のかかる `func` は `job.check_cancelled()` を呼んでキャンセルに応じます。
+        ジョブはストアに保存されるため、`params` と戻り値は JSON に変換できる値にします。
+
+        `key` を指定した場合、同じ `key` のジョブが待機中か実行中であれば、
+        新しいジョブは登録せずにそのジョブを返します。
+        `trace_id` を省略した場合は、呼び出し元のトレース ID か新しい ID をジョブに付けます。
+        """
+        # 登録から外れるのと競合しないように、ジョブと同じトランザクションの中で登録する
+        with self.__write() as conn:
+            task = self.register(func)
+            job, created = self.__insert(
+                conn, task, videoId, key, priority, trace_id, params
+            )
+        if created:
+            logger.info("queued job %s for %s", job.id, videoId, extra={"job": job.id})
+            self.__publish_job(job, True)
+            self.__notify()
+        return job
+
+    def submit_batch(
+        self,
+        func: Callable[..., Any],
+        videoIds: Sequence[str],
+        concurrency: int = 2,
+        priority: int = 0,
+        key: Callable[[str], str] | None = None,
+        **params: Any,
+    ) -> Batch:
+        """
+        `videoIds` のバッチを登録し、すぐに返します。
+
+        ジョブは `videoIds` の順に実行され、バッチ内で同時に実行されるのは `concurrency` 件までです。
+        `key` には動画 ID からジョブの `key` を作る関数を指定します。
+        その他の引数は `submit` と同じです。
+        """
+        if concurrency <= 0:
+            raise ValueError("`concurrency` must be positive")
+        batch = Batch(
+            self,
+            uuid.uuid4().hex,
+            videoIds,
+            concurrency,
+            priority,
+            params,
+            current_trace_id() or new_trace_id(),
+            time.time(),
+        )
+        with self.__write() as conn:
+            task = self.register(func)
+            conn.execute(
+                "INSERT INTO batches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    batch.id,
+                    json.dumps(batch.videoIds),
+                    concurrency,
+                    priority,
+                    json.dumps(params),
+                    batch.trace_id,
+                    batch.created_at,
+                ),
+            )
+            for position, videoId in enumerate(batch.videoIds):
+                job, _ = self.__insert(
+                    conn,
+                    task,
+                    videoId,
+                    None if key is None else key(videoId),
+                    priority,
+                    batch.trace_id,
+                    params,
+                )
+                conn.execute(
+                    "INSERT INTO batch_jobs VALUES (?, ?, ?)",
+                    (batch.id, position, job.id),
+                )
+        logger.info(
+            "queued batch %s of %d videos",
+            batch.id,
+            len(batch.videoIds),
+            extra={"batch": batch.id},
+        )
+        self.publish("batch", batch.id, batch.to_dict, True)
+        self.__notify()
+        return batch
+
+    def __claim(self) -> tuple[Job, str, Callable[..., Any]] | None:
+        """このプロセスが実行できる次のジョブを running にして、(ジョブ, タスク名, 関数) を返します。"""
+        columns = ", ".join(f"jobs.{column}" for column in JOB_COLUMNS)
+        now = time.time()
+        with self.__write() as conn:
+            # バッチの同時実行数に達しているジョブは飛ばす
+            row = conn.execute(
+                f"""
+                SELECT {columns}, jobs.task FROM jobs
+                WHERE jobs.status = 'queued'
+                AND jobs.task IN (SELECT name FROM temp.tasks)
+                AND NOT EXISTS (
+                    SELECT 1 FROM batch_jobs
+                    JOIN batches ON batches.id = batch_jobs.batch_id
+                    WHERE batch_jobs.job_id = jobs.id
+                    AND batches.concurrency <= (
+                        SELECT COUNT(*) FROM batch_jobs AS siblings
+                        JOIN jobs AS sibling ON sibling.id = siblings.job_id
+                        WHERE siblings.batch_id = batches.id
+                        AND sibling.status = 'running'
+                    )
+                )
+                ORDER BY jobs.priority DESC, jobs.seq
+                LIMIT 1
+                """
+            ).fetchone()
+            if row is None:
+                return None
+            func = self.__tasks[row[-1]]
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, worker = ?,"
+                " heartbeat_at = ?, version = ?, updated_by = ? WHERE id = ?",
+                (
+                    now,
+                    self.worker_id,
+                    now,
+                    self.__next_version(conn),
+                    self.worker_id,
+                    row[0],
+                ),
+            )
+        job = Job.from_row(row[:-1])
+        job.status = "running"
+        job.started_at = now
+        return job, row[-1], func
+
+    def __work(self) -> None:
+        while not self.__closed.is_set():
+            try:
+                claimed = self.__claim()
+            except sqlite3.Error:
+                logger.exception("failed to claim a job")
+                claimed = None
+            if claimed is None:
+                with self.__wakeup:
+                    self.__wakeup.wait(self.event_interval)
+                continue
+            job, task, func = claimed
+            self.__run(job, func)
+            try:
+                with self.__write() as conn:
+                    self.__forget(conn, task)
+            except sqlite3.Error:
+                logger.exception("failed to release task %s", task)
+            # バッチの枠が空いたため、待っている他のワーカーを起こす
+            self.__notify()
+
+    def __run(self, job: Job, func: Callable[..., Any]) -> None:
+        job.listeners = [self.__persist, self.__publish_job]
+        with self.__lock:
+            self.__running[job.id] = job
+        with trace(job.trace_id):
+            logger.info("started job %s", job.id, extra={"job": job.id})
+            self.__publish_job(job, True)
+            try:
+                job.check_cancelled()
+                result = func(job, job.videoId, **job.params)
+            except Exception as e:
+                if job.id in self.__interrupted:
+                    self.__requeue(job)
+                    return
+                if job.cancel_requested:
+                    job.update(status="cancelled", finished_at=time.time())
+                else:
+                    logger.exception("job %s failed", job.id, extra={"job": job.id})
+                    job.update(status="failed", error=str(e), finished_at=time.time())
+            else:
+                job.update(
+                    status="finished",
+                    progress=100.0,
+                    result=result,
+                    finished_at=time.time(),
+                )
+            with self.__lock:
+                del self.__running[job.id]
+                self.__persisted_at.pop(job.id, None)
+                self.__published_at.pop(job.id, None)
+            elapsed = job.finished_at - job.started_at  # type: ignore[operator]
+            JOBS.inc(status=job.status)
+            JOB_SECONDS.observe(elapsed, status=job.status)
+            logger.info(
+                "job %s %s in %.1fs",
+                job.id,
+                job.status,
+                elapsed,
+                extra={"job": job.id, "elapsed": elapsed},
+            )
+
+    def __requeue(self, job: Job) -> None:
+        """シャットダウンで中断したジョブを待機中に戻し、他のプロセスか次の起動に任せます。"""
+        with self.__lock:
+            del self.__running[job.id]
+            self.__persisted_at.pop(job.id, None)
+        with self.__write() as conn:
+            # 中断する前にキャンセルが要求されていた場合はそのままキャンセルする
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested"
+                " THEN 'cancelled' ELSE 'queued' END, progress = 0,"
+                " started_at = NULL, finished_at = CASE WHEN cancel_requested"
+                " THEN ? END, worker = NULL, heartbeat_at = NULL, version = ?,"
+                " updated_by = NULL WHERE id = ?",
+                (time.time(), self.__next_version(conn), job.id),
+            )
+        logger.info("requeued job %s on shutdown", job.id, extra={"job": job.id})
+
+    def __watch(self) -> None:
+        while not self.__closed.wait(self.event_interval):
+            try:
+                self.__sync()
+            except sqlite3.Error:
+                logger.exception("failed to sync the job store")
+
+    def __sync(self) -> None:
+        """
+        実行中のジョブのハートビートを更新し、止まったジョブを片付け、
+        他のプロセスで起きた変化をこのプロセスの購読者に配信します。
+        """
+        now = time.time()
+        with self.__lock:
+            running = bool(self.__running)
+        with self.__write() as conn:
+            if running:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ?"
+                    " WHERE worker = ? AND status = 'running'",
+                    (now, self.worker_id),
+                )
+            stale = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+                (now - self.stale_after,),
+            ).fetchall()
+            if stale:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker lost',"
+                    " finished_at = ?, version = ?, updated_by = NULL"
+                    " WHERE status = 'running' AND heartbeat_at < ?",
+                    (now, self.__next_version(conn), now - self.stale_after),
+                )
+        for (job_id,) in stale:
+            logger.warning("job %s was abandoned by its worker", job_id)
+        if self.retention is not None and now - self.__pruned_at >= PRUNE_INTERVAL:
+            self.__pruned_at = now
+            self.__prune(now - self.retention)
+        version = self.__current_version()
+        if version == self.__version:
+            return
+        changed = self.__select_jobs(
+            "WHERE version > ? AND version <= ?"
+            " AND (updated_by IS NULL OR updated_by != ?) ORDER BY version",
+            (self.__version, version, self.worker_id),
+        )
+        self.__version = version
+        if changed:
+            # 他のプロセスが登録したジョブや、空いたバッチの枠をすぐに取りに行く
+            self.__notify()
+        for job in changed:
+            self.__publish_job(job, True)
+
+    def __prune(self, before: float) -> None:
+        """`before` より前に終わったジョブと、そのようなジョブだけになったバッチを削除します。"""
+        done = ", ".join(f"'{status}'" for status in DONE)
+        with self.__write() as conn:
+            batches = conn.execute(
+                f"""
+                SELECT id FROM batches WHERE created_at < :before AND NOT EXISTS (
+                    SELECT 1 FROM batch_jobs
+                    JOIN jobs ON jobs.id = batch_jobs.job_id
+                    WHERE batch_jobs.batch_id = batches.id
+                    AND (jobs.status NOT IN ({done}) OR jobs.finished_at >= :before)
+                )
+                """,
+                {"before": before},
+            ).fetchall()
+            conn.executemany("DELETE FROM batch_jobs WHERE batch_id = ?", batches)
+            conn.executemany("DELETE FROM batches WHERE id = ?", batches)
+            # まだ残っているバッチに含まれるジョブは、バッチと一緒に削除する
+            jobs = conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({done}) AND finished_at < ?"
+                " AND id NOT IN (SELECT job_id FROM batch_jobs)",
+                (before,),
+            ).rowcount
+        if batches or jobs:
+            logger.info("pruned %d jobs and %d batches", jobs, len(batches))
+
+    def cancel(self, job_id: str) -> Job | None:
+        """
+        ジョブをキャンセルします。待機中のジョブはすぐに cancelled になり、
+        実行中のジョブは次に `job.check_cancelled()` を呼んだ時点で中断されます。
+        他のプロセスで実行中のジョブには、そのプロセスが次に進捗を書き戻した時点で伝わります。
+        """
+        with self.__write() as conn:
+            row = conn.execute(
+                "SELECT status, task FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            status, task = row
+            if status == "queued":
+                conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', cancel_requested = 1,"
+                    " finished_at = ?, version = ?, updated_by = ? WHERE id = ?",
+                    (time.time(), self.__next_version(conn), self.worker_id, job_id),
+                )
+                self.__forget(conn, task)
+            elif status == "running":
+                conn.execute(
+                    "UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,)
+                )
+        with self.__lock:
+            running = self.__running.get(job_id)
+        if running is not None:
+            running.cancel_requested = True
+        job = self.get(job_id)
+        if status == "queued" and job is not None:
+            JOBS.inc(status="cancelled")
+            self.__publish_job(job, True)
+        return job
+
+    def cancel_batch(self, batch_id: str) -> Batch | None:
+        """バッチの未完了のジョブをすべてキャンセルします。"""
+        batch = self.batch(batch_id)
+        if batch is None:
+            return None
+        for job in batch.jobs():
+            if job.status not in DONE:
+                self.cancel(job.id)
+        self.publish("batch", batch.id, batch.to_dict, True)
+        return batch
+
+    def get(self, job_id: str) -> Job | None:
+        jobs = self.__select_jobs("WHERE id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def jobs(self) -> list[Job]:
+        return self.__select_jobs("ORDER BY created_at")
+
+    def counts(self) -> dict[JobStatus, int]:
+        """状態ごとのジョブ数を返します。"""
+        counts: dict[JobStatus, int] = {
+            status: 0 for status in ("queued", "running", *DONE)
+        }
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        for status, count in rows:
+            counts[status] = count
+        return counts
+
+    def speed(self) -> float:
+        """実行中のジョブの速度（バイト/秒）の合計を返します。"""
+        with self.__lock:
+            (speed,) = self.__conn.execute(
+                "SELECT TOTAL(speed) FROM jobs WHERE status = 'running'"
+            ).fetchone()
+        return speed
+
+    def running_share(self) -> float:
+        """
+        すべてのプロセスで実行中のジョブのうち、このプロセスで実行中のジョブの割合を返します。
+        実行中のジョブがない場合は 1 を返します。
+        """
+        with self.__lock:
+            local, total = self.__conn.execute(
+                "SELECT TOTAL(worker = ?), COUNT(*) FROM jobs WHERE status = 'running'",
+                (self.worker_id,),
+            ).fetchone()
+        return local / total if total else 1.0
+
+    def _batch_jobs(self, batch_id: str) -> list[Job]:
+        return self.__select_jobs(
+            "JOIN batch_jobs ON batch_jobs.job_id = jobs.id"
+            " WHERE batch_jobs.batch_id = ? ORDER BY batch_jobs.position",
+            (batch_id,),
+        )
+
+    def __batch_from_row(self, row: Sequence[Any]) -> Batch:
+        id, videoIds, concurrency, priority, params, trace_id, created_at = row
+        return Batch(
+            self,
+            id,
+            json.loads(videoIds),
+            concurrency,
+            priority,
+            json.loads(params),
+            trace_id,
+            created_at,
+        )
+
+    def batch(self, batch_id: str) -> Batch | None:
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT * FROM batches WHERE id = ?", (batch_id,)
+            ).fetchone()
+        return None if row is None else self.__batch_from_row(row)
+
+    def batches(self) -> list[Batch]:
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT * FROM batches ORDER BY created_at"
+            ).fetchall()
+        return [self.__batch_from_row(row) for row in rows]
+
+    def shutdown(self, wait: bool = True, interrupt: bool = False) -> None:
+        """
+        新しいジョブを取りに行くのをやめます。`wait=True` の場合は実行中のジョブが終わるのを待ち、
+        ジョブストアを閉じます。待機中のジョブはストアに残り、他のプロセスか次に起動したプロセスが実行します。
+
+        `interrupt=True` の場合は実行中のジョブを中断して待機中に戻します。
+        """
+        self.__closed.set()
+        if interrupt:
+            with self.__lock:
+                running = list(self.__running.values())
+                self.__interrupted.update(job.id for job in running)
+            for job in running:
+                job.cancel_requested = True
+        self.__notify()
+        if not wait:
+            return
+        for worker in self.__workers:
+            worker.join()
+        self.__watcher.join()
+        with self.__lock:
+            self.__conn.close()
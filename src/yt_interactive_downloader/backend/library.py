@@ -0,0 +1,147 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+from .sinks import LocalSink, Sink, SSHSink
+
+logger = logging.getLogger(__name__)
+
+
+class Library:
+    """
+    ダウンロード済みの動画を記録する SQLite のインデックス
+
+    Parameters
+    ----------
+    path : str or Path, default=":memory:"
+        インデックスを保存する SQLite ファイルのパスです。
+    """
+
+    COLUMNS = (
+        "videoId",
+        "format",
+        "location",
+        "path",
+        "name",
+        "size",
+        "sha256",
+        "downloadedAt",
+    )
+
+    def __init__(self, path: str | Path = ":memory:") -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT NOT NULL,
+                format TEXT NOT NULL,
+                location TEXT NOT NULL,
+                path TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                downloaded_at REAL NOT NULL,
+                PRIMARY KEY (video_id, format, location, path)
+            );
+            CREATE INDEX IF NOT EXISTS videos_sha256 ON videos (sha256);
+            """
+        )
+        self.__conn.commit()
+
+    def add(self, videoId: str, format: str, result: dict[str, Any]) -> None:
+        """`download_video` の戻り値 `result` を記録します。"""
+        with self.__lock:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    videoId,
+                    format,
+                    result["location"],
+                    result["path"],
+                    result["name"],
+                    result["size"],
+                    result["sha256"],
+                    time.time(),
+                ),
+            )
+            self.__conn.commit()
+
+    def find(
+        self, videoId: str, format: str, location: str, path: str
+    ) -> dict[str, Any] | None:
+        """
+        同じ保存先にある完全なコピーを返します。
+
+        保存先にファイルが残っているものだけを返し、消えていた場合は記録を削除します。
+        ローカルの場合はサイズも確かめます。リモートに接続できない場合は記録をそのまま返します。
+        """
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT * FROM videos WHERE video_id = ? AND format = ?"
+                " AND location = ? AND path = ?",
+                (videoId, format, location, path),
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(self.COLUMNS, row))
+        # リモートの確認には時間がかかるため、ロックの外で行う
+        sink: Sink
+        if location == "local":
+            sink = LocalSink(path)
+            file = sink.path / record["name"]
+            present = sink.exists(record["name"]) and (
+                file.stat().st_size == record["size"]
+            )
+        else:
+            sink = SSHSink(location, path)
+            try:
+                present = sink.exists(record["name"])
+            except RuntimeError:
+                logger.warning(
+                    "could not check %s on %s", record["name"], location, exc_info=True
+                )
+                present = True
+        if not present:
+            with self.__lock:
+                self.__conn.execute(
+                    "DELETE FROM videos WHERE video_id = ? AND format = ?"
+                    " AND location = ? AND path = ?",
+                    (videoId, format, location, path),
+                )
+                self.__conn.commit()
+            return None
+        return record
+
+    def downloaded(self, videoIds: Iterable[str]) -> set[str]:
+        """`videoIds` のうち、どこかにダウンロード済みのものを返します。"""
+        videoIds = list(videoIds)
+        found: set[str] = set()
+        with self.__lock:
+            for i in range(0, len(videoIds), 500):
+                chunk = videoIds[i : i + 500]
+                rows = self.__conn.execute(
+                    "SELECT DISTINCT video_id FROM videos WHERE video_id IN"
+                    f" ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def videos(self) -> list[dict[str, Any]]:
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT * FROM videos ORDER BY downloaded_at DESC"
+            ).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
@@ -0,0 +1,556 @@
+import bisect
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Final, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 止まったプロセスの値を削除する間隔（秒）
+PRUNE_INTERVAL = 60.0
+
+DEFAULT_BUCKETS: Final[tuple[float, ...]] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric(ABC):
+    """
+    Prometheus のテキスト形式で出力できるメトリクスの基底クラス
+
+    Parameters
+    ----------
+    name : str
+        メトリクス名です。
+    documentation : str
+        HELP 行に出力する説明です。
+    labelnames : sequence of str, default=()
+        ラベル名です。値を更新するときは同じ名前のキーワード引数でラベルの値を指定します。
+    """
+
+    type: str = ""
+    # True の場合、プロセスごとの値を足し合わせたものを全体の値として出力できる
+    summable: bool = False
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def _values(self) -> dict[tuple[str, ...], list[float]]:
+        """ラベルごとの値を数値のリストで返します。`summable` なら要素ごとに足し合わせられます。"""
+
+    @abstractmethod
+    def _samples(
+        self, values: dict[tuple[str, ...], list[float]]
+    ) -> list[tuple[str, str, float]]:
+        """`_values` の形式の値から (サフィックス付きの名前, ラベル, 値) のリストを作ります。"""
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """(サフィックス付きの名前, ラベル, 値) のリストを返します。"""
+        return self._samples(self._values())
+
+    def render(self, values: dict[tuple[str, ...], list[float]] | None = None) -> str:
+        """`values` を指定した場合は、このプロセスの値の代わりにその値を出力します。"""
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        samples = self.samples() if values is None else self._samples(values)
+        for name, labels, value in samples:
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    type = "counter"
+    summable = True
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.__values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("counters can only be incremented")
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self.__values.get(self._key(labels), 0)
+
+    def _values(self) -> dict[tuple[str, ...], list[float]]:
+        with self._lock:
+            return {key: [value] for key, value in self.__values.items()}
+
+    def _samples(
+        self, values: dict[tuple[str, ...], list[float]]
+    ) -> list[tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.labelnames, key), value)
+            for key, (value,) in sorted(values.items())
+        ]
+
+
+class Gauge(Metric):
+    """
+    増減する値のメトリクス
+
+    `set_function` で関数を登録した場合は、出力するたびにその関数の戻り値を使います。
+    ラベルのないゲージにだけ登録できます。
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.__values: dict[tuple[str, ...], float] = {}
+        self.__function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        if self.labelnames:
+            raise ValueError("functions can only be set on gauges without labels")
+        self.__function = function
+
+    def _values(self) -> dict[tuple[str, ...], list[float]]:
+        if self.__function is not None:
+            return {(): [float(self.__function())]}
+        with self._lock:
+            return {key: [value] for key, value in self.__values.items()}
+
+    def _samples(
+        self, values: dict[tuple[str, ...], list[float]]
+    ) -> list[tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.labelnames, key), value)
+            for key, (value,) in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+    summable = True
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベルごとに (バケットごとの件数, 合計, 件数)
+        self.__values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self.__values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            if index < len(counts):
+                counts[index] += 1
+            self.__values[key] = (counts, total + value, count + 1)
+
+    def _values(self) -> dict[tuple[str, ...], list[float]]:
+        # バケットごとの件数のあとに合計と件数を並べる
+        with self._lock:
+            return {
+                key: [*counts, total, count]
+                for key, (counts, total, count) in self.__values.items()
+            }
+
+    def _samples(
+        self, values: dict[tuple[str, ...], list[float]]
+    ) -> list[tuple[str, str, float]]:
+        samples: list[tuple[str, str, float]] = []
+        for key, value in sorted(values.items()):
+            counts, total, count = value[:-2], value[-2], value[-1]
+            cumulative = 0.0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                labels = _format_labels(
+                    (*self.labelnames, "le"), (*key, _format_value(bound))
+                )
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels((*self.labelnames, "le"), (*key, "+Inf"))
+            samples.append((f"{self.name}_bucket", labels, count))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class _MetricStore:
+    """
+    カウンターとヒストグラムの値をプロセスごとに SQLite ファイルへ書き込み、
+    すべてのプロセスの値を足し合わせて読み出すストア
+
+    値を書き込むたびにプロセスのハートビートを更新し、ハートビートが `stale_after` 秒より古い
+    プロセスの値は、落ちたものとして `PRUNE_INTERVAL` 秒ごとに削除します。
+    `close` したプロセスの値はすぐに削除します。
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        worker_id: str,
+        metrics: Callable[[], list[Metric]],
+        interval: float,
+        stale_after: float,
+    ) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.worker_id = worker_id
+        self.interval = interval
+        self.stale_after = stale_after
+        self.__metrics = metrics
+        self.__lock = threading.Lock()
+        self.__pruned_at = 0.0
+        self.__conn = sqlite3.connect(
+            str(path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS samples (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                worker TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (name, labels, worker)
+            );
+            CREATE INDEX IF NOT EXISTS samples_worker ON samples (worker);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker TEXT PRIMARY KEY,
+                heartbeat_at REAL NOT NULL
+            );
+            """
+        )
+        self.__closed = threading.Event()
+        self.__flusher = threading.Thread(
+            target=self.__flush_periodically, name="metrics-flusher", daemon=True
+        )
+        self.__flusher.start()
+
+    def __execute(
+        self, statements: Sequence[tuple[str, Sequence[Sequence[Any]]]]
+    ) -> None:
+        """他のプロセスの書き込みと直列化されたトランザクションで、文をまとめて実行します。"""
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    self.__conn.executemany(sql, rows)
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+            self.__conn.execute("COMMIT")
+
+    def __flush_periodically(self) -> None:
+        while not self.__closed.wait(self.interval):
+            try:
+                self.flush()
+                now = time.time()
+                if now - self.__pruned_at >= PRUNE_INTERVAL:
+                    self.__pruned_at = now
+                    self.prune(now - self.stale_after)
+            except sqlite3.Error:
+                logger.exception("failed to write metrics")
+
+    def flush(self) -> None:
+        """このプロセスの値を書き込み、ハートビートを更新します。"""
+        rows = [
+            (metric.name, json.dumps(key), self.worker_id, json.dumps(value))
+            for metric in self.__metrics()
+            for key, value in metric._values().items()
+        ]
+        self.__execute(
+            [
+                ("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)", rows),
+                (
+                    "INSERT OR REPLACE INTO workers VALUES (?, ?)",
+                    [(self.worker_id, time.time())],
+                ),
+            ]
+        )
+
+    def prune(self, before: float) -> None:
+        """ハートビートが `before` より古いプロセスの値を削除します。"""
+        self.__execute(
+            [
+                ("DELETE FROM workers WHERE heartbeat_at < ?", [(before,)]),
+                (
+                    "DELETE FROM samples"
+                    " WHERE worker NOT IN (SELECT worker FROM workers)",
+                    [()],
+                ),
+            ]
+        )
+
+    def values(self, name: str) -> dict[tuple[str, ...], list[float]]:
+        """すべてのプロセスの値をラベルごとに足し合わせて返します。"""
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT labels, value FROM samples WHERE name = ?", (name,)
+            ).fetchall()
+        values: dict[tuple[str, ...], list[float]] = {}
+        for labels, value in rows:
+            key = tuple(json.loads(labels))
+            value = json.loads(value)
+            total = values.get(key, [0.0] * len(value))
+            values[key] = [a + b for a, b in zip(total, value)]
+        return values
+
+    def close(self) -> None:
+        self.__closed.set()
+        self.__flusher.join()
+        self.__execute(
+            [
+                ("DELETE FROM samples WHERE worker = ?", [(self.worker_id,)]),
+                ("DELETE FROM workers WHERE worker = ?", [(self.worker_id,)]),
+            ]
+        )
+        with self.__lock:
+            self.__conn.close()
+
+
+class Registry:
+    """メトリクスをまとめて Prometheus のテキスト形式で出力するレジストリ"""
+
+    CONTENT_TYPE: Final[str] = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self) -> None:
+        self.__metrics: dict[str, Metric] = {}
+        self.__lock = threading.Lock()
+        self.__store: _MetricStore | None = None
+        # (プロセス ID, ワーカー ID)。fork した子プロセスでは作り直す
+        self.__worker: tuple[int, str] | None = None
+
+    def register(self, metric: Metric) -> Metric:
+        with self.__lock:
+            if metric.name in self.__metrics:
+                raise ValueError(f"metric {metric.name} is already registered")
+            self.__metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))  # type: ignore
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(
+            Histogram(name, documentation, labelnames, buckets)
+        )  # type: ignore
+
+    def share(
+        self, path: str | Path, interval: float = 5.0, stale_after: float = 60
+    ) -> None:
+        """
+        カウンターとヒストグラムを SQLite ファイルを通じて他のプロセスと合算します。
+
+        このプロセスの値は `interval` 秒ごとと `render` のたびにファイルへ書き込まれ、
+        `render` は同じファイルを開いている全プロセスの値の合計を出力します。
+        終了したプロセスと、`stale_after` 秒より長く書き込みのないプロセスの値は合計から外れます。
+        ゲージはこのプロセスで計算した値をそのまま出力します。
+        """
+        # 同じワーカー ID を使い回すため、前のストアの値を消してから作り直す
+        self.unshare()
+        pid = os.getpid()
+        with self.__lock:
+            if self.__worker is None or self.__worker[0] != pid:
+                self.__worker = (
+                    pid,
+                    f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}",
+                )
+            worker_id = self.__worker[1]
+        store = _MetricStore(path, worker_id, self.__summable, interval, stale_after)
+        with self.__lock:
+            self.__store = store
+
+    def unshare(self) -> None:
+        """合算をやめ、このプロセスの値をファイルから削除します。"""
+        with self.__lock:
+            store, self.__store = self.__store, None
+        if store is not None:
+            store.close()
+
+    def __summable(self) -> list[Metric]:
+        with self.__lock:
+            return [metric for metric in self.__metrics.values() if metric.summable]
+
+    def values(self, metric: Metric) -> dict[tuple[str, ...], list[float]]:
+        """
+        ラベルごとの値を返します。`share` している場合は、最後に書き込まれた
+        すべてのプロセスの値の合計を返します。
+        """
+        store = self.__store
+        if store is None or not metric.summable:
+            return metric._values()
+        return store.values(metric.name)
+
+    def render(self) -> str:
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+            store = self.__store
+        if store is None:
+            return "".join(metric.render() for metric in metrics)
+        store.flush()
+        return "".join(
+            metric.render(self.values(metric) if metric.summable else None)
+            for metric in metrics
+        )
+
+
+registry = Registry()
+
+API_REQUEST_SECONDS = registry.histogram(
+    "youtube_api_request_duration_seconds",
+    "Latency of YouTube Data API requests, including each retry",
+    ("endpoint", "status"),
+)
+API_RETRIES = registry.counter(
+    "youtube_api_retries_total",
+    "YouTube Data API requests that were retried",
+    ("endpoint",),
+)
+API_PAGES = registry.counter(
+    "youtube_api_pages_total",
+    "Result pages fetched from the YouTube Data API, including cached pages",
+    ("endpoint",),
+)
+QUOTA_UNITS = registry.counter(
+    "youtube_api_quota_units_total",
+    "YouTube Data API quota units consumed",
+    ("endpoint",),
+)
+QUOTA_REMAINING = registry.gauge(
+    "youtube_api_quota_remaining_units",
+    "YouTube Data API quota units left for today",
+)
+CACHE_REQUESTS = registry.counter(
+    "youtube_api_cache_requests_total",
+    "Response cache lookups by result",
+    ("result",),
+)
+CACHE_HIT_RATIO = registry.gauge(
+    "youtube_api_cache_hit_ratio",
+    "Share of response cache lookups that were hits",
+)
+
+
+def _cache_hit_ratio() -> float:
+    values = registry.values(CACHE_REQUESTS)
+    hits = values.get(("hit",), [0])[0]
+    misses = values.get(("miss",), [0])[0]
+    return hits / max(1, hits + misses)
+
+
+CACHE_HIT_RATIO.set_function(_cache_hit_ratio)
+JOBS = registry.counter(
+    "download_jobs_total",
+    "Download jobs that reached a final status",
+    ("status",),
+)
+JOBS_QUEUED = registry.gauge("download_jobs_queued", "Download jobs waiting to run")
+JOBS_RUNNING = registry.gauge("download_jobs_running", "Download jobs running")
+JOB_SECONDS = registry.histogram(
+    "download_job_duration_seconds",
+    "Time from starting a download job until it finishes",
+    ("status",),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+DOWNLOAD_BYTES = registry.counter(
+    "download_bytes_total",
+    "Bytes downloaded by yt-dlp",
+)
+DOWNLOAD_SPEED = registry.gauge(
+    "download_speed_bytes_per_second",
+    "Current total download speed of running jobs in all processes",
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Latency of requests to the web app",
+    ("method", "route", "status"),
+)
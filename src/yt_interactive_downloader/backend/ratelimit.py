@@ -0,0 +1,160 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Final
+from zoneinfo import ZoneInfo
+
+
+class QuotaExceededError(RuntimeError):
+    pass
+
+
+class RateLimiter:
+    """
+    YouTube Data API へのリクエストを調整するトークンバケット兼クォータ管理
+
+    Parameters
+    ----------
+    rate : float, default=10
+        1 秒あたりに送信できるリクエスト数です。
+    burst : int, default=10
+        連続して送信できるリクエストの最大数です。
+    daily_quota : int, default=10000
+        1 日に消費できるクォータのユニット数です。
+        YouTube Data API のクォータは太平洋時間の 0 時にリセットされます。
+    path : str or Path, default=":memory:"
+        消費したクォータを記録する SQLite ファイルのパスです。
+        同じファイルを指定したプロセスは 1 日のクォータを共有します。
+        トークンバケットはプロセスごとに持つため、`rate` はプロセスごとの上限です。
+    """
+
+    COSTS: Final[dict[str, int]] = {
+        "search": 100,
+        "playlistItems": 1,
+        "videos": 1,
+    }
+    TIMEZONE: Final[ZoneInfo] = ZoneInfo("America/Los_Angeles")
+
+    def __init__(
+        self,
+        rate: float = 10,
+        burst: int = 10,
+        daily_quota: int = 10000,
+        path: str | Path = ":memory:",
+    ) -> None:
+        if rate <= 0 or burst <= 0:
+            raise ValueError("`rate` and `burst` must be positive")
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.rate = rate
+        self.burst = burst
+        self.daily_quota = daily_quota
+        self.__tokens = float(burst)
+        self.__updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(
+            str(path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quota (
+                day TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                used INTEGER NOT NULL,
+                requests INTEGER NOT NULL,
+                PRIMARY KEY (day, endpoint)
+            )
+            """
+        )
+
+    def _today(self) -> str:
+        return datetime.now(self.TIMEZONE).date().isoformat()
+
+    def cost(self, endpoint: str) -> int:
+        return self.COSTS.get(endpoint, 1)
+
+    def __used(self, day: str) -> int:
+        (used,) = self.__conn.execute(
+            "SELECT COALESCE(SUM(used), 0) FROM quota WHERE day = ?", (day,)
+        ).fetchone()
+        return used
+
+    def __consume(self, endpoint: str, cost: int) -> None:
+        """同じファイルを開いた他のプロセスの分も合わせて、今日のクォータから `cost` を引きます。"""
+        day = self._today()
+        self.__conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.__used(day) + cost > self.daily_quota:
+                raise QuotaExceededError(
+                    f"daily quota of {self.daily_quota} units exhausted"
+                )
+            self.__conn.execute(
+                "INSERT INTO quota VALUES (?, ?, ?, 1)"
+                " ON CONFLICT (day, endpoint) DO UPDATE"
+                " SET used = used + excluded.used, requests = requests + 1",
+                (day, endpoint, cost),
+            )
+            # 前日までの記録は使わないため消しておく
+            self.__conn.execute("DELETE FROM quota WHERE day < ?", (day,))
+        except BaseException:
+            self.__conn.execute("ROLLBACK")
+            raise
+        self.__conn.execute("COMMIT")
+
+    def acquire(self, endpoint: str) -> float:
+        """
+        `endpoint` へのリクエスト 1 回分のトークンとクォータを確保し、待った時間（秒）を返します。
+
+        Raises
+        ------
+        QuotaExceededError
+            1 日のクォータを使い切っている場合
+        """
+        cost = self.cost(endpoint)
+        waited = 0.0
+        while True:
+            with self.__lock:
+                if self.__used(self._today()) + cost > self.daily_quota:
+                    raise QuotaExceededError(
+                        f"daily quota of {self.daily_quota} units exhausted"
+                    )
+                now = time.monotonic()
+                self.__tokens = min(
+                    self.burst, self.__tokens + (now - self.__updated_at) * self.rate
+                )
+                self.__updated_at = now
+                if self.__tokens >= 1:
+                    self.__consume(endpoint, cost)
+                    self.__tokens -= 1
+                    return waited
+                delay = (1 - self.__tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def remaining(self) -> int:
+        with self.__lock:
+            return self.daily_quota - self.__used(self._today())
+
+    def stats(self) -> dict[str, Any]:
+        day = self._today()
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT endpoint, used, requests FROM quota WHERE day = ?", (day,)
+            ).fetchall()
+        used = {endpoint: value for endpoint, value, _ in rows}
+        return {
+            "day": day,
+            "dailyQuota": self.daily_quota,
+            "used": sum(used.values()),
+            "remaining": self.daily_quota - sum(used.values()),
+            "usedByEndpoint": used,
+            "requestsByEndpoint": {endpoint: count for endpoint, _, count in rows},
+        }
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
@@ -0,0 +1,172 @@
+import contextlib
+import hashlib
+import os
+import re
+import shlex
+import subprocess
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterable
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_chunks(path: str | Path, chunk_size: int = CHUNK_SIZE) -> Iterable[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+class Sink(ABC):
+    """
+    ダウンロードしたデータの書き込み先
+
+    `write` はデータを一時的な名前で書き込み、チェックサムを確認してから `name` に置き換えます。
+    """
+
+    location: str = ""
+
+    @abstractmethod
+    def write(self, name: str, chunks: Iterable[bytes]) -> tuple[int, str]:
+        """
+        `chunks` を `name` として書き込み、サイズと SHA-256 を返します。
+        """
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        """`name` が書き込み済みかどうかを返します。"""
+
+
+class LocalSink(Sink):
+    """
+    ローカルのディレクトリに書き込む Sink
+
+    Parameters
+    ----------
+    path : str or Path
+        保存先のディレクトリです。
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.location = "local"
+
+    def write(self, name: str, chunks: Iterable[bytes]) -> tuple[int, str]:
+        self.path.mkdir(parents=True, exist_ok=True)
+        part = self.path / f"{name}.part"
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            with open(part, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        os.replace(part, self.path / name)
+        return size, sha256.hexdigest()
+
+    def exists(self, name: str) -> bool:
+        return (self.path / name).is_file()
+
+
+class SSHSink(Sink):
+    """
+    ssh 経由でリモートサーバーのディレクトリに書き込む Sink
+
+    データは ssh の標準入力にそのまま流すため、ローカルのディスクは使いません。
+    書き込み後にリモートで SHA-256 を計算し、一致した場合だけファイルを置き換えます。
+
+    Parameters
+    ----------
+    server : str
+        ssh の接続先です。"-" で始まる値は ssh のオプションとして解釈されるため受け付けません。
+    path : str
+        リモートの保存先ディレクトリです。
+
+    Raises
+    ------
+    ValueError
+        `server` が ssh の接続先として不正な場合
+    """
+
+    def __init__(self, server: str, path: str) -> None:
+        if server.startswith("-") or re.search(r"\s", server) or not server:
+            raise ValueError(f"invalid ssh destination: {server!r}")
+        self.server = server
+        # ssh のコマンドはホームディレクトリで実行されるため、~ と ~/ は相対パスとして扱う
+        self.path = re.sub(r"^~(?:/|$)", "", path).rstrip("/") or "."
+        self.location = server
+
+    @staticmethod
+    def _quote(path: str) -> str:
+        # ~user/ はリモートのシェルに展開させるため、それ以降だけをクォートする
+        match = re.fullmatch(r"(~[A-Za-z0-9._-]+)(/.*)?", path)
+        if match is None:
+            return shlex.quote(path)
+        return match.group(1) + shlex.quote(match.group(2) or "/")
+
+    def _remote(self, name: str) -> str:
+        return self._quote(f"{self.path}/{name}")
+
+    def _args(self, command: str) -> list[str]:
+        # 接続先がオプションとして解釈されないよう -- で区切る
+        return ["ssh", "--", self.server, command]
+
+    def _ssh(self, command: str, **kwargs: object) -> subprocess.CompletedProcess:
+        return subprocess.run(self._args(command), check=True, **kwargs)  # type: ignore
+
+    def write(self, name: str, chunks: Iterable[bytes]) -> tuple[int, str]:
+        part = self._remote(f"{name}.part")
+        proc = subprocess.Popen(
+            self._args(f"mkdir -p {self._quote(self.path)} && cat > {part}"),
+            stdin=subprocess.PIPE,
+        )
+        assert proc.stdin is not None
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+        except BaseException:
+            # ssh が先に終了していた場合、close は BrokenPipeError になる
+            with contextlib.suppress(BrokenPipeError):
+                proc.stdin.close()
+            proc.kill()
+            proc.wait()
+            subprocess.run(self._args(f"rm -f {part}"), stdin=subprocess.DEVNULL)
+            raise
+        with contextlib.suppress(BrokenPipeError):
+            proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"upload to {self.server} failed")
+        digest = sha256.hexdigest()
+        remote_digest = self._ssh(
+            f"sha256sum {part} 2>/dev/null || shasum -a 256 {part}",
+            capture_output=True,
+            text=True,
+        ).stdout.split()[0]
+        if remote_digest != digest:
+            self._ssh(f"rm -f {part}")
+            raise RuntimeError(f"checksum mismatch for {name} on {self.server}")
+        self._ssh(f"mv {part} {self._remote(name)}")
+        return size, digest
+
+    def exists(self, name: str) -> bool:
+        """
+        Raises
+        ------
+        RuntimeError
+            ssh で接続できなかった場合
+        """
+        returncode = subprocess.run(
+            self._args(f"test -f {self._remote(name)}"), stdin=subprocess.DEVNULL
+        ).returncode
+        # ssh は接続に失敗すると 255 を返す
+        if returncode == 255:
+            raise RuntimeError(f"cannot connect to {self.server}")
+        return returncode == 0
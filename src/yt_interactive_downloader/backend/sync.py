@@ -0,0 +1,244 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from .youtube import YouTube, YouTubeAPIError, video_id_of
+
+
+class PlaylistSync:
+    """
+    再生リストのアイテムを SQLite のインデックスに保存し、差分だけを取得する同期処理
+
+    ページごとの ETag を保存して If-None-Match で変更のないページの転送を省き、
+    取得済みのアイテムに到達した時点でページングを打ち切ります。
+    取得中のページトークンをチェックポイントとして保存するため、
+    中断した場合は次回の `sync` で続きから再開します。
+
+    Parameters
+    ----------
+    youtube : YouTube
+        API クライアントです。
+    path : str or Path, default=":memory:"
+        インデックスを保存する SQLite ファイルのパスです。
+    """
+
+    def __init__(self, youtube: YouTube, path: str | Path = ":memory:") -> None:
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.youtube = youtube
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS playlist_items (
+                item_id TEXT PRIMARY KEY,
+                playlist_id TEXT NOT NULL,
+                video_id TEXT,
+                published_at TEXT,
+                etag TEXT,
+                data TEXT NOT NULL,
+                first_seen_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS playlist_items_playlist_id
+                ON playlist_items (playlist_id, published_at);
+            CREATE TABLE IF NOT EXISTS pages (
+                playlist_id TEXT NOT NULL,
+                page_token TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                next_page_token TEXT,
+                PRIMARY KEY (playlist_id, page_token)
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                playlist_id TEXT PRIMARY KEY,
+                page_token TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+        self.__conn.commit()
+
+    def _checkpoint(self, playlistId: str) -> str | None:
+        row = self.__conn.execute(
+            "SELECT page_token FROM checkpoints WHERE playlist_id = ?", (playlistId,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _page(self, playlistId: str, pageToken: str) -> tuple[str, str | None] | None:
+        return self.__conn.execute(
+            "SELECT etag, next_page_token FROM pages"
+            " WHERE playlist_id = ? AND page_token = ?",
+            (playlistId, pageToken),
+        ).fetchone()
+
+    def _store_page(
+        self,
+        playlistId: str,
+        pageToken: str | None,
+        res_dict: dict[str, Any],
+    ) -> list[dict[str, Any]]:
+        now = time.time()
+        new_items = []
+        for item in res_dict["items"]:
+            known = self.__conn.execute(
+                "SELECT 1 FROM playlist_items WHERE item_id = ?", (item["id"],)
+            ).fetchone()
+            if known is None:
+                new_items.append(item)
+            self.__conn.execute(
+                """
+                INSERT INTO playlist_items VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (item_id) DO UPDATE SET
+                    published_at = excluded.published_at,
+                    etag = excluded.etag,
+                    data = excluded.data
+                """,
+                (
+                    item["id"],
+                    playlistId,
+                    video_id_of(item),
+                    item.get("contentDetails", {}).get("videoPublishedAt")
+                    or item.get("snippet", {}).get("publishedAt"),
+                    item.get("etag"),
+                    json.dumps(item, ensure_ascii=False),
+                    now,
+                ),
+            )
+        nextPageToken = res_dict.get("nextPageToken")
+        if "etag" in res_dict:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                (playlistId, pageToken or "", res_dict["etag"], nextPageToken),
+            )
+        if nextPageToken is None:
+            self.__conn.execute(
+                "DELETE FROM checkpoints WHERE playlist_id = ?", (playlistId,)
+            )
+        else:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)",
+                (playlistId, nextPageToken, now),
+            )
+        self.__conn.commit()
+        return new_items
+
+    def sync(
+        self,
+        playlistId: str,
+        *,
+        part: str = "snippet,contentDetails",
+        full: bool = False,
+        max_pages: int = 10000,
+    ) -> dict[str, Any]:
+        """
+        再生リストを同期し、新しく見つかったアイテムを返します。
+
+        新しいアイテムが先頭に追加される再生リスト（チャンネルのアップロード再生リストなど）を想定し、
+        変更のないページや既知のアイテムを含むページに到達した時点で終了します。
+        チェックポイントから再開する場合と `full=True` の場合は最後のページまで取得します。
+
+        Parameters
+        ----------
+        playlistId : str
+            同期する再生リストの ID です。
+        part : str, default="snippet,contentDetails"
+            取得する playlistItem リソースのプロパティです。
+        full : bool, default=False
+            途中で打ち切らずにすべてのページを確認します。
+        max_pages : int, default=10000
+            1 回の同期で取得するページ数の上限です。
+
+        Returns
+        -------
+        dict
+            "new" に新しいアイテム、"pages" に取得したページ数、"notModified" に
+            304 が返ったページ数、"resumed" にチェックポイントから再開したかどうか、
+            "complete" に最後まで同期できたかどうかを持つ辞書です。
+
+        Raises
+        ------
+        YouTubeAPIError
+            API がエラーを返した場合。取得済みのページまではチェックポイントに残ります。
+        """
+        with self.__lock:
+            pageToken = self._checkpoint(playlistId)
+            resumed = pageToken is not None
+            stop_at_known = not (resumed or full)
+            new_items: list[dict[str, Any]] = []
+            pages = 0
+            not_modified = 0
+            complete = False
+            while pages < max_pages:
+                page = self._page(playlistId, pageToken or "")
+                res_dict, status_code = self.youtube.fetch_playlist_items_page(
+                    playlistId=playlistId,
+                    part=part,
+                    pageToken=pageToken,
+                    etag=None if page is None else page[0],
+                )
+                pages += 1
+                if status_code == 304:
+                    assert page is not None
+                    not_modified += 1
+                    pageToken = page[1]
+                    if stop_at_known or pageToken is None:
+                        complete = True
+                        break
+                    continue
+                if not 200 <= status_code < 300:
+                    raise YouTubeAPIError(status_code, res_dict)
+                page_items = self._store_page(playlistId, pageToken, res_dict)
+                new_items.extend(page_items)
+                pageToken = res_dict.get("nextPageToken")
+                if pageToken is None or (
+                    stop_at_known and len(page_items) < len(res_dict["items"])
+                ):
+                    complete = True
+                    break
+            if complete:
+                self.__conn.execute(
+                    "DELETE FROM checkpoints WHERE playlist_id = ?", (playlistId,)
+                )
+                self.__conn.commit()
+        return {
+            "playlistId": playlistId,
+            "new": new_items,
+            "pages": pages,
+            "notModified": not_modified,
+            "resumed": resumed,
+            "complete": complete,
+        }
+
+    def items(self, playlistId: str) -> list[dict[str, Any]]:
+        """保存済みのアイテムを公開日の新しい順に返します。"""
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT data FROM playlist_items WHERE playlist_id = ?"
+                " ORDER BY published_at DESC",
+                (playlistId,),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def state(self, playlistId: str) -> dict[str, Any]:
+        """保存済みのアイテム数、最新の公開日、チェックポイントを返します。"""
+        with self.__lock:
+            count, last_published_at = self.__conn.execute(
+                "SELECT COUNT(*), MAX(published_at) FROM playlist_items"
+                " WHERE playlist_id = ?",
+                (playlistId,),
+            ).fetchone()
+            checkpoint = self._checkpoint(playlistId)
+        return {
+            "playlistId": playlistId,
+            "items": count,
+            "lastPublishedAt": last_published_at,
+            "checkpoint": checkpoint,
+        }
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__conn.close()
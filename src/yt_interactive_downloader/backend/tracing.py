@@ -0,0 +1,95 @@
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+trace_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "trace_id", default=None
+)
+
+# LogRecord の標準の属性。これ以外の extra で渡された属性を JSON に含める
+_RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "trace_id"}
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace_id() -> str | None:
+    return trace_id_var.get()
+
+
+@contextmanager
+def trace(trace_id: str | None = None) -> Iterator[str]:
+    """
+    ブロックの中で出力するログに `trace_id` を付けます。省略した場合は新しい ID を作ります。
+    """
+    trace_id = trace_id or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        trace_id_var.reset(token)
+
+
+class TraceIdFilter(logging.Filter):
+    """ログレコードに現在のトレース ID を `trace_id` として付けます。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ログを 1 行 1 オブジェクトの JSON として出力するフォーマッター"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "traceId": getattr(record, "trace_id", None) or trace_id_var.get(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(format: str = "text", level: str | int = "INFO") -> None:
+    """
+    ルートロガーにトレース ID 付きのハンドラーを設定します。
+
+    Parameters
+    ----------
+    format : {"text", "json"}, default="text"
+        "json" の場合は構造化ログを出力します。
+    level : str or int, default="INFO"
+        ログレベルです。
+    """
+    handler = logging.StreamHandler()
+    handler.addFilter(TraceIdFilter())
+    if format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"
+            )
+        )
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if getattr(existing, "_yt_interactive_downloader", False):
+            root.removeHandler(existing)
+    handler._yt_interactive_downloader = True  # type: ignore[attr-defined]
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
@@ -1,21 +1,340 @@
+import asyncio
+import contextvars
+import logging
+import random
 import time
-from typing import Any, Final, Literal
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Final,
+    Iterator,
+    Literal,
+    Sequence,
+)
 
 import requests
-from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+
+from .cache import ResponseCache
+from .metrics import (
+    API_PAGES,
+    API_REQUEST_SECONDS,
+    API_RETRIES,
+    CACHE_REQUESTS,
+    QUOTA_UNITS,
+)
+from .ratelimit import QuotaExceededError, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class YouTubeAPIError(RuntimeError):
+    def __init__(self, status_code: int, response: dict[str, Any]) -> None:
+        super().__init__(
+            f"{status_code}: {response.get('error', {}).get('message', '')}"
+        )
+        self.status_code = status_code
+        self.response = response
+
+
+def project(item: dict[str, Any], fields: Sequence[str]) -> dict[str, Any]:
+    """
+    `item` から "snippet.title" のようなドット区切りのパスで指定したプロパティだけを残した辞書を返します。
+    """
+    projected: dict[str, Any] = {}
+    for field in fields:
+        keys = field.split(".")
+        value: Any = item
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return projected
+
+
+def video_id_of(item: dict[str, Any]) -> str | None:
+    """
+    search / playlistItems / videos のいずれのリソースからでも動画 ID を取り出します。
+    動画以外のリソースの場合は None を返します。
+    """
+    id = item.get("id")
+    if isinstance(id, dict):
+        return id.get("videoId")
+    if item.get("kind") == "youtube#video":
+        return id
+    videoId = item.get("contentDetails", {}).get("videoId")
+    if videoId is None:
+        videoId = item.get("snippet", {}).get("resourceId", {}).get("videoId")
+    return videoId
 
 
 class YouTube:
+    BASE_URL: Final[str] = "https://www.googleapis.com/youtube/v3"
     SEARCH_ENDPOINT: Final[str] = "https://www.googleapis.com/youtube/v3/search"
     PLAYLISTITEMS_ENDPOINT: Final[
         str
     ] = "https://www.googleapis.com/youtube/v3/playlistItems"
     VIDEOS_ENDPOINT: Final[str] = "https://www.googleapis.com/youtube/v3/videos"
+    RETRY_STATUSES: Final[frozenset[int]] = frozenset({429, 500, 502, 503, 504})
+    RETRY_REASONS: Final[frozenset[str]] = frozenset(
+        {"rateLimitExceeded", "userRateLimitExceeded", "backendError"}
+    )
 
-    def __init__(self, key: str) -> None:
+    def __init__(
+        self,
+        key: str,
+        cache: ResponseCache | None = None,
+        rate_limiter: RateLimiter | None = None,
+        *,
+        base_url: str | None = None,
+        timeout: float | tuple[float, float] = (3.05, 30),
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 60,
+        pool_maxsize: int = 10,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        key : str
+            YouTube Data API の API キーです。
+        cache : ResponseCache, optional
+            レスポンスを保存するキャッシュです。
+        rate_limiter : RateLimiter, optional
+            リクエスト頻度とクォータ消費を管理するリミッターです。省略した場合は既定値の RateLimiter を使います。
+            複数のクライアントで 1 日のクォータを共有する場合は同じインスタンスを渡します。
+        base_url : str, optional
+            API のベース URL です。テスト用のスタブサーバーに向ける場合に指定します。
+        timeout : float or tuple of float, default=(3.05, 30)
+            requests に渡す (接続, 読み込み) のタイムアウト（秒）です。
+        max_retries : int, default=5
+            429 や 5xx、レート制限の 403 が返った場合に再試行する最大回数です。
+        backoff_factor : float, default=0.5
+            指数バックオフの基準時間（秒）です。n 回目の再試行の前に 0 から backoff_factor * 2 ** n 秒の間でランダムに待ちます。
+            Retry-After ヘッダーがある場合はその値を優先します。
+        backoff_max : float, default=60
+            1 回の待ち時間の上限（秒）です。
+        pool_maxsize : int, default=10
+            コネクションプールに保持する接続の最大数です。
+        """
         self.__key = key
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=3, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-    def search(
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "YouTube":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def quota(self) -> dict[str, Any]:
+        return self.rate_limiter.stats()
+
+    def _url(self, endpoint: str) -> str:
+        return self.base_url + endpoint[len(self.BASE_URL) :]
+
+    def _should_retry(self, status_code: int, res_dict: dict[str, Any]) -> bool:
+        if status_code in self.RETRY_STATUSES:
+            return True
+        if status_code == 403:
+            errors = res_dict.get("error", {}).get("errors", [])
+            return any(error.get("reason") in self.RETRY_REASONS for error in errors)
+        return False
+
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        delay = random.uniform(
+            0, min(self.backoff_max, self.backoff_factor * 2**attempt)
+        )
+        if retry_after is not None:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+            delay = min(self.backoff_max, max(0.0, delay)) + random.uniform(0, 1)
+        time.sleep(delay)
+        return delay
+
+    def _request(
+        self,
+        endpoint: str,
+        params: dict[str, Any],
+        headers: dict[str, str] | None = None,
+    ) -> tuple[dict[str, Any], int]:
+        url = self._url(endpoint)
+        name = endpoint.rsplit("/", 1)[-1]
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                API_RETRIES.inc(endpoint=name)
+            try:
+                self.rate_limiter.acquire(name)
+            except QuotaExceededError as e:
+                logger.warning("quota exhausted before calling %s: %s", name, e)
+                return {
+                    "error": {
+                        "code": 403,
+                        "message": str(e),
+                        "errors": [{"reason": "quotaExceeded"}],
+                    }
+                }, 403
+            QUOTA_UNITS.inc(self.rate_limiter.cost(name), endpoint=name)
+            started_at = time.perf_counter()
+            try:
+                res = self.session.get(
+                    url, params=params, headers=headers, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                API_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started_at, endpoint=name, status="599"
+                )
+                logger.warning("request to %s failed: %s", name, e)
+                if attempt == self.max_retries:
+                    return {"error": {"code": 599, "message": str(e)}}, 599
+                self._backoff(attempt)
+                continue
+            elapsed = time.perf_counter() - started_at
+            API_REQUEST_SECONDS.observe(
+                elapsed, endpoint=name, status=str(res.status_code)
+            )
+            logger.debug(
+                "%s returned %d in %.3fs",
+                name,
+                res.status_code,
+                elapsed,
+                extra={"endpoint": name, "status": res.status_code, "elapsed": elapsed},
+            )
+            if res.status_code == 304:
+                return {}, 304
+            try:
+                res_dict = res.json()
+            except ValueError:
+                res_dict = {"error": {"code": res.status_code, "message": res.text}}
+            if attempt == self.max_retries or not self._should_retry(
+                res.status_code, res_dict
+            ):
+                return res_dict, res.status_code
+            logger.info(
+                "retrying %s after %d (attempt %d)", name, res.status_code, attempt + 1
+            )
+            self._backoff(attempt, res.headers.get("Retry-After"))
+        raise AssertionError("unreachable")
+
+    def _get(
+        self, endpoint: str, params: dict[str, Any]
+    ) -> tuple[dict[str, Any], int, bool]:
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, params)
+            CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached, 200, True
+        res_dict, status_code = self._request(endpoint, params)
+        if self.cache is not None and 200 <= status_code < 300:
+            self.cache.set(endpoint, params, res_dict)
+        return res_dict, status_code, False
+
+    def _paginate(
+        self,
+        endpoint: str,
+        params: dict[str, Any],
+        maxResults: int,
+        time_sleep: float,
+    ) -> Iterator[tuple[dict[str, Any], int]]:
+        max_iter = 1
+        if maxResults <= 0:
+            max_iter = 10000
+            maxResults = 50
+        if maxResults > 50:
+            max_iter = maxResults // 50
+            maxResults = 50
+        params = dict(params)
+        # maxResults を送らないリクエスト (None) ではそのままにする
+        if params.get("maxResults") is not None:
+            params["maxResults"] = maxResults
+
+        name = endpoint.rsplit("/", 1)[-1]
+        totalResults = None
+        for page in range(max_iter):
+            res_dict, status_code, cached = self._get(endpoint, params)
+            if not 200 <= status_code < 300:
+                logger.error(
+                    "%s failed with %d: %s",
+                    name,
+                    status_code,
+                    res_dict.get("error", {}).get("message"),
+                )
+                yield res_dict, status_code
+                return
+            API_PAGES.inc(endpoint=name)
+            if totalResults is None:
+                totalResults = int(res_dict["pageInfo"]["totalResults"])
+                logger.info("%s has %d results", name, totalResults)
+            logger.debug("fetched page %d of %s (cached=%s)", page + 1, name, cached)
+            yield res_dict, status_code
+            pageToken = res_dict.get("nextPageToken")
+            if pageToken is None:
+                break
+            params["pageToken"] = pageToken
+            if time_sleep > 0 and not cached:
+                time.sleep(time_sleep)
+
+    @staticmethod
+    def _collect(
+        pages: Iterator[tuple[dict[str, Any], int]]
+    ) -> tuple[dict[str, Any], int]:
+        items = []
+        for res_dict, status_code in pages:
+            if not 200 <= status_code < 300:
+                return res_dict, status_code
+            items.extend(res_dict["items"])
+        res_dict["items"] = items
+        logger.debug("fetched %d results", len(items))
+        return res_dict, status_code
+
+    @staticmethod
+    def _iter_items(
+        pages: Iterator[tuple[dict[str, Any], int]],
+        fields: Sequence[str] | None = None,
+    ) -> Iterator[dict[str, Any]]:
+        for res_dict, status_code in pages:
+            if not 200 <= status_code < 300:
+                raise YouTubeAPIError(status_code, res_dict)
+            for item in res_dict["items"]:
+                yield item if fields is None else project(item, fields)
+
+    @staticmethod
+    async def _aiterate(
+        iterator: Iterator[dict[str, Any]]
+    ) -> AsyncIterator[dict[str, Any]]:
+        while True:
+            item: dict[str, Any] | None = await asyncio.to_thread(next, iterator, None)
+            if item is None:
+                return
+            yield item
+
+    def search_pages(
         self,
         *,
         part: Literal["id", "snippet"] = "snippet",
@@ -46,9 +365,12 @@ class YouTube:
         videoLicense: str | None = None,
         videoSyndicated: str | None = None,
         videoType: str | None = None,
-        time_sleep: float = 0.5,
-    ) -> tuple[dict[str, Any], int]:
+        time_sleep: float = 0.0,
+    ) -> Iterator[tuple[dict[str, Any], int]]:
         """
+        検索結果を 1 ページずつ取得し、レスポンスとステータスコードを返します。
+        エラーが返った場合はそのレスポンスを最後に返して終了します。
+
         Parameters
         ----------
         part : str
@@ -181,72 +503,146 @@ class YouTube:
             - movie – 動画のみを取得します。
         """
         assert relatedToVideoId is None, "`relatedToVideoId` is deprecated"
-        max_iter = 1
-        if maxResults <= 0:
-            max_iter = 10000
-            maxResults = 50
-        if maxResults > 50:
-            max_iter = maxResults // 50
-            maxResults = 50
+        params = {
+            "key": self.__key,
+            "part": part,
+            "filter": filter,
+            # "relatedToVideoId": relatedToVideoId,  # deprecated
+            "channelId": channelId,
+            "channelType": channelType,
+            "maxResults": maxResults,
+            "onBehalfOfContentOwner": onBehalfOfContentOwner,
+            "order": order,
+            "pageToken": pageToken,
+            "publishedAfter": publishedAfter,
+            "publishedBefore": publishedBefore,
+            "q": q,
+            "regionCode": regionCode,
+            "relevanceLanguage": relevanceLanguage,
+            "safeSearch": safeSearch,
+            "topicId": topicId,
+            "type": type,
+            "videoCaption": videoCaption,
+            "videoCategoryId": videoCategoryId,
+            "videoDefinition": videoDefinition,
+            "videoDimension": videoDimension,
+            "videoDuration": videoDuration,
+            "videoEmbeddable": videoEmbeddable,
+            "videoLicense": videoLicense,
+            "videoSyndicated": videoSyndicated,
+            "videoType": videoType,
+        }
+        return self._paginate(self.SEARCH_ENDPOINT, params, maxResults, time_sleep)
 
-        totalResults = None
-        items = []
-        for _ in tqdm(range(max_iter)):
-            params = {
-                "key": self.__key,
-                "part": part,
-                "filter": filter,
-                # "relatedToVideoId": relatedToVideoId,  # deprecated
-                "channelId": channelId,
-                "channelType": channelType,
-                "maxResults": maxResults,
-                "onBehalfOfContentOwner": onBehalfOfContentOwner,
-                "order": order,
-                "pageToken": pageToken,
-                "publishedAfter": publishedAfter,
-                "publishedBefore": publishedBefore,
-                "q": q,
-                "regionCode": regionCode,
-                "relevanceLanguage": relevanceLanguage,
-                "safeSearch": safeSearch,
-                "topicId": topicId,
-                "type": type,
-                "videoCaption": videoCaption,
-                "videoCategoryId": videoCategoryId,
-                "videoDefinition": videoDefinition,
-                "videoDimension": videoDimension,
-                "videoDuration": videoDuration,
-                "videoEmbeddable": videoEmbeddable,
-                "videoLicense": videoLicense,
-                "videoSyndicated": videoSyndicated,
-                "videoType": videoType,
-            }
-            res = requests.get(self.SEARCH_ENDPOINT, params=params)
-            res_dict = res.json()
-            items.extend(res_dict["items"])
-            if totalResults is None:
-                totalResults = int(res_dict["pageInfo"]["totalResults"])
-                print("TotalResults:", totalResults)
-            pageToken = res_dict.get("nextPageToken")
-            if pageToken is None:
-                break
-            time.sleep(time_sleep)
-        res_dict["items"] = items
-        print("Fetched Results:", len(items))
-        return res_dict, res.status_code
+    def search(
+        self,
+        *,
+        part: Literal["id", "snippet"] = "snippet",
+        filter: Literal[
+            "forContentOwner", "forMine", "forDeveloper"
+        ] = "forContentOwner",
+        relatedToVideoId: str | None = None,  # deprecated
+        channelId: str | None = None,
+        channelType: str | None = None,
+        maxResults: int = 5,
+        onBehalfOfContentOwner: str | None = None,
+        order: str | None = None,
+        pageToken: str | None = None,
+        publishedAfter: str | None = None,
+        publishedBefore: str | None = None,
+        q: str | None = None,
+        regionCode: str | None = None,
+        relevanceLanguage: str | None = None,
+        safeSearch: str | None = None,
+        topicId: str | None = None,
+        type: str | None = None,
+        videoCaption: str | None = None,
+        videoCategoryId: str | None = None,
+        videoDefinition: str | None = None,
+        videoDimension: str | None = None,
+        videoDuration: str | None = None,
+        videoEmbeddable: str | None = None,
+        videoLicense: str | None = None,
+        videoSyndicated: str | None = None,
+        videoType: str | None = None,
+        time_sleep: float = 0.0,
+    ) -> tuple[dict[str, Any], int]:
+        """
+        全ページを取得し、アイテムをまとめたレスポンスとステータスコードを返します。
+        引数は `search_pages` と同じです。
+        """
+        return self._collect(
+            self.search_pages(
+                part=part,
+                filter=filter,
+                relatedToVideoId=relatedToVideoId,
+                channelId=channelId,
+                channelType=channelType,
+                maxResults=maxResults,
+                onBehalfOfContentOwner=onBehalfOfContentOwner,
+                order=order,
+                pageToken=pageToken,
+                publishedAfter=publishedAfter,
+                publishedBefore=publishedBefore,
+                q=q,
+                regionCode=regionCode,
+                relevanceLanguage=relevanceLanguage,
+                safeSearch=safeSearch,
+                topicId=topicId,
+                type=type,
+                videoCaption=videoCaption,
+                videoCategoryId=videoCategoryId,
+                videoDefinition=videoDefinition,
+                videoDimension=videoDimension,
+                videoDuration=videoDuration,
+                videoEmbeddable=videoEmbeddable,
+                videoLicense=videoLicense,
+                videoSyndicated=videoSyndicated,
+                videoType=videoType,
+                time_sleep=time_sleep,
+            )
+        )
 
-    def fetch_playlist_items(
+    def iter_search(
+        self, *, fields: Sequence[str] | None = None, **kwargs: Any
+    ) -> Iterator[dict[str, Any]]:
+        """
+        取得したページから順に検索結果のアイテムを返します。
+        `fields` 以外の引数は `search_pages` と同じです。
+
+        Parameters
+        ----------
+        fields : sequence of str, optional
+            残すプロパティを "snippet.title" のようなドット区切りのパスで指定します。
+            省略した場合はアイテム全体を返します。
+
+        Raises
+        ------
+        YouTubeAPIError
+            API がエラーを返した場合
+        """
+        return self._iter_items(self.search_pages(**kwargs), fields)
+
+    def aiter_search(
+        self, *, fields: Sequence[str] | None = None, **kwargs: Any
+    ) -> AsyncIterator[dict[str, Any]]:
+        """`iter_search` の非同期版です。"""
+        return self._aiterate(self.iter_search(fields=fields, **kwargs))
+
+    def fetch_playlist_items_pages(
         self,
         *,
-        part: Literal["id", "snippet", "contentDetails", "status"] = "snippet",
+        part: str = "snippet",
         id: str | None = None,
         playlistId: str | None = None,
         maxResults: int = -1,
         pageToken: str | None = None,
         videoId: str | None = None,
-        time_sleep: float = 0.5,
-    ) -> tuple[dict[str, Any], int]:
+        time_sleep: float = 0.0,
+    ) -> Iterator[tuple[dict[str, Any], int]]:
         """
+        再生リスト アイテムを 1 ページずつ取得し、レスポンスとステータスコードを返します。
+
         Parameters
         ----------
         part : str
@@ -273,42 +669,133 @@ class YouTube:
             id is not None and playlistId is not None
         ):
             raise ValueError
-        max_iter = 1
-        if maxResults <= 0:
-            max_iter = 10000
-            maxResults = 50
-        if maxResults > 50:
-            max_iter = maxResults // 50
-            maxResults = 50
+        params = {
+            "key": self.__key,
+            "part": part,
+            "id": id,
+            "playlistId": playlistId,
+            "maxResults": maxResults,
+            "pageToken": pageToken,
+            "videoId": videoId,
+        }
+        return self._paginate(
+            self.PLAYLISTITEMS_ENDPOINT, params, maxResults, time_sleep
+        )
 
-        totalResults = None
-        items = []
-        for _ in tqdm(range(max_iter)):
-            params = {
-                "key": self.__key,
-                "part": part,
-                "id": id,
-                "playlistId": playlistId,
-                "maxResults": maxResults,
-                "pageToken": pageToken,
-                "videoId": videoId,
-            }
-            res = requests.get(self.PLAYLISTITEMS_ENDPOINT, params=params)
-            res_dict = res.json()
-            items.extend(res_dict["items"])
-            if totalResults is None:
-                totalResults = int(res_dict["pageInfo"]["totalResults"])
-                print("TotalResults:", totalResults)
-            pageToken = res_dict.get("nextPageToken")
-            if pageToken is None:
-                break
-            time.sleep(time_sleep)
-        res_dict["items"] = items
-        print("Fetched Results:", len(items))
-        return res_dict, res.status_code
+    def fetch_playlist_items_page(
+        self,
+        *,
+        playlistId: str,
+        part: str = "snippet,contentDetails",
+        pageToken: str | None = None,
+        etag: str | None = None,
+    ) -> tuple[dict[str, Any], int]:
+        """
+        再生リスト アイテムを 1 ページだけ、キャッシュを通さずに取得します。
+
+        `etag` を指定すると If-None-Match ヘッダーを送り、ページが変わっていなければ
+        空の辞書とステータスコード 304 を返します。
+        """
+        params = {
+            "key": self.__key,
+            "part": part,
+            "playlistId": playlistId,
+            "maxResults": 50,
+            "pageToken": pageToken,
+        }
+        headers = {"If-None-Match": etag} if etag is not None else None
+        return self._request(self.PLAYLISTITEMS_ENDPOINT, params, headers)
+
+    def fetch_playlist_items(
+        self,
+        *,
+        part: str = "snippet",
+        id: str | None = None,
+        playlistId: str | None = None,
+        maxResults: int = -1,
+        pageToken: str | None = None,
+        videoId: str | None = None,
+        time_sleep: float = 0.0,
+    ) -> tuple[dict[str, Any], int]:
+        """
+        全ページを取得し、アイテムをまとめたレスポンスとステータスコードを返します。
+        引数は `fetch_playlist_items_pages` と同じです。
+        """
+        return self._collect(
+            self.fetch_playlist_items_pages(
+                part=part,
+                id=id,
+                playlistId=playlistId,
+                maxResults=maxResults,
+                pageToken=pageToken,
+                videoId=videoId,
+                time_sleep=time_sleep,
+            )
+        )
+
+    def iter_playlist_items(
+        self, *, fields: Sequence[str] | None = None, **kwargs: Any
+    ) -> Iterator[dict[str, Any]]:
+        """
+        取得したページから順に再生リスト アイテムを返します。
+        `fields` 以外の引数は `fetch_playlist_items_pages` と同じです。
+        `fields` については `iter_search` を参照してください。
+        """
+        return self._iter_items(self.fetch_playlist_items_pages(**kwargs), fields)
+
+    def aiter_playlist_items(
+        self, *, fields: Sequence[str] | None = None, **kwargs: Any
+    ) -> AsyncIterator[dict[str, Any]]:
+        """`iter_playlist_items` の非同期版です。"""
+        return self._aiterate(self.iter_playlist_items(fields=fields, **kwargs))
+
+    def fetch_videos_pages(
+        self,
+        *,
+        part: str = "snippet",
+        chart: Literal["mostPopular"] | None = None,
+        id: str | None = None,
+        myRating: Literal["dislike", "like"] | None = None,
+        hl: str | None = None,
+        maxHeight: int | None = None,
+        maxResults: int = 5,
+        maxWidth: int | None = None,
+        onBehalfOfContentOwner: str | None = None,
+        pageToken: str | None = None,
+        regionCode: str | None = None,
+        videoCategoryId: str | None = None,
+        time_sleep: float = 0.0,
+    ) -> Iterator[tuple[dict[str, Any], int]]:
+        """
+        動画リソースを 1 ページずつ取得し、レスポンスとステータスコードを返します。
+
+        API は id と maxResults の組み合わせに対応していないため、`id` を指定した場合は
+        maxResults を送らず、指定した (50 件以下の) 動画を 1 回で取得します。
+        """
+        params = {
+            "key": self.__key,
+            "part": part,
+            "hl": hl,
+            "maxHeight": maxHeight,
+            "maxResults": maxResults,
+            "maxWidth": maxWidth,
+            "onBehalfOfContentOwner": onBehalfOfContentOwner,
+            "pageToken": pageToken,
+            "regionCode": regionCode,
+            "videoCategoryId": videoCategoryId,
+        }
+        if chart is not None:
+            params["chart"] = chart
+        if id is not None:
+            params["id"] = id
+            params["maxResults"] = None
+        if myRating is not None:
+            params["myRating"] = myRating
+        return self._paginate(self.VIDEOS_ENDPOINT, params, maxResults, time_sleep)
 
     def fetch_videos(
         self,
+        *,
         part: str = "snippet",
         chart: Literal["mostPopular"] | None = None,
         id: str | None = None,
@@ -321,47 +808,226 @@ class YouTube:
         pageToken: str | None = None,
         regionCode: str | None = None,
         videoCategoryId: str | None = None,
-        time_sleep: float = 0.5,
+        time_sleep: float = 0.0,
     ) -> tuple[dict[str, Any], int]:
-        max_iter = 1
-        if maxResults <= 0:
-            max_iter = 10000
-            maxResults = 50
-        if maxResults > 50:
-            max_iter = maxResults // 50
-            maxResults = 50
+        """
+        全ページを取得し、アイテムをまとめたレスポンスとステータスコードを返します。
+        引数は `fetch_videos_pages` と同じです。
+        """
+        return self._collect(
+            self.fetch_videos_pages(
+                part=part,
+                chart=chart,
+                id=id,
+                myRating=myRating,
+                hl=hl,
+                maxHeight=maxHeight,
+                maxResults=maxResults,
+                maxWidth=maxWidth,
+                onBehalfOfContentOwner=onBehalfOfContentOwner,
+                pageToken=pageToken,
+                regionCode=regionCode,
+                videoCategoryId=videoCategoryId,
+                time_sleep=time_sleep,
+            )
+        )
 
-        totalResults = None
-        items = []
-        for _ in tqdm(range(max_iter)):
-            params = {
-                "part": part,
-                "hl": hl,
-                "maxHeight": maxHeight,
-                "maxResults": maxResults,
-                "maxWidth": maxWidth,
-                "onBehalfOfContentOwner": onBehalfOfContentOwner,
-                "pageToken": pageToken,
-                "regionCode": regionCode,
-                "videoCategoryId": videoCategoryId,
+    def iter_videos(
+        self, *, fields: Sequence[str] | None = None, **kwargs: Any
+    ) -> Iterator[dict[str, Any]]:
+        """
+        取得したページから順に動画リソースを返します。
+        `fields` 以外の引数は `fetch_videos_pages` と同じです。
+        `fields` については `iter_search` を参照してください。
+        """
+        return self._iter_items(self.fetch_videos_pages(**kwargs), fields)
+
+    def aiter_videos(
+        self, *, fields: Sequence[str] | None = None, **kwargs: Any
+    ) -> AsyncIterator[dict[str, Any]]:
+        """`iter_videos` の非同期版です。"""
+        return self._aiterate(self.iter_videos(fields=fields, **kwargs))
+
+    def enrich(
+        self,
+        items: list[dict[str, Any]],
+        *,
+        part: str = "contentDetails,statistics",
+        max_workers: int = 4,
+    ) -> list[dict[str, Any]]:
+        """
+        search や playlistItems のアイテムに videos リソースの情報を付け加えます。
+
+        動画 ID を 50 件ずつカンマ区切りにまとめて videos.list を並行して呼ぶため、
+        N 件のアイテムに対するリクエスト数は ceil(N / 50) 回です。
+
+        Parameters
+        ----------
+        items : list of dict
+            情報を付け加えるアイテムです。そのまま書き換えられます。
+        part : str, default="contentDetails,statistics"
+            取得する videos リソースのプロパティです。取得したプロパティは同じ名前でアイテムに追加され、
+            アイテムに同じ名前のプロパティがある場合はその中に合わせます。
+        max_workers : int, default=4
+            同時に実行するリクエストの最大数です。
+
+        Returns
+        -------
+        list of dict
+            書き換えた `items` です。
+        """
+        videoIds = list(
+            dict.fromkeys(
+                videoId for videoId in map(video_id_of, items) if videoId is not None
+            )
+        )
+        chunks = [videoIds[i : i + 50] for i in range(0, len(videoIds), 50)]
+
+        def fetch(chunk: list[str]) -> list[dict[str, Any]]:
+            res_dict, status_code = self.fetch_videos(part=part, id=",".join(chunk))
+            if not 200 <= status_code < 300:
+                logger.warning(
+                    "failed to enrich %d videos: %d %s",
+                    len(chunk),
+                    status_code,
+                    res_dict.get("error", {}).get("message", ""),
+                )
+                return []
+            return res_dict["items"]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # ログのトレース ID をワーカースレッドに引き継ぐ
+            futures = [
+                executor.submit(contextvars.copy_context().run, fetch, chunk)
+                for chunk in chunks
+            ]
+            videos = {
+                video_id_of(video): video
+                for future in futures
+                for video in future.result()
             }
-            if chart is not None:
-                params["chart"] = chart
-            if id is not None:
-                params["id"] = id
-            if myRating is not None:
-                params["myRating"] = myRating
-
-            res = requests.get(self.VIDEOS_ENDPOINT, params=params)
-            res_dict = res.json()
-            items.extend(res_dict["items"])
-            if totalResults is None:
-                totalResults = int(res_dict["pageInfo"]["totalResutls"])
-                print("TotalResutls:", totalResults)
-            pageToken = res_dict.get("nextPageToken")
-            if pageToken is None:
-                break
-            time.sleep(time_sleep)
-        res_dict["items"] = items
-        print("Fetched Results:", len(items))
-        return res_dict, res.status_code
+        parts = part.split(",")
+        for item in items:
+            video = videos.get(video_id_of(item))  # type: ignore[arg-type]
+            if video is None:
+                continue
+            for name in parts:
+                if name not in video:
+                    continue
+                # 再生リストのアイテム自身の contentDetails (videoId など) は残す
+                if isinstance(item.get(name), dict):
+                    item[name] = {**item[name], **video[name]}
+                else:
+                    item[name] = video[name]
+        return items
+
+    def fetch_many(
+        self,
+        *,
+        playlistIds: Sequence[str] = (),
+        queries: Sequence[str] = (),
+        max_workers: int = 8,
+        fields: Sequence[str] | None = None,
+        playlist_params: dict[str, Any] | None = None,
+        search_params: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        """
+        複数の再生リストと検索クエリを並行して取得し、動画 ID で重複を除いて結合します。
+
+        すべての取得は同じセッションとレートリミッターを共有するため、クォータの管理はそのまま効きます。
+
+        Parameters
+        ----------
+        playlistIds : sequence of str
+            取得する再生リストの ID です。
+        queries : sequence of str
+            検索クエリです。
+        max_workers : int, default=8
+            同時に実行する取得の最大数です。
+        fields : sequence of str, optional
+            `iter_search` と同様に、残すプロパティを指定します。
+            重複を除くため、動画 ID のプロパティは指定しなくても残します。
+        playlist_params : dict, optional
+            `fetch_playlist_items_pages` に渡す追加の引数です。
+        search_params : dict, optional
+            `search_pages` に渡す追加の引数です。
+
+        Returns
+        -------
+        dict
+            "items" に結合したアイテム、"sources" に取得元ごとの件数・所要時間・ステータス、
+            "elapsed" に全体の所要時間（秒）を持つ辞書です。
+        """
+        tasks: list[tuple[str, str, Callable[[], Iterator[dict[str, Any]]]]] = []
+        playlist_fields = search_fields = None
+        if fields is not None:
+            # video_id_of が動画 ID を取り出すプロパティを必ず残す
+            playlist_fields = [
+                *fields,
+                "contentDetails.videoId",
+                "snippet.resourceId.videoId",
+            ]
+            search_fields = [*fields, "id"]
+        for playlistId in playlistIds:
+            params = {"maxResults": -1, **(playlist_params or {})}
+            tasks.append(
+                (
+                    "playlist",
+                    playlistId,
+                    partial(
+                        self.iter_playlist_items,
+                        playlistId=playlistId,
+                        fields=playlist_fields,
+                        **params,
+                    ),
+                )
+            )
+        for query in queries:
+            params = {"type": "video", **(search_params or {})}
+            tasks.append(
+                (
+                    "search",
+                    query,
+                    partial(self.iter_search, q=query, fields=search_fields, **params),
+                )
+            )
+
+        def run(
+            func: Callable[[], Iterator[dict[str, Any]]]
+        ) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+            started_at = time.perf_counter()
+            items: list[dict[str, Any]] = []
+            result: dict[str, Any] = {"status": 200, "error": None}
+            try:
+                items.extend(func())
+            except YouTubeAPIError as e:
+                result = {"status": e.status_code, "error": str(e)}
+            result["count"] = len(items)
+            result["elapsed"] = time.perf_counter() - started_at
+            return items, result
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, run, func)
+                for _, _, func in tasks
+            ]
+            results = [future.result() for future in futures]
+
+        items = []
+        seen: set[str] = set()
+        sources = []
+        for (kind, source, _), (source_items, result) in zip(tasks, results):
+            sources.append({"type": kind, "id": source, **result})
+            for item in source_items:
+                videoId = video_id_of(item)
+                if videoId is not None:
+                    if videoId in seen:
+                        continue
+                    seen.add(videoId)
+                items.append(item)
+        return {
+            "items": items,
+            "sources": sources,
+            "elapsed": time.perf_counter() - started_at,
+        }
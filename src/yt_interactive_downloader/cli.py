@@ -0,0 +1,385 @@
+"""
+ブラウザを使わずに検索、再生リストの取得、ダウンロードを行うコマンドラインインターフェース
+
+結果は 1 行 1 オブジェクトの JSON (JSON Lines) として標準出力に、ログは標準エラー出力に書き出します。
+起動を速くするため Flask は読み込まず、yt-dlp は download コマンドでだけ読み込みます。
+
+    python -m src.yt_interactive_downloader.cli search "lofi hip hop" --max-results 100 > videos.jsonl
+    python -m src.yt_interactive_downloader.cli download - --concurrency 4 < videos.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Sequence
+
+if TYPE_CHECKING:
+    from src.yt_interactive_downloader.backend import VideoIndex, YouTube
+
+
+def _inputs(values: Sequence[str], files: Sequence[str]) -> Iterator[str]:
+    """
+    引数と `files` の各行を順に返します。"-" は標準入力を表します。
+    空行と # で始まる行は読み飛ばします。
+    """
+    for value in values:
+        if value == "-":
+            yield from _lines(sys.stdin)
+        else:
+            yield value
+    for file in files:
+        if file == "-":
+            yield from _lines(sys.stdin)
+        else:
+            with open(file, encoding="utf-8") as f:
+                yield from _lines(f)
+
+
+def _lines(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def _emit(record: dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _youtube(config: dict[str, Any], args: argparse.Namespace) -> "YouTube":
+    """
+    アプリと同じ DATA_DIR のキャッシュとクォータを使うクライアントを作ります。
+    そのため、アプリと CLI で 1 日のクォータを共有します。
+    """
+    from src.yt_interactive_downloader.backend import (
+        RateLimiter,
+        ResponseCache,
+        YouTube,
+    )
+
+    if not config["YOUTUBE_API"]:
+        raise SystemExit("YOUTUBE_API is not set")
+    return YouTube(
+        key=config["YOUTUBE_API"],
+        base_url=config["YOUTUBE_API_BASE_URL"],
+        cache=None
+        if args.no_cache
+        else ResponseCache(
+            config["DATA_DIR"] / "cache.sqlite3", ttl=config["CACHE_TTL"]
+        ),
+        rate_limiter=RateLimiter(
+            daily_quota=config["YOUTUBE_DAILY_QUOTA"],
+            path=config["DATA_DIR"] / "quota.sqlite3",
+        ),
+    )
+
+
+def _index(config: dict[str, Any]) -> "VideoIndex":
+    """アプリと同じ DATA_DIR のローカルの検索インデックスを開きます。"""
+    from src.yt_interactive_downloader.backend import VideoIndex
+
+    return VideoIndex(config["DATA_DIR"] / "index.sqlite3", ttl=config["CACHE_TTL"])
+
+
+def _emit_pages(
+    youtube: "YouTube",
+    index: "VideoIndex",
+    pages: Iterable[tuple[dict[str, Any], int]],
+    source: dict[str, str],
+    args: argparse.Namespace,
+) -> bool:
+    """
+    ページごとにアイテムを書き出し、最後まで取得できたかどうかを返します。
+    各行はアイテムに `source` のキーを加えたものです。
+    取得したアイテムは `index` にも保存し、アプリのローカル検索で使えるようにします。
+    """
+    from src.yt_interactive_downloader.backend.youtube import project
+
+    fields = args.fields.split(",") if args.fields else None
+    for res, status_code in pages:
+        if not 200 <= status_code < 300:
+            message = res.get("error", {}).get("message", "")
+            print(f"error: {source}: {status_code} {message}", file=sys.stderr)
+            return False
+        items = res["items"]
+        if args.enrich:
+            youtube.enrich(items)
+        index.add(items)
+        for item in items:
+            _emit({**source, **(item if fields is None else project(item, fields))})
+        # ページ単位で書き出し、パイプの先がすぐに処理を始められるようにする
+        sys.stdout.flush()
+    return True
+
+
+def search(config: dict[str, Any], args: argparse.Namespace) -> int:
+    youtube = _youtube(config, args)
+    index = _index(config)
+    ok = True
+    try:
+        for query in _inputs(args.query, args.file):
+            pages = youtube.search_pages(
+                part="snippet",
+                filter="forDeveloper",
+                q=query,
+                type=args.type,
+                maxResults=args.max_results,
+                order=args.order,
+                channelId=args.channel_id,
+                publishedAfter=args.published_after,
+                publishedBefore=args.published_before,
+                relevanceLanguage=args.language,
+                topicId=args.topic_id,
+                videoCaption=args.caption,
+                videoDuration=args.duration,
+            )
+            ok = _emit_pages(youtube, index, pages, {"query": query}, args) and ok
+    finally:
+        index.close()
+        youtube.close()
+    return 0 if ok else 1
+
+
+def playlist(config: dict[str, Any], args: argparse.Namespace) -> int:
+    from src.yt_interactive_downloader.backend import PlaylistSync, YouTubeAPIError
+
+    youtube = _youtube(config, args)
+    index = _index(config)
+    sync = None
+    if args.new:
+        sync = PlaylistSync(youtube, config["DATA_DIR"] / "playlists.sqlite3")
+    ok = True
+    try:
+        for playlistId in _inputs(args.playlistId, args.file):
+            source = {"playlistId": playlistId}
+            pages: Iterable[tuple[dict[str, Any], int]]
+            if sync is None:
+                pages = youtube.fetch_playlist_items_pages(
+                    part="snippet,contentDetails",
+                    playlistId=playlistId,
+                    maxResults=args.max_results,
+                )
+                ok = _emit_pages(youtube, index, pages, source, args) and ok
+                continue
+            # 前回の実行から増えたアイテムだけを書き出す
+            try:
+                result = sync.sync(playlistId)
+            except YouTubeAPIError as e:
+                print(f"error: {source}: {e}", file=sys.stderr)
+                ok = False
+                continue
+            pages = [({"items": result["new"]}, 200)]
+            ok = _emit_pages(youtube, index, pages, source, args) and ok
+    finally:
+        if sync is not None:
+            sync.close()
+        index.close()
+        youtube.close()
+    return 0 if ok else 1
+
+
+def _video_id(line: str) -> str | None:
+    """動画 ID か、search / playlist コマンドが書き出した JSON の行から動画 ID を取り出します。"""
+    from src.yt_interactive_downloader.backend import video_id_of
+
+    if not line.startswith("{"):
+        return line
+    return video_id_of(json.loads(line))
+
+
+def download(config: dict[str, Any], args: argparse.Namespace) -> int:
+    from src.yt_interactive_downloader.backend import Job, JobQueue, Library
+    from src.yt_interactive_downloader.backend.downloader import (
+        PROFILES,
+        bandwidth,
+        download_video,
+    )
+    from src.yt_interactive_downloader.backend.jobs import DONE
+
+    if args.profile not in PROFILES:
+        raise SystemExit(
+            f"unknown profile: {args.profile} (choose from {list(PROFILES)})"
+        )
+    if args.concurrency <= 0:
+        raise SystemExit("--concurrency must be positive")
+    if config["DOWNLOAD_RATE_LIMIT"] is not None:
+        bandwidth.limit = config["DOWNLOAD_RATE_LIMIT"]
+    server = config["EXTERNAL_SERVER"] if args.server is None else args.server
+    path = args.path or config["PATH_TO_DOWNLOAD"] or "."
+    params = {"server": server, "path_to_download": path, "profile": args.profile}
+
+    # アプリと同じライブラリに記録し、ダウンロード済みの動画は飛ばす
+    library = Library(config["DATA_DIR"] / "library.sqlite3")
+    videoIds: list[str] = []
+    seen: set[str] = set()
+    for line in _inputs(args.videoId, args.file):
+        videoId = _video_id(line)
+        if videoId is None or videoId in seen:
+            continue
+        seen.add(videoId)
+        video = library.find(videoId, args.profile, server or "local", path)
+        if video is not None and not args.force:
+            _emit({"videoId": videoId, "status": "skipped", "result": video})
+            continue
+        videoIds.append(videoId)
+    sys.stdout.flush()
+
+    def run(
+        job: Job,
+        videoId: str,
+        server: str = "",
+        path_to_download: str = ".",
+        profile: str = "mp4",
+    ) -> dict:
+        result = download_video(
+            job,
+            videoId,
+            server=server,
+            path_to_download=path_to_download,
+            profile=profile,
+        )
+        library.add(videoId, profile, result)
+        return result
+
+    jobs = JobQueue(max_workers=args.concurrency)
+    batch = jobs.submit_batch(run, videoIds, concurrency=args.concurrency, **params)
+    reported: set[str] = set()
+    failed = 0
+    try:
+        while len(reported) < len(videoIds):
+            time.sleep(0.2)
+            for job in batch.jobs():
+                if job.status in DONE and job.id not in reported:
+                    reported.add(job.id)
+                    failed += job.status != "finished"
+                    _emit(job.to_dict())
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        jobs.shutdown(wait=True, interrupt=True)
+        library.close()
+        return 130
+    jobs.shutdown()
+    library.close()
+    return 0 if failed == 0 else 1
+
+
+def _add_source_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-f",
+        "--file",
+        action="append",
+        default=[],
+        help="1 行に 1 つずつ入力を書いたファイル。- は標準入力",
+    )
+    parser.add_argument(
+        "--fields",
+        help="書き出すプロパティを snippet.title,id.videoId のようにカンマ区切りで指定する",
+    )
+    parser.add_argument(
+        "--enrich",
+        action="store_true",
+        help="videos.list で再生時間と統計情報を付け加える",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="レスポンスキャッシュを使わない")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="yt-interactive-downloader",
+        description=__doc__.strip().splitlines()[0],
+    )
+    parser.add_argument("--env-file", help="読み込む .env ファイル")
+    parser.add_argument("--log-level", help="ログレベル。既定値は LOG_LEVEL")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser("search", help="検索結果を書き出す")
+    search_parser.add_argument("query", nargs="*", help="検索クエリ。- は標準入力")
+    _add_source_arguments(search_parser)
+    search_parser.add_argument(
+        "--max-results",
+        type=int,
+        default=50,
+        help="クエリごとの最大件数。0 の場合はすべてのページを取得する",
+    )
+    search_parser.add_argument("--type", default="video")
+    search_parser.add_argument(
+        "--order", choices=("date", "rating", "relevance", "title", "viewCount")
+    )
+    search_parser.add_argument("--channel-id")
+    search_parser.add_argument("--published-after", help="RFC 3339 形式の日時")
+    search_parser.add_argument("--published-before", help="RFC 3339 形式の日時")
+    search_parser.add_argument("--language", help="relevanceLanguage")
+    search_parser.add_argument("--topic-id")
+    search_parser.add_argument("--caption", choices=("any", "closedCaption", "none"))
+    search_parser.add_argument("--duration", choices=("any", "long", "medium", "short"))
+    search_parser.set_defaults(handler=search)
+
+    playlist_parser = commands.add_parser("playlist", help="再生リストのアイテムを書き出す")
+    playlist_parser.add_argument("playlistId", nargs="*", help="再生リストの ID。- は標準入力")
+    _add_source_arguments(playlist_parser)
+    playlist_parser.add_argument(
+        "--max-results",
+        type=int,
+        default=0,
+        help="再生リストごとの最大件数。0 の場合はすべてのページを取得する",
+    )
+    playlist_parser.add_argument(
+        "--new",
+        action="store_true",
+        help="前回 --new を付けて実行してから追加されたアイテムだけを書き出す",
+    )
+    playlist_parser.set_defaults(handler=playlist)
+
+    download_parser = commands.add_parser(
+        "download",
+        help="動画をダウンロードし、終わったジョブを書き出す",
+        description="入力には動画 ID か、search / playlist コマンドが書き出した行を指定します。",
+    )
+    download_parser.add_argument("videoId", nargs="*", help="動画 ID。- は標準入力")
+    download_parser.add_argument(
+        "-f",
+        "--file",
+        action="append",
+        default=[],
+        help="1 行に 1 つずつ入力を書いたファイル。- は標準入力",
+    )
+    download_parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=None,
+        help="同時にダウンロードする数。既定値は DOWNLOAD_WORKERS",
+    )
+    download_parser.add_argument("--profile", default="mp4")
+    download_parser.add_argument("--path", help="保存先。既定値は PATH_TO_DOWNLOAD")
+    download_parser.add_argument("--server", help="転送先のサーバー。既定値は EXTERNAL_SERVER")
+    download_parser.add_argument(
+        "--force", action="store_true", help="ダウンロード済みの動画もダウンロードする"
+    )
+    download_parser.set_defaults(handler=download)
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    from src.yt_interactive_downloader.backend.tracing import configure_logging
+    from src.yt_interactive_downloader.config import load_config
+
+    args = build_parser().parse_args(argv)
+    config = load_config(args.env_file)
+    configure_logging(
+        format=config["LOG_FORMAT"], level=args.log_level or config["LOG_LEVEL"]
+    )
+    if getattr(args, "concurrency", 0) is None:
+        args.concurrency = config["DOWNLOAD_WORKERS"]
+    try:
+        return args.handler(config, args)
+    except BrokenPipeError:
+        # head などで出力が途中で閉じられた場合は静かに終わる
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import os
+from pathlib import Path
+from typing import Any
+
+from dotenv.main import load_dotenv
+
+# プロジェクトのルート。.env はカレントディレクトリではなくここから読み込む
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# 環境変数から読み込む設定と既定値
+DEFAULTS: dict[str, Any] = {
+    "SECRET_KEY": "secret!",
+    "YOUTUBE_API": None,
+    "YOUTUBE_API_BASE_URL": None,
+    "YOUTUBE_DAILY_QUOTA": 10000,
+    "CACHE_TTL": 86400.0,
+    "DATA_DIR": ".data",
+    "DOWNLOAD_WORKERS": 2,
+    "DOWNLOAD_RATE_LIMIT": None,
+    "JOB_RETENTION": 604800.0,
+    "EXTERNAL_SERVER": "",
+    "PATH_TO_DOWNLOAD": "",
+    "LOG_FORMAT": "text",
+    "LOG_LEVEL": "INFO",
+}
+
+
+def load_config(env_file: str | Path | None = None) -> dict[str, Any]:
+    """
+    .env と環境変数から設定を読み込みます。
+
+    `env_file` を省略した場合は環境変数 ENV_FILE、それもなければプロジェクトのルートの .env を読み込みます。
+    既に設定されている環境変数は .env の値で上書きしません。
+    """
+    load_dotenv(env_file or os.environ.get("ENV_FILE") or PROJECT_ROOT / ".env")
+    config = {key: os.environ.get(key) or default for key, default in DEFAULTS.items()}
+    for key in ("YOUTUBE_DAILY_QUOTA", "DOWNLOAD_WORKERS"):
+        config[key] = int(config[key])
+    for key in ("CACHE_TTL", "DOWNLOAD_RATE_LIMIT", "JOB_RETENTION"):
+        if config[key] is not None:
+            config[key] = float(config[key])
+    data_dir = Path(config["DATA_DIR"])
+    if not data_dir.is_absolute():
+        data_dir = PROJECT_ROOT / data_dir
+    config["DATA_DIR"] = data_dir
+    return config
@@ -1,21 +1,61 @@
-import os
+import atexit
+import json
+import logging
+import math
+import queue
 import re
-import shutil
-import subprocess
+import threading
+import time
+import uuid
 from pathlib import Path
+from typing import Any, Mapping
+from urllib.parse import urlencode
 
-from dotenv.main import load_dotenv
-from flask import Flask, jsonify, render_template, request, session
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    g,
+    jsonify,
+    render_template,
+    request,
+    session,
+)
 
-from src.yt_interactive_downloader.backend import YouTube
+from src.yt_interactive_downloader.backend import (
+    Job,
+    JobQueue,
+    Library,
+    RateLimiter,
+    ResponseCache,
+    VideoIndex,
+    YouTube,
+    video_id_of,
+)
+from src.yt_interactive_downloader.backend.downloader import (
+    PROFILES,
+    bandwidth,
+    download_video,
+)
+from src.yt_interactive_downloader.backend.metrics import (
+    DOWNLOAD_SPEED,
+    HTTP_REQUEST_SECONDS,
+    JOBS_QUEUED,
+    JOBS_RUNNING,
+    QUOTA_REMAINING,
+    registry,
+)
+from src.yt_interactive_downloader.backend.tracing import (
+    configure_logging,
+    trace_id_var,
+)
+from src.yt_interactive_downloader.config import load_config
 
-app = Flask(__name__)
-app.secret_key = "secret!"
+logger = logging.getLogger(__name__)
 
-load_dotenv(".env")
-
-
-youtube = YouTube(key=os.environ.get("YOUTUBE_API"))
+# 1 回の検索で取得するアイテム数。最初の表示までの時間を結果の総数に依存させない
+RESULTS_PAGE_SIZE = 20
 
 TOPIC_IDS = {
     "any": None,
@@ -28,120 +68,672 @@ TOPIC_IDS = {
     "knowledge": "/m/01k8wb",
 }
 
+# フォームの並べ替えと VideoIndex の並べ替えの対応。duration は API では指定できない
+LOCAL_ORDERS = {
+    "unset": "relevance",
+    "relevance": "relevance",
+    "date": "date",
+    "rating": "rating",
+    "title": "title",
+    "view": "viewCount",
+    "duration": "duration",
+}
+API_ORDERS = {"date", "rating", "relevance", "title", "viewCount"}
+
+
+class Services:
+    """
+    アプリが使う API クライアント、ストア、ジョブキューをまとめたもの
+
+    接続プールやワーカースレッドを持つため、プロセスごとに 1 つだけ作り、終了時に `close` で片付けます。
+    ジョブ、キャッシュ、クォータ、ライブラリは DATA_DIR の SQLite ファイルに保存されるため、
+    同じ DATA_DIR を使うプロセス同士で共有されます。
+    """
+
+    def __init__(self, config: Mapping[str, Any]) -> None:
+        data_dir = Path(config["DATA_DIR"])
+        self.youtube = YouTube(
+            key=config["YOUTUBE_API"],
+            base_url=config["YOUTUBE_API_BASE_URL"],
+            cache=ResponseCache(data_dir / "cache.sqlite3", ttl=config["CACHE_TTL"]),
+            rate_limiter=RateLimiter(
+                daily_quota=config["YOUTUBE_DAILY_QUOTA"],
+                path=data_dir / "quota.sqlite3",
+            ),
+        )
+        self.library = Library(data_dir / "library.sqlite3")
+        self.index = VideoIndex(data_dir / "index.sqlite3", ttl=config["CACHE_TTL"])
+        self.jobs = JobQueue(
+            data_dir / "jobs.sqlite3",
+            max_workers=config["DOWNLOAD_WORKERS"],
+            retention=config["JOB_RETENTION"],
+        )
+        # 他のプロセスで登録されたダウンロードもこのプロセスのワーカーが実行できるようにする
+        self.jobs.register(self.download)
+        self.__closed = False
+        self.__lock = threading.Lock()
+
+    def download(
+        self,
+        job: Job,
+        videoId: str,
+        server: str = "",
+        path_to_download: str = ".",
+        profile: str = "mp4",
+    ) -> dict:
+        result = download_video(
+            job,
+            videoId,
+            server=server,
+            path_to_download=path_to_download,
+            profile=profile,
+        )
+        self.library.add(videoId, profile, result)
+        return result
+
+    def close(self, interrupt: bool = False) -> None:
+        """
+        ジョブキューを止めてから接続を閉じます。2 回目以降の呼び出しは何もしません。
+        `interrupt=True` の場合は実行中のダウンロードを中断し、待機中に戻します。
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+        self.jobs.shutdown(wait=True, interrupt=interrupt)
+        self.youtube.close()
+        if self.youtube.cache is not None:
+            self.youtube.cache.close()
+        self.youtube.rate_limiter.close()
+        self.library.close()
+        self.index.close()
+        registry.unshare()
+
+
+bp = Blueprint("downloader", __name__)
+
+
+def services() -> Services:
+    return current_app.extensions["yt_interactive_downloader"]
+
+
+def create_app(config: Mapping[str, Any] | None = None) -> Flask:
+    """
+    アプリを作成します。
+
+    Parameters
+    ----------
+    config : Mapping, optional
+        `load_config` で読み込んだ設定を上書きする値です。
+
+    Notes
+    -----
+    `Services` を作るため、プロセスごとに 1 回だけ呼びます。
+    gunicorn ではアプリを事前に読み込まず、ワーカープロセスごとに呼びます。
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    if config is not None:
+        app.config.update(config)
+    app.secret_key = app.config["SECRET_KEY"]
+    configure_logging(format=app.config["LOG_FORMAT"], level=app.config["LOG_LEVEL"])
+
+    state = Services(app.config)
+    if app.config["DOWNLOAD_RATE_LIMIT"] is not None:
+        # 同じジョブストアを使うプロセスの間で、実行中のジョブ数に応じて上限を分け合う
+        bandwidth.limit = app.config["DOWNLOAD_RATE_LIMIT"]
+        bandwidth.share_with(state.jobs.running_share)
+    # ワーカープロセスごとのカウンターを合算し、どのワーカーからも同じ値を返す
+    registry.share(Path(app.config["DATA_DIR"]) / "metrics.sqlite3")
+    app.extensions["yt_interactive_downloader"] = state
+    app.register_blueprint(bp)
+    # gunicorn の worker_exit やプロセスの終了時に片付ける。close は何度呼んでもよい
+    atexit.register(state.close)
+
+    jobs = state.jobs
+    QUOTA_REMAINING.set_function(state.youtube.rate_limiter.remaining)
+    JOBS_QUEUED.set_function(lambda: jobs.counts()["queued"])
+    JOBS_RUNNING.set_function(lambda: jobs.counts()["running"])
+    DOWNLOAD_SPEED.set_function(jobs.speed)
+    return app
+
+
+@bp.before_app_request
+def start_trace():
+    # 呼び出し元がトレース ID を付けていればそれを引き継ぐ
+    trace_id = request.headers.get("X-Trace-Id") or uuid.uuid4().hex
+    g.trace_token = trace_id_var.set(trace_id)
+    g.started_at = time.perf_counter()
+
+
+@bp.after_app_request
+def finish_trace(response: Response) -> Response:
+    elapsed = time.perf_counter() - g.started_at
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed, method=request.method, route=route, status=str(response.status_code)
+    )
+    logger.info(
+        "%s %s %d %.3fs",
+        request.method,
+        request.path,
+        response.status_code,
+        elapsed,
+        extra={"route": route, "status": response.status_code, "elapsed": elapsed},
+    )
+    response.headers["X-Trace-Id"] = trace_id_var.get()
+    return response
+
+
+@bp.teardown_app_request
+def end_trace(exc: BaseException | None) -> None:
+    token = g.pop("trace_token", None)
+    if token is not None:
+        trace_id_var.reset(token)
 
-@app.template_filter()
+
+@bp.app_template_filter()
 def display_time(string: str) -> str:
     return re.sub(r"T.+", "", string)
 
 
-@app.route("/", methods=["GET", "POST"])
+@bp.app_template_filter()
+def display_duration(string: str) -> str:
+    match = re.fullmatch(r"P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?", string)
+    if match is None:
+        return string
+    days, hours, minutes, seconds = (int(value or 0) for value in match.groups())
+    hours += days * 24
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def _int_param(
+    values: Mapping[str, str], name: str, default: int, minimum: int | None = None
+) -> int:
+    """
+    フォームやクエリの整数の値を読み込みます。空の場合は `default` を返します。
+
+    Raises
+    ------
+    ValueError
+        整数でない場合や `minimum` より小さい場合。メッセージはそのままレスポンスに使えます。
+    """
+    value = values.get(name, "")
+    if value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} には整数を指定してください: {value}") from None
+    if minimum is not None and number < minimum:
+        raise ValueError(f"{name} には {minimum} 以上の値を指定してください: {value}")
+    return number
+
+
+def _minutes_param(values: Mapping[str, str], name: str) -> int | None:
+    """
+    フォームの分単位の値を秒に変換して読み込みます。空の場合は None を返します。
+
+    Raises
+    ------
+    ValueError
+        0 以上の有限の数でない場合。メッセージはそのままレスポンスに使えます。
+    """
+    value = values.get(name, "")
+    if value == "":
+        return None
+    try:
+        minutes = float(value)
+    except ValueError:
+        raise ValueError(f"{name} には数値を指定してください: {value}") from None
+    if not math.isfinite(minutes) or minutes < 0:
+        raise ValueError(f"{name} には 0 以上の数値を指定してください: {value}")
+    return int(minutes * 60)
+
+
+def _search_params(form: Mapping[str, str]) -> dict[str, Any]:
+    """
+    検索フォームの値を `YouTube.search` の引数に変換します。`maxResults` は含みません。
+
+    Raises
+    ------
+    ValueError
+        topic が不明な値の場合
+    """
+    topic = form.get("topic", "any")
+    if topic not in TOPIC_IDS:
+        raise ValueError(f"不明なトピックです: {topic}")
+    channel_id = form.get("channelId", "")
+    order = LOCAL_ORDERS.get(form.get("order", "unset"), "relevance")
+    publishedAfter = form.get("publishedAfter", "")
+    publishedBefore = form.get("publishedBefore", "")
+    return {
+        "part": "snippet",
+        "filter": "forDeveloper",
+        "q": form.get("query", ""),
+        "channelId": channel_id or None,
+        "order": order if order in API_ORDERS and order != "relevance" else None,
+        "videoCaption": form.get("caption", "any"),
+        "type": "video",
+        "topicId": TOPIC_IDS[topic],
+        "relevanceLanguage": "ja",
+        "publishedAfter": publishedAfter + "T00:00:00Z" if publishedAfter else None,
+        "publishedBefore": (
+            publishedBefore + "T00:00:00Z" if publishedBefore else None
+        ),
+    }
+
+
+def _local_filters(form: Mapping[str, str]) -> dict[str, Any]:
+    """
+    API では指定できない検索フォームの条件を `VideoIndex.search` の引数に変換します。
+
+    Raises
+    ------
+    ValueError
+        再生時間の範囲が不正な場合
+    """
+    minDuration = _minutes_param(form, "minDuration")
+    maxDuration = _minutes_param(form, "maxDuration")
+    if minDuration is not None and maxDuration is not None:
+        if minDuration > maxDuration:
+            raise ValueError("minDuration には maxDuration 以下の値を指定してください")
+    return {
+        "minDuration": minDuration,
+        "maxDuration": maxDuration,
+        "description": form.get("descriptionQuery", "") or None,
+    }
+
+
+def _fill_index(
+    form: Mapping[str, str], needed: int, max_results: int
+) -> tuple[dict[str, Any], int, str]:
+    """
+    フォームの検索の結果を、ローカルのインデックスで答えられるだけ API から取得します。
+    最後に取得したレスポンス、ステータスコード、インデックスでの検索のキーを返します。
+
+    API の検索結果の先頭 `max_results` 件 (0 以下なら全件) を候補とし、取得済みの分は API を呼びません。
+    API では指定できない条件があれば、それに合う動画が `needed` 件になるまで、
+    API では指定できない並べ替えでは候補をすべて取得するまで続きのページを取得します。
+    """
+    index = services().index
+    youtube = services().youtube
+    params = _search_params(form)
+    key = ResponseCache.make_key("search", params)
+    filters = _local_filters(form)
+    filtered = any(value is not None for value in filters.values())
+    sort = LOCAL_ORDERS.get(form.get("order", "unset")) not in API_ORDERS
+    cap = max_results if max_results > 0 else None
+
+    coverage = index.coverage(key)
+    reset = coverage is None
+    if coverage is None:
+        coverage = {"fetched": 0, "complete": False, "nextPageToken": None}
+    res: dict[str, Any] = {"items": []}
+    while not coverage["complete"] and (cap is None or coverage["fetched"] < cap):
+        if not sort:
+            found = coverage["fetched"]
+            if filtered:
+                found = index.search(within=key, depth=cap, **filters, limit=0)[1]
+            if found >= needed:
+                break
+        # 条件で絞り込む場合は候補を多く調べるため、1 回で取得できる最大の 50 件ずつ取得する
+        size = 50 if filtered or sort else needed - coverage["fetched"]
+        if cap is not None:
+            size = min(size, cap - coverage["fetched"])
+        res, status_code = youtube.search(
+            **params,
+            maxResults=max(min(size, 50), 1),
+            pageToken=coverage["nextPageToken"],
+        )
+        if not 200 <= status_code < 300:
+            return res, status_code, key
+        youtube.enrich(res["items"])
+        index.record(key, params, res, reset=reset)
+        reset = False
+        coverage = index.coverage(key) or coverage
+    return res, 200, key
+
+
+def _search_page(
+    form: Mapping[str, str], loaded: int = 0
+) -> tuple[dict[str, Any], int, bool]:
+    """
+    検索結果を 1 ページだけ取得し、レスポンス、ステータスコード、続きがあるかどうかを返します。
+
+    検索結果はローカルのインデックス (`VideoIndex`) から返し、足りない分だけ API から取得します。
+    再生時間の範囲や概要のキーワードなど、API では指定できない条件と並べ替えはインデックスで適用します。
+    フォームの source が "local" の場合は API を呼ばず、これまでに取得したすべての動画から探します。
+
+    `loaded` (取得済みのアイテム数) の次のアイテムから返します。
+    フォームの maxResults に達した場合は、続きがないものとします。
+
+    Raises
+    ------
+    ValueError
+        フォームの値が不正な場合
+    """
+    max_results = _int_param(form, "maxResults", 30, minimum=-1)
+    limit = RESULTS_PAGE_SIZE
+    if max_results > 0:
+        limit = min(limit, max_results - loaded)
+    if limit <= 0:
+        return {"items": []}, 200, False
+    index = services().index
+    order = LOCAL_ORDERS.get(form.get("order", "unset"), "relevance")
+    filters = _local_filters(form)
+    if form.get("source") == "local":
+        params = _search_params(form)
+        caption = {"closedCaption": True, "none": False}.get(params["videoCaption"])
+        items, total = index.search(
+            params["q"] or None,
+            channelId=params["channelId"],
+            publishedAfter=params["publishedAfter"],
+            publishedBefore=params["publishedBefore"],
+            caption=caption,
+            **filters,
+            order=order,
+            limit=limit,
+            offset=loaded,
+        )
+        total_results = total
+        exhausted = True
+    else:
+        res, status_code, key = _fill_index(form, loaded + limit, max_results)
+        if not 200 <= status_code < 300:
+            return res, status_code, False
+        coverage = index.coverage(key) or {"fetched": 0, "complete": True}
+        items, total = index.search(
+            within=key,
+            depth=max_results if max_results > 0 else None,
+            **filters,
+            # API で並べ替えた結果は API の順序のまま返す
+            order=order if order not in API_ORDERS else "relevance",
+            limit=limit,
+            offset=loaded,
+        )
+        filtered = any(value is not None for value in filters.values())
+        total_results = total if filtered else coverage.get("totalResults", total)
+        exhausted = coverage["complete"] or (
+            max_results > 0 and coverage["fetched"] >= max_results
+        )
+    if max_results > 0:
+        total = min(total, max_results)
+    # 1 件も返せなかった場合は、同じ位置を読み込み続けないように打ち切る
+    more = bool(items) and (loaded + len(items) < total or not exhausted)
+    return {"items": items, "pageInfo": {"totalResults": total_results}}, 200, more
+
+
+def _downloaded(items: list[dict[str, Any]]) -> set[str]:
+    return services().library.downloaded(
+        item["id"]["videoId"] for item in items if item["id"]["kind"] == "youtube#video"
+    )
+
+
+@bp.route("/", methods=["GET", "POST"])
 def index():
     status = "search"
     res = None
-    server = os.environ.get("EXTERNAL_SERVER", "")
-    path_to_download = os.environ.get("PATH_TO_DOWNLOAD", "")
+    more = False
+    server = current_app.config["EXTERNAL_SERVER"]
+    path_to_download = current_app.config["PATH_TO_DOWNLOAD"]
     if request.method == "POST":
         for key, value in request.form.items():
             session[key] = value
-        query = request.form.get("query", "")
-        channel_id = request.form.get("channelId", "")
-        topic = request.form.get("topic", "any")
-        max_results = int(request.form.get("maxResults", 30))
-        caption = request.form.get("caption", "any")
-        order = request.form.get("order")
-        publishedAfter = request.form.get("publishedAfter", "")
-        publishedBefore = request.form.get("publishedBefore", "")
-        topic_id = TOPIC_IDS[topic]
-        if order == "unset":
-            order = None
-        if channel_id == "":
-            channel_id = None
-        if publishedAfter == "":
-            publishedAfter = None
-        else:
-            publishedAfter += "T00:00:00Z"
-        if publishedBefore == "":
-            publishedBefore = None
-        else:
-            publishedBefore += "T00:00:00Z"
-
-        res, status_code = youtube.search(
-            part="snippet",
-            filter="forDeveloper",
-            q=query,
-            channelId=channel_id,
-            maxResults=max_results,
-            order=order,
-            videoCaption=caption,
-            type="video",
-            topicId=topic_id,
-            relevanceLanguage="ja",
-            publishedAfter=publishedAfter,
-            publishedBefore=publishedBefore,
-        )
-        if 200 <= status_code < 300:
-            status = "success"
-        else:
-            status = "fail"
+        # 最初のページだけを取得し、続きはスクロールに合わせて /search から読み込む
+        try:
+            res, status_code, more = _search_page(request.form)
+        except ValueError as e:
+            res, status_code = {"error": {"message": str(e)}}, 400
+        status = "success" if 200 <= status_code < 300 else "fail"
 
     return render_template(
         "index.html",
         status=status,
         response=res,
+        items=res["items"] if status == "success" else [],
+        downloaded=_downloaded(res["items"]) if status == "success" else set(),
+        more=more,
+        search_query=urlencode(request.form),
         server=server,
         path_to_download=path_to_download,
+        profiles=PROFILES,
         history=session,
     )
 
 
-@app.route("/download/<videoId>", methods=["POST"])
+@bp.route("/search", methods=["GET"])
+def search():
+    """
+    検索結果の続きを JSON で返します。
+
+    クエリには検索フォームと同じ値に加えて、取得済みのアイテム数 loaded を指定します。
+    レスポンスの more は、さらに続きがあるかどうかを表します。
+    """
+    try:
+        res, status_code, more = _search_page(
+            request.args, loaded=_int_param(request.args, "loaded", 0, minimum=0)
+        )
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    if not 200 <= status_code < 300:
+        message = res.get("error", {}).get("message", "検索結果の取得に失敗しました")
+        return jsonify({"message": message}), status_code
+    downloaded = _downloaded(res["items"])
+    return jsonify(
+        {
+            "items": res["items"],
+            "more": more,
+            "totalResults": res.get("pageInfo", {}).get("totalResults"),
+            "html": render_template(
+                "_results.html", items=res["items"], downloaded=downloaded
+            ),
+        }
+    )
+
+
+def _download_params() -> dict[str, str]:
+    return {
+        "server": request.form.get("server", ""),
+        "path_to_download": request.form.get("path_to_download", "") or ".",
+        "profile": request.form.get("profile", "mp4"),
+    }
+
+
+def _download_key(
+    videoId: str, server: str, path_to_download: str, profile: str
+) -> str:
+    return f"{server or 'local'}:{path_to_download}:{profile}:{videoId}"
+
+
+@bp.route("/download/<videoId>", methods=["POST"])
 def download(videoId: str):
-    server = request.form.get("server")
-    path_to_download = request.form.get("path_to_download")
-    if path_to_download == "":
-        path_to_download = "."
-    path = Path(path_to_download)
+    params = _download_params()
+    if params["profile"] not in PROFILES:
+        return jsonify({"message": f"不明なプロファイルです: {params['profile']}"}), 400
+    try:
+        priority = _int_param(request.form, "priority", 0)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    video = services().library.find(
+        videoId,
+        params["profile"],
+        params["server"] or "local",
+        params["path_to_download"],
+    )
+    if video is not None:
+        return jsonify({"message": "ダウンロード済みです", "job": None, "video": video})
+    job = services().jobs.submit(
+        services().download,
+        videoId,
+        key=_download_key(videoId, **params),
+        priority=priority,
+        **params,
+    )
+    return jsonify({"message": "ダウンロードを開始しました", "job": job.to_dict()}), 202
+
+
+@bp.route("/batches", methods=["POST"])
+def create_batch():
+    """
+    複数の動画をまとめてダウンロードするバッチを登録します。
+
+    動画は videoId (複数指定可) か playlistId で指定し、指定した順にダウンロードします。
+    concurrency でバッチ内の同時実行数を、priority で他のジョブに対する優先度を指定します。
+    """
+    params = _download_params()
+    if params["profile"] not in PROFILES:
+        return jsonify({"message": f"不明なプロファイルです: {params['profile']}"}), 400
+    jobs = services().jobs
     try:
-        if server == "":
-            path.mkdir(parents=True, exist_ok=True)
-            subprocess.run(
-                [
-                    "yt-dlp",
-                    f"https://www.youtube.com/watch?v={videoId}",
-                    "--sub-langs",
-                    "ja",
-                    "--embed-subs",
-                    "--embed-thumbnail",
-                    "--embed-metadata",
-                    "-f",
-                    "mp4",
-                    "-o",
-                    rf"{path/videoId}.mp4",
-                ],
-            )
-        else:
-            temp = Path("./tmp/")
-            temp.mkdir(exist_ok=True)
-            subprocess.run(
-                [
-                    "yt-dlp",
-                    f"https://www.youtube.com/watch?v={videoId}",
-                    "-f",
-                    "mp4",
-                    "-o",
-                    rf"{temp/videoId}.mp4",
-                ],
-            )
-            subprocess.run(
-                ["scp", f"{temp/videoId}.mp4", f"{server}:{path_to_download}"]
-            )
-            shutil.rmtree(temp)
-
-        return jsonify({"message": "ダウンロードに成功しました！"}), 200
-    except Exception as e:
-        print(e)
-        return jsonify({"message": "ダウンロードに失敗しました"}), 500
+        # ワーカーを持たないプロセスでも、他のプロセスのワーカーが 1 件ずつ実行できるようにする
+        concurrency = _int_param(
+            request.form, "concurrency", max(jobs.max_workers, 1), minimum=1
+        )
+        priority = _int_param(request.form, "priority", 0)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    videoIds = request.form.getlist("videoId")
+    playlistId = request.form.get("playlistId", "")
+    if playlistId != "":
+        res, status_code = services().youtube.fetch_playlist_items(
+            part="contentDetails", playlistId=playlistId, maxResults=-1
+        )
+        if not 200 <= status_code < 300:
+            return jsonify({"message": "再生リストの取得に失敗しました"}), 502
+        videoIds.extend(filter(None, map(video_id_of, res["items"])))
+    # 重複を除き、指定された順序を保つ
+    videoIds = list(dict.fromkeys(videoIds))
+    if not videoIds:
+        return jsonify({"message": "動画が指定されていません"}), 400
+    skipped = [
+        videoId
+        for videoId in videoIds
+        if services().library.find(
+            videoId,
+            params["profile"],
+            params["server"] or "local",
+            params["path_to_download"],
+        )
+        is not None
+    ]
+    batch = jobs.submit_batch(
+        services().download,
+        [videoId for videoId in videoIds if videoId not in skipped],
+        concurrency=concurrency,
+        priority=priority,
+        key=lambda videoId: _download_key(videoId, **params),
+        **params,
+    )
+    return (
+        jsonify(
+            {
+                "message": f"{len(videoIds) - len(skipped)} 件のダウンロードを開始しました",
+                "batch": batch.to_dict(),
+                "skipped": skipped,
+            }
+        ),
+        202,
+    )
+
+
+@bp.route("/batches", methods=["GET"])
+def list_batches():
+    jobs = services().jobs
+    return jsonify({"batches": [batch.to_dict() for batch in jobs.batches()]})
+
+
+@bp.route("/batches/<batchId>", methods=["GET"])
+def get_batch(batchId: str):
+    jobs = services().jobs
+    batch = jobs.batch(batchId)
+    if batch is None:
+        return jsonify({"message": "バッチが見つかりません"}), 404
+    return jsonify({"batch": batch.to_dict()})
+
+
+@bp.route("/batches/<batchId>/cancel", methods=["POST"])
+def cancel_batch(batchId: str):
+    jobs = services().jobs
+    batch = jobs.batch(batchId)
+    if batch is None:
+        return jsonify({"message": "バッチが見つかりません"}), 404
+    batch.cancel()
+    return jsonify({"batch": batch.to_dict()})
+
+
+@bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    jobs = services().jobs
+    return jsonify({"jobs": [job.to_dict() for job in jobs.jobs()]})
+
+
+@bp.route("/jobs/events", methods=["GET"])
+def job_events():
+    jobs = services().jobs
+    subscriber = jobs.subscribe()
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            for job in jobs.jobs():
+                yield f"event: job\ndata: {json.dumps(job.to_dict())}\n\n"
+            for batch in jobs.batches():
+                yield f"event: batch\ndata: {json.dumps(batch.to_dict())}\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            jobs.unsubscribe(subscriber)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/jobs/<jobId>", methods=["GET"])
+def get_job(jobId: str):
+    jobs = services().jobs
+    job = jobs.get(jobId)
+    if job is None:
+        return jsonify({"message": "ジョブが見つかりません"}), 404
+    return jsonify({"job": job.to_dict()})
+
+
+@bp.route("/jobs/<jobId>/cancel", methods=["POST"])
+def cancel_job(jobId: str):
+    jobs = services().jobs
+    job = jobs.cancel(jobId)
+    if job is None:
+        return jsonify({"message": "ジョブが見つかりません"}), 404
+    return jsonify({"job": job.to_dict()})
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), mimetype=registry.CONTENT_TYPE)
+
+
+@bp.route("/quota", methods=["GET"])
+def quota():
+    return jsonify(services().youtube.quota())
 
 
 def run():
-    app.run(debug=True, port=8888)
+    """
+    開発用サーバーで起動します。FLASK_DEBUG=1 でデバッグモードになります。
+    リローダーは親プロセスにもワーカーを作ってしまうため使いません。本番では `serve` を使います。
+    """
+    app = create_app()
+    try:
+        app.run(port=8888, use_reloader=False)
+    finally:
+        app.extensions["yt_interactive_downloader"].close(interrupt=True)
@@ -0,0 +1,78 @@
+"""
+複数のワーカープロセスでアプリを起動するエントリーポイント
+
+gunicorn がインストールされていれば gthread ワーカーで起動します。
+ワーカーごとに `create_app` を呼ぶため、接続プールやジョブのワーカーはプロセスごとに作られ、
+ジョブ、キャッシュ、クォータ、ライブラリは DATA_DIR の SQLite ファイルを通じて共有されます。
+帯域の上限は実行中のジョブ数に応じてプロセス間で分け合い、/metrics のカウンターはすべてのワーカーの合計です。
+
+    python -m src.yt_interactive_downloader.frontend.serve --workers 4 --threads 8
+"""
+import argparse
+import logging
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_exit(server: Any, worker: Any) -> None:
+    # 実行中のダウンロードは待機中に戻し、他のワーカーに引き継ぐ
+    app = getattr(worker, "wsgi", None)
+    if app is not None:
+        app.extensions["yt_interactive_downloader"].close(interrupt=True)
+
+
+def serve_gunicorn(host: str, port: int, workers: int, threads: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    from .app import create_app
+
+    class Application(BaseApplication):
+        def load_config(self) -> None:
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            # SSE の接続がスレッドを占有するため、同期ワーカーではなく gthread を使う
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("graceful_timeout", 30)
+            self.cfg.set("worker_exit", _worker_exit)
+
+        def load(self) -> Any:
+            return create_app()
+
+    Application().run()
+
+
+def serve_werkzeug(host: str, port: int, threads: int) -> None:
+    from werkzeug.serving import run_simple
+
+    from .app import create_app
+
+    app = create_app()
+    logger.warning(
+        "gunicorn is not installed; serving with a single werkzeug process."
+        " Install the `serve` extra to run several workers."
+    )
+    try:
+        run_simple(host, port, app, threaded=threads > 1)
+    finally:
+        app.extensions["yt_interactive_downloader"].close(interrupt=True)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--workers", type=int, default=2, help="ワーカープロセス数")
+    parser.add_argument("--threads", type=int, default=8, help="プロセスごとのスレッド数")
+    args = parser.parse_args(argv)
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        serve_werkzeug(args.host, args.port, args.threads)
+    else:
+        serve_gunicorn(args.host, args.port, args.workers, args.threads)
+
+
+if __name__ == "__main__":
+    main()
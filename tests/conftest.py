@@ -0,0 +1,51 @@
+import os
+import stat
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from benchmarks.mock_api import MockYouTubeAPI
+from src.yt_interactive_downloader.backend import YouTube
+
+
+@pytest.fixture
+def api() -> Iterator[MockYouTubeAPI]:
+    with MockYouTubeAPI(total_results=230) as api:
+        yield api
+
+
+@pytest.fixture
+def youtube(api: MockYouTubeAPI, monkeypatch: pytest.MonkeyPatch) -> Iterator[YouTube]:
+    # 再試行の待ち時間は Retry-After に従うと最大 1 秒になるため、テストでは待たない
+    monkeypatch.setattr(
+        YouTube, "_backoff", lambda self, attempt, retry_after=None: 0.0
+    )
+    with YouTube("test-key", base_url=api.base_url, max_retries=3) as youtube:
+        yield youtube
+
+
+FAKE_SSH = """#!/bin/sh
+# ssh -- <server> <command> を、接続先のホームディレクトリに見立てたディレクトリで実行する
+shift
+if [ "$1" = "unreachable" ]; then
+    echo "ssh: connect to host $1: Connection refused" >&2
+    exit 255
+fi
+cd "$FAKE_SSH_HOME" && exec sh -c "$2"
+"""
+
+
+@pytest.fixture
+def ssh_home(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """PATH の ssh をローカルで実行する偽物に置き換え、リモートのホームディレクトリを返します。"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ssh = bin_dir / "ssh"
+    ssh.write_text(FAKE_SSH)
+    ssh.chmod(ssh.stat().st_mode | stat.S_IEXEC)
+    home = tmp_path / "remote"
+    home.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_SSH_HOME", str(home))
+    return home
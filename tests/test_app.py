@@ -0,0 +1,139 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from benchmarks.mock_api import MockYouTubeAPI
+from src.yt_interactive_downloader.backend import YouTube
+from src.yt_interactive_downloader.frontend.app import create_app
+
+
+@pytest.fixture
+def app(
+    api: MockYouTubeAPI, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[Flask]:
+    monkeypatch.setattr(
+        YouTube, "_backoff", lambda self, attempt, retry_after=None: 0.0
+    )
+    # ワーカーを起動せず、登録したダウンロードは待機中のままにする
+    app = create_app(
+        {
+            "TESTING": True,
+            "DATA_DIR": tmp_path,
+            "YOUTUBE_API": "test-key",
+            "YOUTUBE_API_BASE_URL": api.base_url,
+            "DOWNLOAD_WORKERS": 0,
+            "DOWNLOAD_RATE_LIMIT": None,
+        }
+    )
+    yield app
+    app.extensions["yt_interactive_downloader"].close()
+
+
+@pytest.fixture
+def client(app: Flask) -> FlaskClient:
+    return app.test_client()
+
+
+def test_search_pages_through_the_results(client: FlaskClient, api: MockYouTubeAPI):
+    query = {"query": "lofi", "maxResults": "30"}
+
+    first = client.get("/search", query_string=query).get_json()
+    assert len(first["items"]) == 20
+    assert first["more"]
+    assert first["totalResults"] == 230
+
+    rest = client.get("/search", query_string={**query, "loaded": "20"}).get_json()
+    assert len(rest["items"]) == 10
+    assert not rest["more"]
+    ids = [item["id"]["videoId"] for item in first["items"] + rest["items"]]
+    assert len(set(ids)) == 30
+
+    # 取得済みの結果はインデックスから返し、API を呼ばない
+    requests = dict(api.requests)
+    again = client.get("/search", query_string=query).get_json()
+    assert again["items"] == first["items"]
+    assert api.requests == requests
+
+
+def test_local_search_does_not_call_the_api(client: FlaskClient, api: MockYouTubeAPI):
+    client.get("/search", query_string={"query": "lofi", "maxResults": "20"})
+    requests = dict(api.requests)
+
+    res = client.get("/search", query_string={"query": "lofi", "source": "local"})
+
+    assert res.status_code == 200
+    assert len(res.get_json()["items"]) == 20
+    assert api.requests == requests
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"topic": "unknown"},
+        {"loaded": "-1"},
+        {"maxResults": "many"},
+        {"minDuration": "inf"},
+        {"minDuration": "nan"},
+        {"maxDuration": "-1"},
+        {"minDuration": "1e309"},
+        {"minDuration": "10", "maxDuration": "5"},
+    ],
+)
+def test_invalid_search_params_are_rejected(
+    client: FlaskClient, api: MockYouTubeAPI, params: dict
+):
+    res = client.get("/search", query_string={"query": "lofi", **params})
+
+    assert res.status_code == 400
+    assert res.get_json()["message"]
+    assert api.requests == {}
+
+
+def test_search_form_reports_invalid_params(client: FlaskClient):
+    res = client.post("/", data={"query": "lofi", "topic": "unknown"})
+
+    assert res.status_code == 200
+    assert "不明なトピックです" in res.get_data(as_text=True)
+
+
+def test_download_is_queued_and_can_be_cancelled(client: FlaskClient, tmp_path: Path):
+    data = {"path_to_download": str(tmp_path), "profile": "mp4"}
+
+    res = client.post("/download/abc", data=data)
+    assert res.status_code == 202
+    job = res.get_json()["job"]
+    assert job["status"] == "queued"
+    assert [job["id"] for job in client.get("/jobs").get_json()["jobs"]] == [job["id"]]
+
+    res = client.post(f"/jobs/{job['id']}/cancel")
+    assert res.get_json()["job"]["status"] == "cancelled"
+    assert client.get("/jobs/unknown").status_code == 404
+    assert client.post("/download/abc", data={"profile": "flac"}).status_code == 400
+
+
+def test_batch_deduplicates_videos(client: FlaskClient, tmp_path: Path):
+    res = client.post(
+        "/batches",
+        data={"videoId": ["a", "b", "a"], "path_to_download": str(tmp_path)},
+    )
+
+    assert res.status_code == 202
+    batch = res.get_json()["batch"]
+    assert batch["total"] == 2
+    assert client.get(f"/batches/{batch['id']}").get_json()["batch"]["total"] == 2
+    assert client.post("/batches", data={}).status_code == 400
+    assert client.post("/batches", data={"concurrency": "0"}).status_code == 400
+
+
+def test_metrics_are_exposed(client: FlaskClient):
+    client.get("/search", query_string={"query": "lofi", "maxResults": "20"})
+
+    res = client.get("/metrics")
+
+    assert res.status_code == 200
+    text = res.get_data(as_text=True)
+    assert "youtube_api_pages_total" in text
+    assert "download_jobs_queued" in text
@@ -0,0 +1,123 @@
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from benchmarks.mock_api import MockYouTubeAPI
+from src.yt_interactive_downloader import cli
+from src.yt_interactive_downloader.backend import Job, YouTube, downloader
+
+
+@pytest.fixture
+def env(api: MockYouTubeAPI, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """モック API とテスト用の DATA_DIR を使うように環境変数を設定し、DATA_DIR を返します。"""
+    data_dir = tmp_path / "data"
+    monkeypatch.setenv("ENV_FILE", str(tmp_path / ".env"))
+    monkeypatch.setenv("DATA_DIR", str(data_dir))
+    monkeypatch.setenv("YOUTUBE_API", "test-key")
+    monkeypatch.setenv("YOUTUBE_API_BASE_URL", api.base_url)
+    monkeypatch.setenv("EXTERNAL_SERVER", "")
+    monkeypatch.setenv("DOWNLOAD_RATE_LIMIT", "")
+    monkeypatch.setattr(
+        YouTube, "_backoff", lambda self, attempt, retry_after=None: 0.0
+    )
+    return data_dir
+
+
+def run(capsys: pytest.CaptureFixture, *argv: str) -> tuple[int, list[dict]]:
+    status = cli.main(list(argv))
+    out = capsys.readouterr().out
+    return status, [json.loads(line) for line in out.splitlines()]
+
+
+def test_search_writes_json_lines(env: Path, capsys: pytest.CaptureFixture):
+    status, lines = run(
+        capsys,
+        "search",
+        "lofi",
+        "jazz",
+        "--max-results",
+        "100",
+        "--fields",
+        "id.videoId,snippet.title",
+    )
+
+    assert status == 0
+    assert len(lines) == 200
+    assert lines[0].keys() == {"query", "id", "snippet"}
+    assert lines[0]["id"].keys() == {"videoId"}
+    assert lines[0]["snippet"].keys() == {"title"}
+    assert {line["query"] for line in lines} == {"lofi", "jazz"}
+
+
+def test_search_reports_api_errors(
+    env: Path, api: MockYouTubeAPI, capsys: pytest.CaptureFixture
+):
+    api.error_rate = 1.0
+
+    status = cli.main(["search", "lofi", "--no-cache"])
+
+    captured = capsys.readouterr()
+    assert status == 1
+    assert captured.out == ""
+    assert "error:" in captured.err
+
+
+def test_playlist_new_writes_only_new_items(
+    env: Path, api: MockYouTubeAPI, capsys: pytest.CaptureFixture
+):
+    status, lines = run(capsys, "playlist", "PL1", "--new")
+
+    assert status == 0
+    assert len(lines) == 230
+    assert all(line["playlistId"] == "PL1" for line in lines)
+
+    # 2 回目は変更がないので何も書き出さない
+    status, lines = run(capsys, "playlist", "PL1", "--new")
+    assert status == 0
+    assert lines == []
+    assert (env / "playlists.sqlite3").exists()
+
+
+def test_download_deduplicates_and_skips_downloaded_videos(
+    env: Path,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+):
+    downloaded: list[str] = []
+
+    def download_video(job: Job, videoId: str, **kwargs: Any) -> dict:
+        downloaded.append(videoId)
+        file = Path(kwargs["path_to_download"]) / f"{videoId}.mp4"
+        file.write_bytes(b"video")
+        return {
+            "location": "local",
+            "path": kwargs["path_to_download"],
+            "name": file.name,
+            "size": 5,
+            "sha256": "0" * 64,
+        }
+
+    monkeypatch.setattr(downloader, "download_video", download_video)
+    videos = tmp_path / "videos"
+    videos.mkdir()
+    # search / playlist コマンドの出力も入力にできる
+    inputs = tmp_path / "inputs.jsonl"
+    inputs.write_text('{"query": "lofi", "id": {"videoId": "a"}}\n# comment\nb\n')
+
+    status, lines = run(
+        capsys, "download", "a", "b", "-f", str(inputs), "--path", str(videos)
+    )
+
+    assert status == 0
+    assert sorted(downloaded) == ["a", "b"]
+    assert sorted(line["videoId"] for line in lines) == ["a", "b"]
+    assert all(line["status"] == "finished" for line in lines)
+
+    status, lines = run(capsys, "download", "a", "b", "--path", str(videos))
+
+    assert status == 0
+    assert len(downloaded) == 2
+    assert [line["status"] for line in lines] == ["skipped", "skipped"]
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from src.yt_interactive_downloader.backend.downloader import BandwidthPool
+
+
+def test_limit_is_split_evenly():
+    pool = BandwidthPool(limit=300)
+
+    with pool.register({}) as a, pool.register({}) as b:
+        assert a["ratelimit"] == b["ratelimit"] == 150
+        with pool.register({}) as c:
+            assert a["ratelimit"] == b["ratelimit"] == c["ratelimit"] == 100
+        # 終わったダウンロードの分は残りのダウンロードに配り直す
+        assert a["ratelimit"] == b["ratelimit"] == 150
+
+
+def test_unused_share_of_capped_downloads_is_redistributed():
+    pool = BandwidthPool(limit=300)
+
+    with pool.register({}, cap=50) as capped, pool.register({}) as a:
+        with pool.register({}) as b:
+            assert capped["ratelimit"] == 50
+            assert a["ratelimit"] == b["ratelimit"] == 125
+        assert a["ratelimit"] == 250
+
+
+def test_without_limit_only_caps_apply():
+    pool = BandwidthPool()
+
+    with pool.register({}, cap=50) as capped, pool.register({}) as a:
+        assert capped["ratelimit"] == 50
+        assert a["ratelimit"] is None
+
+
+def test_identical_options_are_unregistered_separately():
+    pool = BandwidthPool(limit=100)
+
+    with pool.register({}) as a:
+        with pool.register({}):
+            assert a["ratelimit"] == 50
+        assert a["ratelimit"] == 100
+
+
+def test_shared_limit_follows_the_share():
+    pool = BandwidthPool(limit=300)
+    share = {"value": 0.5}
+    pool.share_with(lambda: share["value"], interval=0.01)
+
+    with pool.register({}) as a:
+        assert a["ratelimit"] == 150
+        # 他のプロセスのダウンロードが増えると、このプロセスの割合が減る
+        share["value"] = 0.25
+        deadline = time.monotonic() + 5
+        while a["ratelimit"] != 75 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert a["ratelimit"] == pytest.approx(75)
@@ -0,0 +1,113 @@
+import pytest
+
+from src.yt_interactive_downloader.backend import VideoIndex
+
+
+def video(videoId: str, title: str, duration: str, description: str = "") -> dict:
+    return {
+        "kind": "youtube#video",
+        "id": videoId,
+        "snippet": {
+            "title": title,
+            "description": description,
+            "channelId": "UC1",
+            "channelTitle": "channel",
+            "publishedAt": f"2024-01-0{len(videoId)}T00:00:00Z",
+        },
+        "contentDetails": {"duration": duration, "caption": "false"},
+    }
+
+
+def ids(items: list[dict]) -> list[str]:
+    return [item["id"]["videoId"] for item in items]
+
+
+@pytest.fixture
+def index() -> VideoIndex:
+    index = VideoIndex()
+    index.add(
+        [
+            video("a", "lofi hip hop radio", "PT1H", "beats to relax to"),
+            video("bb", "lofi jazz", "PT3M"),
+            video("ccc", "jazz piano", "PT10M", "lofi mix"),
+            video("dddd", "rock", "PT2M30S"),
+        ]
+    )
+    return index
+
+
+def test_short_terms_are_matched_with_like():
+    matches, likes = VideoIndex._match('lofi hi "quoted"', "description")
+
+    assert matches == ['description : "lofi"', 'description : """quoted"""']
+    assert likes == ["hi"]
+
+
+def test_search_combines_fts_and_like_terms(index: VideoIndex):
+    items, total = index.search("lofi hi")
+
+    assert total == 1
+    assert ids(items) == ["a"]
+    # 引用符を含む語も FTS5 の構文エラーにならない
+    assert index.search('"lofi') == ([], 0)
+
+
+def test_description_terms_only_match_the_description(index: VideoIndex):
+    items, total = index.search(description="lofi")
+
+    assert total == 1
+    assert ids(items) == ["ccc"]
+
+
+def test_within_and_depth_are_bound_before_other_params(index: VideoIndex):
+    index.record(
+        "jazz",
+        {"q": "jazz"},
+        {
+            "items": [
+                video("ccc", "jazz piano", "PT10M"),
+                video("bb", "lofi jazz", "PT3M"),
+            ],
+            "pageInfo": {"totalResults": 2},
+        },
+    )
+
+    # within と depth の値は JOIN の位置に、語と再生時間の値は WHERE の位置に入る
+    items, total = index.search("ja", within="jazz", depth=1, minDuration=60)
+    assert ids(items) == ["ccc"] and total == 1
+
+    items, total = index.search("ja", within="jazz", minDuration=60)
+    assert ids(items) == ["ccc", "bb"] and total == 2
+    assert index.search("lofi", within="jazz", depth=1, maxDuration=300) == ([], 0)
+
+
+def test_duration_filters_and_orders(index: VideoIndex):
+    items, total = index.search(minDuration=151, maxDuration=600, order="duration")
+
+    assert ids(items) == ["ccc", "bb"]
+    assert total == 2
+    items, _ = index.search(order="-duration")
+    assert ids(items) == ["dddd", "bb", "ccc", "a"]
+    with pytest.raises(ValueError):
+        index.search(order="duration; DROP TABLE videos")
+
+
+def test_coverage_tracks_recorded_pages(index: VideoIndex):
+    assert index.coverage("lofi") is None
+
+    index.record(
+        "lofi",
+        {"q": "lofi"},
+        {"items": [video("a", "lofi hip hop radio", "PT1H")], "nextPageToken": "1"},
+    )
+    assert index.coverage("lofi") == {
+        "fetched": 1,
+        "complete": False,
+        "nextPageToken": "1",
+        "totalResults": None,
+    }
+
+    index.record("lofi", {"q": "lofi"}, {"items": [video("bb", "lofi jazz", "PT3M")]})
+    assert index.coverage("lofi")["fetched"] == 2
+    assert index.coverage("lofi")["complete"]
+    assert ids(index.search(within="lofi")[0]) == ["a", "bb"]
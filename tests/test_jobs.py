@@ -0,0 +1,180 @@
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import pytest
+
+from src.yt_interactive_downloader.backend import Job, JobQueue, jobs
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def status(queue: JobQueue, job_id: str) -> str | None:
+    job = queue.get(job_id)
+    return None if job is None else job.status
+
+
+def echo(job: Job, videoId: str, **params: Any) -> dict[str, Any]:
+    job.update(progress=100)
+    return {"videoId": videoId, **params}
+
+
+def fail(job: Job, videoId: str) -> None:
+    raise RuntimeError(f"cannot download {videoId}")
+
+
+def wait_for_cancel(job: Job, videoId: str) -> None:
+    while True:
+        job.check_cancelled()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def queue() -> Iterator[JobQueue]:
+    queue = JobQueue(max_workers=4, event_interval=0)
+    yield queue
+    queue.shutdown(wait=True, interrupt=True)
+
+
+def test_job_runs_and_keeps_result(queue: JobQueue):
+    job = queue.submit(echo, "abc", profile="mp4")
+
+    wait_until(lambda: status(queue, job.id) == "finished")
+    finished = queue.get(job.id)
+    assert finished is not None
+    assert finished.result == {"videoId": "abc", "profile": "mp4"}
+    assert finished.progress == 100
+
+
+def test_failed_job_keeps_error(queue: JobQueue):
+    job = queue.submit(fail, "abc")
+
+    wait_until(lambda: status(queue, job.id) == "failed")
+    failed = queue.get(job.id)
+    assert failed is not None
+    assert "cannot download abc" in (failed.error or "")
+
+
+def test_key_deduplicates_pending_jobs(queue: JobQueue):
+    first = queue.submit(wait_for_cancel, "abc", key="local:.:mp4:abc")
+    second = queue.submit(wait_for_cancel, "abc", key="local:.:mp4:abc")
+
+    assert second.id == first.id
+    queue.cancel(first.id)
+    wait_until(lambda: status(queue, first.id) == "cancelled")
+
+
+def test_running_job_can_be_cancelled(queue: JobQueue):
+    job = queue.submit(wait_for_cancel, "abc")
+    wait_until(lambda: status(queue, job.id) == "running")
+
+    queue.cancel(job.id)
+
+    wait_until(lambda: status(queue, job.id) == "cancelled")
+
+
+def test_batch_respects_concurrency(queue: JobQueue):
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def download(job: Job, videoId: str) -> None:
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    batch = queue.submit_batch(download, [f"video{i}" for i in range(8)], concurrency=2)
+
+    wait_until(lambda: queue.counts()["finished"] == 8)
+    assert all(job.status == "finished" for job in batch.jobs())
+    assert peak == 2
+
+
+def test_batch_rejects_non_positive_concurrency(queue: JobQueue):
+    with pytest.raises(ValueError):
+        queue.submit_batch(echo, ["abc"], concurrency=0)
+
+
+def test_jobs_are_shared_through_the_store(tmp_path: Path):
+    # ワーカーを持たないキューに登録したジョブを、同じストアを開いた別のキューが実行する
+    producer = JobQueue(tmp_path / "jobs.sqlite3", max_workers=0)
+    consumer = JobQueue(tmp_path / "jobs.sqlite3", max_workers=1, event_interval=0)
+    consumer.register(echo)
+    try:
+        job = producer.submit(echo, "abc")
+
+        wait_until(lambda: status(producer, job.id) == "finished")
+        finished = producer.get(job.id)
+        assert finished is not None
+        assert finished.result == {"videoId": "abc"}
+    finally:
+        consumer.shutdown()
+        producer.shutdown()
+
+
+def test_finished_jobs_are_pruned(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(jobs, "PRUNE_INTERVAL", 0)
+    queue = JobQueue(max_workers=2, event_interval=0.01, retention=0)
+    try:
+        job = queue.submit(echo, "abc")
+        batch = queue.submit_batch(echo, ["def", "ghi"])
+
+        wait_until(lambda: not queue.jobs() and not queue.batches())
+        assert queue.get(job.id) is None
+        assert queue.batch(batch.id) is None
+    finally:
+        queue.shutdown()
+
+
+def test_speed_sums_running_jobs(queue: JobQueue):
+    def report_speed(job: Job, videoId: str) -> None:
+        job.update(speed=1000)
+        wait_for_cancel(job, videoId)
+
+    first = queue.submit(report_speed, "abc")
+    second = queue.submit(report_speed, "def")
+    finished = queue.submit(echo, "ghi")
+
+    wait_until(
+        lambda: queue.speed() == 2000 and status(queue, finished.id) == "finished"
+    )
+    assert queue.running_share() == 1.0
+    queue.cancel(first.id)
+    queue.cancel(second.id)
+
+
+def registered_tasks(queue: JobQueue) -> int:
+    return len(queue._JobQueue__tasks)  # type: ignore[attr-defined]
+
+
+def test_one_off_tasks_are_released(queue: JobQueue):
+    # 名前が重なるラムダは最初の 1 つ以外このプロセスだけのタスクになり、ジョブが終われば登録から外れる
+    submitted = [queue.submit(lambda job, videoId: None, f"v{i}") for i in range(5)]
+
+    wait_until(
+        lambda: queue.counts()["finished"] == len(submitted)
+        and registered_tasks(queue) == 1
+    )
+
+
+def test_cancelled_one_off_tasks_are_released():
+    queue = JobQueue(max_workers=0)
+    try:
+        submitted = [queue.submit(lambda job, videoId: None, f"v{i}") for i in range(5)]
+        for job in submitted:
+            queue.cancel(job.id)
+
+        assert registered_tasks(queue) == 1
+    finally:
+        queue.shutdown()
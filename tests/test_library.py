@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from src.yt_interactive_downloader.backend import Library
+
+
+def result(location: str, path: str, name: str, size: int) -> dict:
+    return {
+        "location": location,
+        "path": path,
+        "name": name,
+        "size": size,
+        "sha256": "0" * 64,
+    }
+
+
+def test_local_copy_is_found_until_it_is_removed(tmp_path: Path):
+    library = Library()
+    file = tmp_path / "abc.mp4"
+    file.write_bytes(b"video")
+    library.add("abc", "mp4", result("local", str(tmp_path), "abc.mp4", 5))
+
+    assert library.find("abc", "mp4", "local", str(tmp_path)) is not None
+    file.write_bytes(b"truncated video")
+    assert library.find("abc", "mp4", "local", str(tmp_path)) is None
+    # 記録も削除される
+    file.write_bytes(b"video")
+    assert library.find("abc", "mp4", "local", str(tmp_path)) is None
+
+
+def test_remote_copy_is_checked_on_the_server(ssh_home: Path):
+    library = Library()
+    (ssh_home / "videos").mkdir()
+    (ssh_home / "videos" / "abc.mp4").write_bytes(b"video")
+    library.add("abc", "mp4", result("example.com", "videos", "abc.mp4", 5))
+
+    assert library.find("abc", "mp4", "example.com", "videos") is not None
+    (ssh_home / "videos" / "abc.mp4").unlink()
+    assert library.find("abc", "mp4", "example.com", "videos") is None
+    assert library.downloaded(["abc"]) == set()
+
+
+def test_unreachable_server_keeps_the_record(ssh_home: Path):
+    library = Library()
+    library.add("abc", "mp4", result("unreachable", "videos", "abc.mp4", 5))
+
+    assert library.find("abc", "mp4", "unreachable", "videos") is not None
+    assert library.downloaded(["abc"]) == {"abc"}
@@ -0,0 +1,83 @@
+import time
+from pathlib import Path
+
+from src.yt_interactive_downloader.backend.metrics import Registry
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("status",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+
+    requests.inc(status="200")
+    requests.inc(2, status="200")
+    latency.observe(0.5)
+
+    text = registry.render()
+    assert 'requests_total{status="200"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{le="1"} 1' in text
+    assert "latency_seconds_count 1" in text
+
+
+def test_shared_counters_are_summed_over_processes(tmp_path: Path):
+    # 同じファイルを共有するレジストリを、別々のワーカープロセスに見立てる
+    first, second = Registry(), Registry()
+    counters = [
+        registry.counter("requests_total", "Requests", ("status",))
+        for registry in (first, second)
+    ]
+    gauges = [registry.gauge("running", "Running") for registry in (first, second)]
+    first.share(tmp_path / "metrics.sqlite3")
+    second.share(tmp_path / "metrics.sqlite3")
+    try:
+        counters[0].inc(status="200")
+        counters[1].inc(2, status="200")
+        counters[1].inc(status="500")
+        gauges[0].set(1)
+        gauges[1].set(5)
+        second.render()
+
+        text = first.render()
+        assert 'requests_total{status="200"} 3' in text
+        assert 'requests_total{status="500"} 1' in text
+        assert "running 1" in text
+    finally:
+        first.unshare()
+        second.unshare()
+
+    # 終了したプロセスの値は合計から外れる
+    third = Registry()
+    third.counter("requests_total", "Requests", ("status",))
+    third.share(tmp_path / "metrics.sqlite3")
+    try:
+        assert "requests_total{" not in third.render()
+    finally:
+        third.unshare()
+
+
+def test_stale_processes_are_pruned(tmp_path: Path):
+    live, crashed = Registry(), Registry()
+    for registry in (live, crashed):
+        registry.counter("requests_total", "Requests").inc()
+    live.share(tmp_path / "metrics.sqlite3", stale_after=0.2)
+    crashed.share(tmp_path / "metrics.sqlite3")
+    # 落ちたプロセスに見立て、この後は interval が過ぎるまで書き込まない
+    crashed.render()
+    try:
+        assert "requests_total 2" in live.render()
+        time.sleep(0.3)
+        live._Registry__store.prune(time.time() - 0.2)  # type: ignore[attr-defined]
+
+        assert "requests_total 1" in live.render()
+    finally:
+        live.unshare()
+        crashed.unshare()
+
+
+def test_gauge_values_are_available_through_the_registry():
+    registry = Registry()
+    gauge = registry.gauge("running", "Running")
+    gauge.set_function(lambda: 3)
+
+    assert registry.values(gauge) == {(): [3.0]}
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.mock_api import MockYouTubeAPI
+from src.yt_interactive_downloader.backend import (
+    QuotaExceededError,
+    RateLimiter,
+    YouTube,
+)
+
+
+def test_quota_is_consumed_per_endpoint():
+    limiter = RateLimiter(daily_quota=1000)
+
+    limiter.acquire("search")
+    limiter.acquire("videos")
+    limiter.acquire("videos")
+
+    stats = limiter.stats()
+    assert stats["used"] == 102
+    assert stats["usedByEndpoint"] == {"search": 100, "videos": 2}
+    assert limiter.remaining() == 898
+
+
+def test_exhausted_quota_raises():
+    limiter = RateLimiter(daily_quota=150)
+    limiter.acquire("search")
+
+    with pytest.raises(QuotaExceededError):
+        limiter.acquire("search")
+    # 残りのクォータで足りるリクエストは送れる
+    limiter.acquire("videos")
+
+
+def test_quota_is_shared_through_the_store(tmp_path: Path):
+    first = RateLimiter(daily_quota=250, path=tmp_path / "quota.sqlite3")
+    second = RateLimiter(daily_quota=250, path=tmp_path / "quota.sqlite3")
+
+    first.acquire("search")
+    second.acquire("search")
+
+    assert first.remaining() == second.remaining() == 50
+    with pytest.raises(QuotaExceededError):
+        first.acquire("search")
+
+
+def test_client_stops_before_the_budget_is_exceeded(
+    youtube: YouTube, api: MockYouTubeAPI
+):
+    youtube.rate_limiter = RateLimiter(daily_quota=250)
+
+    res, status_code = youtube.search(q="lofi", maxResults=-1)
+
+    assert status_code == 403
+    assert res["error"]["errors"][0]["reason"] == "quotaExceeded"
+    assert api.requests == {"search": 2}
+
+
+def test_api_quota_errors_are_not_retried(youtube: YouTube, api: MockYouTubeAPI):
+    api.daily_quota = 100
+
+    youtube.search(q="lofi", maxResults=50)
+    res, status_code = youtube.search(q="jazz", maxResults=50)
+
+    assert status_code == 403
+    assert res["error"]["errors"][0]["reason"] == "quotaExceeded"
+    assert api.requests == {"search": 2}
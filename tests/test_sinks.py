@@ -0,0 +1,75 @@
+import hashlib
+import time
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from src.yt_interactive_downloader.backend.sinks import LocalSink, SSHSink
+
+
+def chunks(count: int = 3) -> Iterator[bytes]:
+    for i in range(count):
+        yield f"chunk {i}\n".encode()
+
+
+def test_local_sink_writes_atomically(tmp_path: Path):
+    sink = LocalSink(tmp_path / "videos")
+
+    size, digest = sink.write("abc.mp4", chunks())
+
+    data = (tmp_path / "videos" / "abc.mp4").read_bytes()
+    assert (size, digest) == (len(data), hashlib.sha256(data).hexdigest())
+    assert sink.exists("abc.mp4")
+    assert not (tmp_path / "videos" / "abc.mp4.part").exists()
+
+
+def test_local_sink_removes_partial_file_on_error(tmp_path: Path):
+    def failing() -> Iterator[bytes]:
+        yield b"partial"
+        raise RuntimeError("download failed")
+
+    sink = LocalSink(tmp_path)
+    with pytest.raises(RuntimeError, match="download failed"):
+        sink.write("abc.mp4", failing())
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("server", ["", "-oProxyCommand=sh", "host name", "a\tb"])
+def test_ssh_sink_rejects_invalid_destinations(server: str):
+    with pytest.raises(ValueError):
+        SSHSink(server, "videos")
+
+
+def test_ssh_sink_uploads_and_verifies(ssh_home: Path):
+    sink = SSHSink("example.com", "~/videos")
+
+    size, digest = sink.write("abc.mp4", chunks())
+
+    data = (ssh_home / "videos" / "abc.mp4").read_bytes()
+    assert (size, digest) == (len(data), hashlib.sha256(data).hexdigest())
+    assert sink.exists("abc.mp4")
+    assert not sink.exists("def.mp4")
+    assert not (ssh_home / "videos" / "abc.mp4.part").exists()
+
+
+def test_ssh_sink_quotes_remote_paths(ssh_home: Path):
+    sink = SSHSink("example.com", "my videos; touch injected")
+
+    sink.write("a'b.mp4", chunks())
+
+    assert (ssh_home / "my videos; touch injected" / "a'b.mp4").is_file()
+    assert not (ssh_home / "injected").exists()
+
+
+def test_ssh_sink_keeps_the_original_error(ssh_home: Path):
+    def failing() -> Iterator[bytes]:
+        yield b"partial"
+        # ssh が先に終了し、バッファに残ったデータを書き込めなくなる
+        time.sleep(0.2)
+        raise RuntimeError("download failed")
+
+    sink = SSHSink("unreachable", "videos")
+    with pytest.raises(RuntimeError, match="download failed"):
+        sink.write("abc.mp4", failing())
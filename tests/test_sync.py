@@ -0,0 +1,81 @@
+import pytest
+
+from benchmarks.mock_api import MockYouTubeAPI
+from src.yt_interactive_downloader.backend import (
+    PlaylistSync,
+    YouTube,
+    YouTubeAPIError,
+    video_id_of,
+)
+
+
+def test_first_sync_fetches_all_pages(youtube: YouTube, api: MockYouTubeAPI):
+    sync = PlaylistSync(youtube)
+
+    result = sync.sync("PL1")
+
+    assert result["complete"] and not result["resumed"]
+    assert result["pages"] == 5
+    assert len({video_id_of(item) for item in result["new"]}) == 230
+    assert sync.state("PL1")["items"] == 230
+    assert sync.state("PL1")["checkpoint"] is None
+
+
+def test_unchanged_playlist_stops_at_the_first_page(
+    youtube: YouTube, api: MockYouTubeAPI
+):
+    sync = PlaylistSync(youtube)
+    sync.sync("PL1")
+
+    result = sync.sync("PL1")
+
+    # ETag が一致して 304 が返るので、先頭のページだけで終わる
+    assert result["new"] == []
+    assert result["pages"] == 1
+    assert result["notModified"] == 1
+    assert result["complete"]
+    assert api.requests["playlistItems"] == 6
+
+
+def test_interrupted_sync_resumes_from_the_checkpoint(
+    youtube: YouTube, api: MockYouTubeAPI
+):
+    sync = PlaylistSync(youtube)
+
+    first = sync.sync("PL1", max_pages=2)
+
+    assert not first["complete"]
+    assert len(first["new"]) == 100
+    assert sync.state("PL1")["checkpoint"] == "100"
+
+    second = sync.sync("PL1")
+
+    # 既知のアイテムで止まらず、チェックポイントから最後のページまで取得する
+    assert second["resumed"] and second["complete"]
+    assert second["pages"] == 3
+    assert len(second["new"]) == 130
+    assert sync.state("PL1")["items"] == 230
+    assert sync.state("PL1")["checkpoint"] is None
+
+
+def test_full_sync_revalidates_every_page(youtube: YouTube, api: MockYouTubeAPI):
+    sync = PlaylistSync(youtube)
+    sync.sync("PL1")
+
+    result = sync.sync("PL1", full=True)
+
+    assert result["new"] == []
+    assert result["pages"] == result["notModified"] == 5
+    assert result["complete"]
+
+
+def test_errors_keep_the_checkpoint(youtube: YouTube, api: MockYouTubeAPI):
+    sync = PlaylistSync(youtube)
+    sync.sync("PL1", max_pages=1)
+    api.error_rate = 1.0
+
+    with pytest.raises(YouTubeAPIError):
+        sync.sync("PL1")
+
+    assert sync.state("PL1")["checkpoint"] == "50"
+    assert sync.state("PL1")["items"] == 50
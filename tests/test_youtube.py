@@ -0,0 +1,127 @@
+from benchmarks.mock_api import MockYouTubeAPI
+from src.yt_interactive_downloader.backend import (
+    ResponseCache,
+    YouTube,
+    YouTubeAPIError,
+    video_id_of,
+)
+
+
+def test_search_fetches_only_requested_pages(youtube: YouTube, api: MockYouTubeAPI):
+    res, status_code = youtube.search(q="lofi", maxResults=100)
+
+    assert status_code == 200
+    assert len(res["items"]) == 100
+    assert api.requests == {"search": 2}
+
+
+def test_search_fetches_all_pages(youtube: YouTube, api: MockYouTubeAPI):
+    res, status_code = youtube.search(q="lofi", maxResults=-1)
+
+    assert status_code == 200
+    assert len(res["items"]) == 230
+    assert len(set(map(video_id_of, res["items"]))) == 230
+    assert api.requests == {"search": 5}
+
+
+def test_pages_stop_at_error(youtube: YouTube, api: MockYouTubeAPI):
+    api.error_rate = 1.0
+
+    pages = list(youtube.search_pages(q="lofi", maxResults=-1))
+
+    assert len(pages) == 1
+    assert pages[0][1] >= 500
+
+
+def test_transient_errors_are_retried(youtube: YouTube, api: MockYouTubeAPI):
+    api.error_rate = 0.3
+
+    res, status_code = youtube.search(q="lofi", maxResults=-1)
+
+    assert status_code == 200
+    assert len(res["items"]) == 230
+    assert api.errors > 0
+    assert api.requests["search"] == 5 + api.errors
+
+
+def test_retries_give_up_after_max_retries(youtube: YouTube, api: MockYouTubeAPI):
+    api.error_rate = 1.0
+
+    res, status_code = youtube.search(q="lofi", maxResults=50)
+
+    assert status_code >= 500
+    assert "error" in res
+    assert api.requests == {"search": youtube.max_retries + 1}
+
+
+def test_iter_search_raises_api_errors(youtube: YouTube, api: MockYouTubeAPI):
+    api.error_rate = 1.0
+
+    try:
+        list(youtube.iter_search(q="lofi", maxResults=50))
+    except YouTubeAPIError as e:
+        assert e.status_code >= 500
+    else:
+        raise AssertionError("YouTubeAPIError was not raised")
+
+
+def test_cache_serves_repeated_requests(youtube: YouTube, api: MockYouTubeAPI):
+    youtube.cache = ResponseCache()
+
+    first, _ = youtube.search(q="lofi", maxResults=100)
+    second, _ = youtube.search(q="lofi", maxResults=100)
+
+    assert second["items"] == first["items"]
+    assert api.requests == {"search": 2}
+    assert youtube.cache.stats()["hits"] == 2
+
+
+def test_cache_ignores_api_key():
+    params = {"q": "lofi", "maxResults": 50, "pageToken": None}
+
+    assert ResponseCache.make_key(
+        "search", {**params, "key": "a"}
+    ) == ResponseCache.make_key("search", {"q": "lofi", "maxResults": 50, "key": "b"})
+
+
+def test_cache_expires_entries(youtube: YouTube, api: MockYouTubeAPI):
+    youtube.cache = ResponseCache(ttl=-1)
+
+    youtube.search(q="lofi", maxResults=50)
+    youtube.search(q="lofi", maxResults=50)
+
+    assert api.requests == {"search": 2}
+
+
+def test_enrich_requests_50_videos_at_a_time(youtube: YouTube, api: MockYouTubeAPI):
+    items = youtube.search(q="lofi", maxResults=-1)[0]["items"]
+
+    youtube.enrich(items)
+
+    assert api.requests["videos"] == 5
+    assert all("duration" in item["contentDetails"] for item in items)
+    assert all("viewCount" in item["statistics"] for item in items)
+
+
+def test_enrich_keeps_playlist_item_details(youtube: YouTube, api: MockYouTubeAPI):
+    items = youtube.fetch_playlist_items(
+        part="snippet,contentDetails", playlistId="PL1", maxResults=5
+    )[0]["items"]
+
+    youtube.enrich(items)
+
+    for item in items:
+        assert item["contentDetails"]["videoId"] == video_id_of(item)
+        assert "videoPublishedAt" in item["contentDetails"]
+        assert "duration" in item["contentDetails"]
+
+
+def test_fetch_many_deduplicates_projected_items(youtube: YouTube):
+    result = youtube.fetch_many(
+        queries=["lofi", "lofi"],
+        fields=["snippet.title"],
+        search_params={"maxResults": 100},
+    )
+
+    assert len(result["items"]) == 100
+    assert [source["count"] for source in result["sources"]] == [100, 100]